@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import logging
+import hashlib
+import tempfile
+from datetime import datetime
+from flask import current_app
+
+# Reader for the file-based activity log written before activity moved into the ActivityLog table.
+# Segments are activity.log (newest) then activity.log.1, activity.log.2, ... as left by log rotation.
+
+BLOCK_SIZE = 64 * 1024
+# Bytes between checkpoints in the sidecar index
+INDEX_STRIDE = 256 * 1024
+
+_LINE = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (.*)$')
+
+def _log_dir():
+    return os.path.join(current_app.root_path, 'logs')
+
+def _index_path():
+    return os.path.join(_log_dir(), 'activity.log.idx')
+
+def log_segments():
+    """Existing log segment file names, newest first."""
+    folder = _log_dir()
+    if not os.path.isdir(folder):
+        return []
+    rotated = []
+    for name in os.listdir(folder):
+        match = re.match(r'^activity\.log\.(\d+)$', name)
+        if match:
+            rotated.append((int(match.group(1)), name))
+    names = [name for _, name in sorted(rotated)]
+    if os.path.exists(os.path.join(folder, 'activity.log')):
+        names.insert(0, 'activity.log')
+    return names
+
+STAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _parse(line):
+    """Split a line into its timestamp text and message; the text sorts the same as the time it names."""
+    match = _LINE.match(line)
+    if not match:
+        return None, line
+    return match.group(1), match.group(2)
+
+def _to_datetime(stamp):
+    try:
+        return datetime.strptime(stamp, STAMP_FORMAT) if stamp else None
+    except ValueError:
+        return None
+
+def _lines_before(f, end, needle=None):
+    """Yield (start offset, line bytes) for the lines ending before `end`, newest first, one block at a time.
+
+    With a lowercase needle, blocks that cannot contain it are skipped without being split into lines.
+    """
+    pos = end
+    carry = b''
+    while pos > 0:
+        size = min(BLOCK_SIZE, pos)
+        pos -= size
+        f.seek(pos)
+        chunk = f.read(size) + carry
+        if needle and needle not in chunk.lower():
+            # Only the leading partial line can still match, together with the block before it
+            newline = chunk.find(b'\n')
+            carry = chunk if newline == -1 else chunk[:newline]
+            continue
+        parts = chunk.split(b'\n')
+        # The first part may continue in the previous block, so it is carried over
+        carry = parts[0]
+        offset = pos + len(carry) + 1
+        lines = []
+        for part in parts[1:]:
+            lines.append((offset, part))
+            offset += len(part) + 1
+        for start, line in reversed(lines):
+            if line.strip():
+                yield start, line
+    if carry.strip():
+        yield 0, carry
+
+def _head_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(256)).hexdigest()
+
+def _index_segment(path, entry):
+    """Extend a segment's checkpoint list from where the last indexing pass stopped."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(entry['indexed'])
+        offset = entry['indexed']
+        next_checkpoint = entry['checkpoints'][-1][0] + INDEX_STRIDE if entry['checkpoints'] else 0
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break  # a line still being written is indexed next time
+            if offset >= next_checkpoint:
+                stamp, _ = _parse(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+                if stamp:
+                    entry['checkpoints'].append([offset, stamp])
+                    next_checkpoint = offset + INDEX_STRIDE
+            offset += len(raw)
+    entry['indexed'] = offset
+    entry['size'] = size
+    return entry
+
+def _valid_entry(entry):
+    return (isinstance(entry, dict) and isinstance(entry.get('head'), str)
+            and all(isinstance(entry.get(key), int) for key in ('size', 'indexed'))
+            and isinstance(entry.get('checkpoints'), list)
+            and all(isinstance(checkpoint, list) and len(checkpoint) == 2 for checkpoint in entry['checkpoints']))
+
+def load_index():
+    """The sidecar offset index, refreshed for segments that were appended, rotated or replaced."""
+    try:
+        with open(_index_path()) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    # A damaged index is rebuilt from the segments: unusable entries are dropped and reindexed
+    if not isinstance(index, dict):
+        index = {}
+    index = {name: entry for name, entry in index.items() if _valid_entry(entry)}
+
+    refreshed = {}
+    changed = False
+    for name in log_segments():
+        path = os.path.join(_log_dir(), name)
+        size = os.path.getsize(path)
+        head = _head_digest(path)
+        entry = index.get(name)
+        if not entry or entry.get('head') != head or entry.get('size', 0) > size:
+            # After rotation the same file shows up under the next name; reuse its checkpoints
+            entry = next((old for old in index.values() if old.get('head') == head and old.get('size', 0) <= size),
+                         {'head': head, 'size': 0, 'indexed': 0, 'checkpoints': []})
+        if entry['size'] != size:
+            entry = _index_segment(path, entry)
+            changed = True
+        refreshed[name] = entry
+
+    if changed or set(refreshed) != set(index):
+        # A unique temp file per writer, as threads of one worker may refresh the index at once
+        fd, temp_path = tempfile.mkstemp(dir=_log_dir(), prefix='activity.log.idx.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(refreshed, f)
+            os.replace(temp_path, _index_path())
+        except OSError as e:
+            # The index only speeds up reads; the next call tries again
+            logging.error(f"Failed to save activity log index: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return refreshed
+
+def _start_offset(entry, size, date_to):
+    """Offset to start reading backward from so that lines after date_to are skipped."""
+    if date_to:
+        for offset, stamp in entry['checkpoints']:
+            if stamp >= date_to:
+                return offset
+    return size
+
+def encode_position(segment, offset):
+    return f'{segment}:{offset}'
+
+def decode_position(token):
+    try:
+        segment, offset = token.split(':')
+        return int(segment), int(offset)
+    except (AttributeError, ValueError):
+        return None
+
+def read_activities(limit=50, cursor=None, date_from=None, date_to=None, user=None, search=None):
+    """Read file-log activities newest first, returning (entries, next cursor).
+
+    date_to is exclusive. The reader seeks backward from the end of each segment
+    (or from the sidecar checkpoint just past date_to) and never holds more than
+    one block plus the requested page in memory.
+    """
+    segments = log_segments()
+    index = load_index() if segments else {}
+    position = decode_position(cursor) if cursor else None
+    first_segment = position[0] if position else 0
+    search = search.lower() if search else None
+    date_from = date_from.strftime(STAMP_FORMAT) if date_from else None
+    date_to = date_to.strftime(STAMP_FORMAT) if date_to else None
+
+    entries = []
+    for segment in range(first_segment, len(segments)):
+        name = segments[segment]
+        path = os.path.join(_log_dir(), name)
+        if position and segment == first_segment:
+            end = position[1]
+        else:
+            end = _start_offset(index[name], os.path.getsize(path), date_to)
+
+        with open(path, 'rb') as f:
+            # bytes.lower() only folds ASCII, so the block check is limited to ASCII search text
+            for start, raw in _lines_before(f, end, search.encode('ascii') if search and search.isascii() else None):
+                line = raw.decode('utf-8', errors='replace').rstrip('\r')
+                if search and search not in line.lower():
+                    continue
+                stamp, message = _parse(line)
+                if stamp and date_to and stamp >= date_to:
+                    continue
+                if stamp and date_from and stamp < date_from:
+                    # Segments are chronological, so everything further back is older too
+                    return entries, None
+                if user and not message.startswith(user + ' '):
+                    continue
+                if len(entries) == limit:
+                    return entries, encode_position(entries[-1]['segment'], entries[-1]['offset'])
+                entries.append({'timestamp': _to_datetime(stamp), 'details': message, 'segment': segment, 'offset': start})
+    return entries, None
@@ -1,67 +1,113 @@
 import logging
 import os
+import queue
+import atexit
+import threading
 from datetime import datetime
-from flask import request, current_app
+from flask import request, current_app, has_request_context
 from flask_login import current_user, login_required
-from app import db
+from app import app, db
 from models import ActivityLog, Loan, Contribution, Fine, Announcement, User, WelfareContribution
 import json
 from werkzeug.utils import secure_filename
 
-# Configure activity logger
-# activity_logger = logging.getLogger('activity')
-# handler = logging.FileHandler('activity.log')
-# formatter = logging.Formatter('%(asctime)s - %(message)s')
-# handler.setFormatter(formatter)
-# activity_logger.addHandler(handler)
-# activity_logger.setLevel(logging.INFO)
-
-# Simple file-based activity logger since ActivityLog model doesn't exist
-def log_activity(action, resource_type, resource_id, details):
-    """Log user activity to file."""
-    try:
-        # Create logs directory if it doesn't exist
-        log_dir = os.path.join(current_app.root_path, 'logs')
-        os.makedirs(log_dir, exist_ok=True)
-
-        log_file = os.path.join(log_dir, 'activity.log')
-
-        user_name = current_user.full_name if current_user.is_authenticated else 'System'
-        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+# Events waiting to be written; a full queue drops events rather than blocking requests
+ACTIVITY_QUEUE_SIZE = 10000
+ACTIVITY_BATCH_SIZE = 200
+ACTIVITY_FLUSH_INTERVAL = 1.0
 
-        log_entry = f"[{timestamp}] {user_name} {action} {resource_type} {resource_id}: {details}\n"
-
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(log_entry)
+_activity_queue = queue.Queue(maxsize=ACTIVITY_QUEUE_SIZE)
+_writer_lock = threading.Lock()
+_writer_pid = None
 
+def log_activity(action, resource_type, resource_id, details, user_id=None, **extra):
+    """Queue a user activity for the background ActivityLog writer."""
+    try:
+        if user_id is None and has_request_context() and current_user.is_authenticated:
+            user_id = current_user.id
+        if user_id is None:
+            # ActivityLog rows always belong to a user; system events only go to the application log
+            logging.info(f"Activity (system): {action} {resource_type} {resource_id}: {details}")
+            return
+
+        entity_id = resource_id if isinstance(resource_id, int) else None
+        if entity_id is None and str(resource_id).isdigit():
+            entity_id = int(resource_id)
+        elif entity_id is None and resource_id is not None:
+            extra['resource'] = str(resource_id)
+
+        _activity_queue.put_nowait({
+            'user_id': user_id,
+            'action': str(action)[:100],
+            'entity_type': str(resource_type)[:50],
+            'entity_id': entity_id,
+            'description': str(details),
+            'ip_address': request.remote_addr if has_request_context() else None,
+            'timestamp': datetime.utcnow(),
+            'additional_data': json.dumps(extra, default=str) if extra else None,
+        })
+        _ensure_writer()
+
+    except queue.Full:
+        logging.warning(f"Activity queue full, dropped: {action} {resource_type} {resource_id}")
     except Exception as e:
         print(f"Activity logging failed: {e}")
 
-def get_recent_activities(limit=50):
-    """Get recent activities from file."""
+def _ensure_writer():
+    # Threads do not survive a fork, so each gunicorn worker starts its own writer
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            threading.Thread(target=_write_forever, name='activity-writer', daemon=True).start()
+            _writer_pid = os.getpid()
+
+def _next_batch(timeout):
     try:
-        log_file = os.path.join(current_app.root_path, 'logs', 'activity.log')
-
-        if not os.path.exists(log_file):
-            return []
-
-        activities = []
-        with open(log_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-
-        # Get last 'limit' lines
-        recent_lines = lines[-limit:] if len(lines) >= limit else lines
-        recent_lines.reverse()  # Most recent first
-
-        for line in recent_lines:
-            if line.strip():
-                activities.append({
-                    'timestamp': line[:20],  # Extract timestamp
-                    'details': line[21:].strip()  # Extract details
-                })
-
-        return activities
+        batch = [_activity_queue.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while len(batch) < ACTIVITY_BATCH_SIZE:
+        try:
+            batch.append(_activity_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _write_batch(batch):
+    """Insert a batch of queued events with a single executemany."""
+    with app.app_context():
+        try:
+            db.session.execute(db.insert(ActivityLog), batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to write {len(batch)} activity log entries: {str(e)}")
+
+def _write_forever():
+    while True:
+        batch = _next_batch(ACTIVITY_FLUSH_INTERVAL)
+        if batch:
+            _write_batch(batch)
+
+@atexit.register
+def flush_activity_log():
+    """Write every queued event now, from the calling thread."""
+    while True:
+        batch = _next_batch(0.01)
+        if not batch:
+            break
+        _write_batch(batch)
+
+def activity_query():
+    """Activity log entries with their users loaded, for filtering and paginating."""
+    return ActivityLog.query.options(db.joinedload(ActivityLog.user))
 
+def get_recent_activities(limit=50):
+    """Get the most recent activities."""
+    try:
+        return activity_query().order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(limit).all()
     except Exception as e:
         print(f"Failed to read activity log: {e}")
         return []
@@ -69,16 +115,16 @@ def get_recent_activities(limit=50):
 def clear_activity_log():
     """Clear all activity logs (Admin only)."""
     try:
-        log_file = os.path.join(current_app.root_path, 'logs', 'activity.log')
-
-        if os.path.exists(log_file):
-            os.remove(log_file)
+        flush_activity_log()
+        ActivityLog.query.delete()
+        db.session.commit()
 
         # Log the clearing action
         log_activity('cleared', 'activity_log', 'all', 'Activity log cleared by admin')
         return True
 
     except Exception as e:
+        db.session.rollback()
         print(f"Failed to clear activity log: {e}")
         return False
 
@@ -1,10 +1,12 @@
 import os
 import logging
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 from flask_wtf.csrf import CSRFProtect
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.schema import CreateIndex
 from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
 
@@ -19,12 +21,49 @@ db = SQLAlchemy(model_class=Base)
 # Create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
 # Configure upload folder
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Rendered PDFs: reports keyed by type, parameters and data version; receipts by content hash
+app.config['REPORT_CACHE_DIR'] = os.environ.get('REPORT_CACHE_DIR', os.path.join(app.root_path, 'report_cache'))
+app.config['RECEIPT_CACHE_DIR'] = os.environ.get('RECEIPT_CACHE_DIR', os.path.join(app.root_path, 'receipt_cache'))
+
+# 'background' writes notification fan-out on a worker thread, 'inline' inside the request
+app.config['NOTIFICATION_FANOUT'] = os.environ.get('NOTIFICATION_FANOUT', 'background')
+
+# Debt reminders: 'log', 'stub' or 'http' (posts to WHATSAPP_API_URL), sent concurrently under a rate limit
+app.config['REMINDER_GATEWAY'] = os.environ.get('REMINDER_GATEWAY', 'log')
+app.config['WHATSAPP_API_URL'] = os.environ.get('WHATSAPP_API_URL')
+app.config['WHATSAPP_API_TOKEN'] = os.environ.get('WHATSAPP_API_TOKEN')
+app.config['REMINDER_MAX_WORKERS'] = int(os.environ.get('REMINDER_MAX_WORKERS', 16))
+app.config['REMINDER_RATE_PER_SECOND'] = float(os.environ.get('REMINDER_RATE_PER_SECOND', 50))
+
+# Open /events streams per worker; each holds one of the worker's threads (see procfile), so keep
+# this below the thread count to leave threads for ordinary requests
+app.config['EVENT_STREAMS_PER_WORKER'] = int(os.environ.get('EVENT_STREAMS_PER_WORKER', 8))
+
+# Logged-in users are cached per worker for USER_CACHE_TTL seconds; edits made through another
+# worker reach this one when its copy expires, so the TTL bounds how long a deactivation can lag
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+app.config['USER_CACHE_SIZE'] = 2048
+
+# Member and loan dropdowns longer than this render as a search box backed by /choices/<kind>
+app.config['CHOICES_PICKER_THRESHOLD'] = int(os.environ.get('CHOICES_PICKER_THRESHOLD', 300))
+
+# Largest batch /contributions/import accepts in one post
+app.config['CONTRIBUTION_IMPORT_MAX_ROWS'] = int(os.environ.get('CONTRIBUTION_IMPORT_MAX_ROWS', 2000))
+
+# Login username typeahead: shortest prefix answered, suggestions returned and lookups allowed per client per minute
+app.config['USERNAME_LOOKUP_MIN_PREFIX'] = 2
+app.config['USERNAME_LOOKUP_LIMIT'] = 8
+app.config['USERNAME_LOOKUP_RATE_PER_MINUTE'] = int(os.environ.get('USERNAME_LOOKUP_RATE_PER_MINUTE', 30))
+
+# Each worker polls the ScheduledJob table for due background jobs; set SCHEDULER_ENABLED=0 to leave them to the CLI
+app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///pamoja.db")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
@@ -56,6 +95,24 @@ with app.app_context():
     import models
     db.create_all()
 
+    # create_all() skips new columns on existing tables too
+    from migrate_db import add_missing_columns
+    added_columns = add_missing_columns()
+    if added_columns:
+        logging.info(f"Added columns: {', '.join(added_columns)}")
+    # Keyset pagination cannot reach rows whose sort timestamp is NULL
+    from migrate_db import require_sort_timestamps
+    filled_columns = require_sort_timestamps()
+    if filled_columns:
+        logging.info(f"Filled NULL timestamps in: {', '.join(filled_columns)}")
+
+    # create_all() skips indexes on tables that already exist; IF NOT EXISTS also covers
+    # expression indexes, which the checkfirst lookup cannot see on SQLite
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
     # Create default admin if not exists
     from models import User
     from werkzeug.security import generate_password_hash
@@ -75,6 +132,45 @@ with app.app_context():
         db.session.commit()
         logging.info("Default admin user created")
 
+    # Seed cache version counters so writers only ever need to update them
+    from models import DataVersion
+    for name in DataVersion.tracked:
+        if not db.session.get(DataVersion, name):
+            db.session.add(DataVersion(name=name, version=0))
+    # Seed the receipt sequence so processes only ever reserve from an existing row
+    from models import ReceiptCounter
+    if not db.session.get(ReceiptCounter, 'receipt'):
+        db.session.add(ReceiptCounter(name='receipt', next_value=1))
+    db.session.commit()
+
+    # Seed balance snapshots for databases created before they existed
+    from models import MemberBalance, Contribution
+    if not MemberBalance.query.first() and Contribution.query.first():
+        MemberBalance.rebuild()
+        db.session.commit()
+        logging.info("Member balance snapshots rebuilt")
+
+    # Give loans approved before installment schedules existed a schedule of their own
+    from models import LoanInstallment
+    scheduled = LoanInstallment.backfill()
+    if scheduled:
+        db.session.commit()
+        logging.info(f"Installment schedules built for {scheduled} active loans")
+
+    # Index receipts generated before they carried their owner, type, amount and date
+    from models import DigitalReceipt
+    if DigitalReceipt.query.filter(DigitalReceipt.receipt_type.is_(None)).first():
+        filled = DigitalReceipt.backfill()
+        db.session.commit()
+        logging.info(f"Receipt index backfilled for {filled} receipts")
+
+    # Seed unread notification counters the same way
+    from models import NotificationCounter, Notification
+    if not NotificationCounter.query.first() and Notification.query.first():
+        NotificationCounter.rebuild()
+        db.session.commit()
+        logging.info("Notification counters rebuilt")
+
     # Initialize default badges
     try:
         from routes import initialize_default_badges
@@ -85,8 +181,96 @@ with app.app_context():
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from principals import get_principal
+    principal = get_principal(int(user_id))
+    # Deactivated members are logged out on their next request
+    return principal if principal and principal.is_active else None
+
+@app.cli.command('rebuild-balances')
+def rebuild_balances():
+    """Recompute member balance snapshots from the ledger tables."""
+    from models import MemberBalance
+    count = MemberBalance.rebuild()
+    db.session.commit()
+    print(f"Rebuilt balances for {count} members")
+
+@app.cli.command('rebuild-notification-counters')
+def rebuild_notification_counters():
+    """Recount unread notifications for every user."""
+    from models import NotificationCounter
+    count = NotificationCounter.rebuild()
+    db.session.commit()
+    print(f"Rebuilt unread counters for {count} users")
+
+@app.cli.command('check-notification-counters')
+def check_notification_counters():
+    """Compare unread counters with a recount and fail if any has drifted."""
+    import sys
+    from models import NotificationCounter
+    drift = NotificationCounter.drift()
+    for user_id, (stored, actual) in sorted(drift.items()):
+        print(f"DRIFT user {user_id}: counter {stored}, unread {actual}")
+    if drift:
+        print("Run 'flask --app main rebuild-notification-counters' to repair")
+        sys.exit(1)
+    print("All unread counters match")
+
+@app.cli.command('migrate-money-columns')
+def migrate_money_columns_command():
+    """Convert money columns to exact NUMERIC(14, 2) and round stored amounts to the cent."""
+    from migrate_db import migrate_money_columns
+    changed = migrate_money_columns()
+    print(f"Migrated {len(changed)} money columns" + (f": {', '.join(changed)}" if changed else ''))
+
+@app.cli.command('send-reminders')
+def send_reminders():
+    """Send WhatsApp reminders for due loans and unpaid fines."""
+    from whatsapp_reminders import send_debt_reminders
+    summary = send_debt_reminders()
+    print(f"Reminded {summary['sent']} of {summary['members']} members in {summary['seconds']}s "
+          f"({summary['failed']} failed)")
+
+@app.cli.command('list-jobs')
+def list_jobs():
+    """Show scheduled jobs with their last and next runs."""
+    from scheduler import JOBS, sync_jobs
+    from models import ScheduledJob
+    sync_jobs()
+    for job in ScheduledJob.query.order_by(ScheduledJob.next_run).all():
+        lease = f" [running on {job.lease_owner}]" if job.lease_owner else ''
+        last = f"{job.last_run:%Y-%m-%d %H:%M} {job.last_status}" if job.last_run else 'never'
+        description = JOBS[job.name].description if job.name in JOBS else '(no longer registered)'
+        print(f"{job.name}: next {job.next_run:%Y-%m-%d %H:%M} UTC, last {last}{lease} - {description}")
+
+@app.cli.command('run-job')
+@click.argument('name')
+def run_job_command(name):
+    """Run a scheduled job now, unless another process is already running it."""
+    import sys
+    from scheduler import JOBS, sync_jobs, run_job
+    if name not in JOBS:
+        print(f"Unknown job {name}; choose from {', '.join(sorted(JOBS))}")
+        sys.exit(1)
+    sync_jobs()
+    status, detail = run_job(name, force=True)
+    if status == 'skipped':
+        print(f"{name} is already running in another process")
+    else:
+        print(f"{name} {status}: {detail}")
+    if status != 'success':
+        sys.exit(1)
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Explain the hot-path queries and fail if any of them scans a whole table."""
+    import sys
+    from query_plans import find_full_scans
+    failures = find_full_scans()
+    for description, scans in failures.items():
+        print(f"FULL SCAN {description}: {'; '.join(scans)}")
+    if failures:
+        sys.exit(1)
+    print("All hot queries use indexes")
 
 @app.context_processor
 def utility_processor():
@@ -96,4 +280,7 @@ def utility_processor():
             return json.loads(json_string) if json_string else {}
         except:
             return {}
-    return dict(has_permission=has_permission, format_currency=format_currency, format_date=format_date, format_datetime=format_datetime, datetime=datetime, from_json=from_json)
+    def unread_notification_count():
+        from notifications import unread_count
+        return unread_count(current_user.id) if current_user.is_authenticated else 0
+    return dict(has_permission=has_permission, format_currency=format_currency, format_date=format_date, format_datetime=format_datetime, datetime=datetime, from_json=from_json, unread_notification_count=unread_notification_count)
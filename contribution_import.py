@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from app import app, db
+from models import User, Contribution, DigitalReceipt, MemberBalance, DataVersion, Badge, UserBadge
+from money_events import MoneyEvent, receipt_numbers
+from notifications import notify_roles
+from utils import format_currency
+
+# Column order of an import file or pasted grid; a header row with these names is optional
+IMPORT_COLUMNS = ('member', 'amount', 'type', 'notes')
+CONTRIBUTION_TYPES = ('Regular', 'Special')
+# Largest amount a Money column, NUMERIC(14, 2), can hold
+MAX_AMOUNT = Decimal('999999999999.99')
+
+def parse_rows(text):
+    """Split CSV, or rows pasted from a spreadsheet (tab-separated), into (line number, cells) pairs.
+
+    Blank lines and a leading header row are skipped.
+    """
+    first_line = text.lstrip().split('\n', 1)[0]
+    reader = csv.reader(io.StringIO(text), delimiter='\t' if '\t' in first_line else ',')
+    rows = []
+    for cells in reader:
+        cells = [cell.strip() for cell in cells]
+        if not any(cells):
+            continue
+        if not rows and cells[0].lower() == IMPORT_COLUMNS[0]:
+            continue
+        rows.append((reader.line_num, cells))
+    return rows
+
+def member_lookup():
+    """Active members keyed by id, lower-cased username and lower-cased full name, from one query.
+
+    Full names shared by more than one member are left out, so such rows must use the username or id.
+    """
+    lookup, names = {}, {}
+    for member_id, username, full_name in db.session.execute(
+            db.select(User.id, User.username, User.full_name).where(User.is_active == True)):
+        member = (member_id, full_name)
+        lookup[str(member_id)] = lookup[username.lower()] = member
+        names.setdefault(full_name.lower(), []).append(member)
+    for name, members in names.items():
+        if len(members) == 1:
+            lookup.setdefault(name, members[0])
+    return lookup
+
+def validate_rows(rows, lookup):
+    """Check every row in one pass; returns (entries, errors) where errors are messages naming the line."""
+    types = {contribution_type.lower(): contribution_type for contribution_type in CONTRIBUTION_TYPES}
+    entries, errors = [], []
+    for line_number, cells in rows:
+        member_key, amount_text, contribution_type, notes = (cells + [''] * len(IMPORT_COLUMNS))[:len(IMPORT_COLUMNS)]
+        member = lookup.get(member_key.lower())
+        if member is None:
+            errors.append(f"Line {line_number}: no active member matches '{member_key}'")
+            continue
+        try:
+            amount = Decimal(amount_text.replace(',', ''))
+            # NaN and infinity parse as Decimals but are not amounts
+            if not amount.is_finite():
+                raise InvalidOperation
+            amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        except InvalidOperation:
+            errors.append(f"Line {line_number}: '{amount_text}' is not an amount")
+            continue
+        if amount <= 0:
+            errors.append(f"Line {line_number}: amount must be greater than zero")
+            continue
+        if amount > MAX_AMOUNT:
+            errors.append(f"Line {line_number}: amount cannot exceed {format_currency(MAX_AMOUNT)}")
+            continue
+        if contribution_type and contribution_type.lower() not in types:
+            errors.append(f"Line {line_number}: type must be one of {', '.join(CONTRIBUTION_TYPES)}")
+            continue
+        entries.append({'member_id': member[0], 'full_name': member[1], 'amount': float(amount),
+                        'contribution_type': types.get(contribution_type.lower(), 'Regular'),
+                        'notes': notes or None})
+    if len(entries) + len(errors) > app.config['CONTRIBUTION_IMPORT_MAX_ROWS']:
+        errors.insert(0, f"At most {app.config['CONTRIBUTION_IMPORT_MAX_ROWS']} rows can be imported at once")
+    return entries, errors
+
+def award_consistent_savers(member_ids):
+    """Give the Consistent Saver badge to the members who do not have it yet, in one pass."""
+    badge = Badge.query.filter_by(name="Consistent Saver").first()
+    if not badge:
+        return 0
+    holders = set(db.session.scalars(db.select(UserBadge.member_id)
+                                     .where(UserBadge.badge_id == badge.id, UserBadge.member_id.in_(member_ids))))
+    new_badges = [UserBadge(member_id=member_id, badge_id=badge.id, points_earned=badge.points_value)
+                  for member_id in member_ids if member_id not in holders]
+    if new_badges:
+        db.session.add_all(new_badges)
+        db.session.commit()
+    return len(new_badges)
+
+def import_contributions(entries, recorder):
+    """Record validated entries, with their receipts and balance updates, in one transaction.
+
+    Contributions and receipts are written with bulk inserts; one notification and one activity
+    entry cover the whole batch once it commits. Returns the total amount recorded.
+    """
+    now = datetime.utcnow()
+    # Reserved before anything is written, as for single money events
+    numbers = receipt_numbers.receipt_number_block('contribution', len(entries))
+    event = MoneyEvent()
+
+    contribution_ids = db.session.scalars(
+        db.insert(Contribution).returning(Contribution.id, sort_by_parameter_order=True),
+        [{'member_id': entry['member_id'], 'amount': entry['amount'], 'contribution_type': entry['contribution_type'],
+          'notes': entry['notes'], 'recorded_by': recorder.id, 'date_recorded': now, 'is_deleted': False}
+         for entry in entries]).all()
+
+    receipts = []
+    for entry, contribution_id, receipt_number in zip(entries, contribution_ids, numbers):
+        qr_data = {
+            'receipt_number': receipt_number,
+            'type': 'contribution',
+            'amount': entry['amount'],
+            'member': entry['full_name'],
+            'date': now.isoformat(),
+            'recorded_by': recorder.full_name
+        }
+        receipts.append({'contribution_id': contribution_id, 'receipt_number': receipt_number,
+                         'qr_code_data': json.dumps(qr_data), 'generated_at': now,
+                         'owner_member_id': entry['member_id'], 'receipt_type': 'contribution',
+                         'amount': entry['amount'], 'occurred_at': now})
+    db.session.execute(db.insert(DigitalReceipt), receipts)
+
+    totals = {}
+    for entry in entries:
+        totals[entry['member_id']] = round(totals.get(entry['member_id'], 0.0) + entry['amount'], 2)
+    MemberBalance.add_savings(totals, now)
+
+    # Bulk statements skip the flush listener that normally bumps cache versions
+    connection = db.session.connection()
+    for name, models in DataVersion.tracked.items():
+        if Contribution in models:
+            DataVersion.bump(connection, name)
+
+    total = round(sum(totals.values()), 2)
+    message = f'{recorder.full_name} recorded {len(entries)} contributions totalling {format_currency(total)}'
+    from activity_logger import log_activity
+    event.after_commit(notify_roles, 'Contributions Imported', message, 'payment_recorded',
+                       event=('payment_recorded', {'payment_type': 'Contribution', 'amount': total, 'text': message}))
+    event.after_commit(log_activity, 'imported', 'contribution', None, message)
+    event.in_background(award_consistent_savers, list(totals))
+    event.commit()
+    return total
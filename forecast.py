@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from app import db
+from models import Loan, LoanInstallment, days_between
+
+FORECAST_WEEKS = 12
+# Installments settled within this window set the average repayment delay
+DELAY_HISTORY = timedelta(days=180)
+
+def _open_installments():
+    return (LoanInstallment.is_settled == False, Loan.status == 'Active', Loan.is_deleted == False)
+
+def average_delay_days(now=None):
+    """Mean days between due date and settlement for recently settled installments; early payments count as 0."""
+    now = now or datetime.utcnow()
+    delay = days_between(LoanInstallment.due_date, LoanInstallment.settled_at)
+    return db.session.scalar(
+        db.select(db.func.avg(db.case((delay > 0, delay), else_=0.0)))
+        .where(LoanInstallment.is_settled == True, LoanInstallment.settled_at >= now - DELAY_HISTORY)) or 0.0
+
+def _weekly_totals(start, weeks, shift_days):
+    """Outstanding installment amounts summed per week from start, after moving each due date by shift_days.
+
+    Returns (weekly totals, arrears); arrears are also counted in the first week, as they are expected as soon as possible.
+    """
+    offset = days_between(start, LoanInstallment.due_date) + shift_days
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # CAST truncates, which is the floor for every offset that is not already folded into week 0
+        week = db.cast(offset / 7, db.Integer)
+    else:
+        week = db.func.floor(offset / 7)
+    overdue = db.case((LoanInstallment.due_date < start, True), else_=False)
+    rows = db.session.execute(
+        db.select(week.label('week'), overdue.label('overdue'),
+                  db.func.sum(LoanInstallment.principal + LoanInstallment.interest - LoanInstallment.amount_paid))
+        .join(Loan, Loan.id == LoanInstallment.loan_id)
+        .where(*_open_installments(),
+               LoanInstallment.due_date < start + timedelta(days=weeks * 7 - shift_days))
+        .group_by(week, overdue))
+    totals = [0.0] * weeks
+    arrears = 0.0
+    for index, is_overdue, amount in rows:
+        if is_overdue:
+            arrears += amount or 0.0
+        totals[max(int(index), 0)] += amount or 0.0
+    return totals, arrears
+
+def cash_flow_forecast(weeks=FORECAST_WEEKS, adjust_for_delays=True, now=None):
+    """Expected loan repayments per week for the coming weeks, from the open installment schedules.
+
+    'scheduled' is what falls due each week (arrears in the first week); 'expected' moves every due
+    date back by the average delay members have recently paid with. Both are summed by the database.
+    """
+    now = now or datetime.utcnow()
+    start = datetime(now.year, now.month, now.day)
+    delay = average_delay_days(now) if adjust_for_delays else 0.0
+    scheduled, arrears = _weekly_totals(start, weeks, 0.0)
+    expected = _weekly_totals(start, weeks, delay)[0] if delay else scheduled
+    return {
+        'weeks': [{'start': (start + timedelta(weeks=n)).date().isoformat(), 'scheduled': round(scheduled[n], 2),
+                   'expected': round(expected[n], 2)} for n in range(weeks)],
+        'average_delay_days': round(delay, 1),
+        'arrears': round(arrears, 2),
+        'total_scheduled': round(sum(scheduled), 2),
+        'total_expected': round(sum(expected), 2),
+    }
@@ -4,10 +4,39 @@ from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, TextAreaField, FloatField, SelectField, DateTimeField, BooleanField, PasswordField, DateField, IntegerField
 from wtforms.validators import DataRequired, Email, Length, NumberRange, Optional, ValidationError
 from wtforms.widgets import TextArea
+from flask import current_app, url_for
 from models import User
 
+class PickerSelectField(SelectField):
+    """SelectField for member and loan lists that renders as a search box once the list is long.
+
+    Past CHOICES_PICKER_THRESHOLD options only the placeholder and the current selection are rendered;
+    the page fills in matches from the choice search endpoint. Validation still checks every choice.
+    """
+
+    def __init__(self, label=None, validators=None, kind=None, **kwargs):
+        kwargs.setdefault('coerce', int)
+        super().__init__(label, validators, **kwargs)
+        self.kind = kind
+
+    def uses_picker(self):
+        return len(self.choices or ()) > current_app.config['CHOICES_PICKER_THRESHOLD']
+
+    def iter_choices(self):
+        choices = super().iter_choices()
+        if not self.uses_picker():
+            return choices
+        # Placeholders have a falsy value (0)
+        return (choice for choice in choices if choice[2] or not choice[0])
+
+    def __call__(self, **kwargs):
+        if self.uses_picker():
+            kwargs.setdefault('data_picker_url', url_for('search_choices', kind=self.kind))
+        return super().__call__(**kwargs)
+
 class LoginForm(FlaskForm):
-    username = SelectField('Username', choices=[], validators=[DataRequired()])
+    username = StringField('Username', validators=[DataRequired(), Length(max=100)],
+                           render_kw={"autocomplete": "username", "list": "usernameSuggestions"})
     password = PasswordField('Password', validators=[DataRequired()])
 
 class DeletionForm(FlaskForm):
@@ -205,7 +234,7 @@ class MemberForm(FlaskForm):
     ])
 
 class ContributionForm(FlaskForm):
-    member_id = SelectField('Member', choices=[], validators=[DataRequired()], coerce=int)
+    member_id = PickerSelectField('Member', choices=[], validators=[DataRequired()], kind='members')
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     contribution_type = SelectField('Type', choices=[
         ('Regular', 'Regular Savings'),
@@ -213,6 +242,11 @@ class ContributionForm(FlaskForm):
     ], default='Regular')
     notes = TextAreaField('Notes', validators=[Optional()])
 
+class ContributionImportForm(FlaskForm):
+    file = FileField('CSV File', validators=[Optional(), FileAllowed(['csv', 'txt'], 'CSV files only')])
+    rows = TextAreaField('Or paste rows', validators=[Optional()],
+                         render_kw={"placeholder": "member,amount,type,notes - one contribution per line, or paste cells from a spreadsheet"})
+
 class LoanApplicationForm(FlaskForm):
     loan_type = SelectField('Loan Type', choices=[
         ('Internal', 'Internal Loan (Member)'),
@@ -243,13 +277,18 @@ class LoanApplicationForm(FlaskForm):
         ('18', '18 Months'),
         ('24', '24 Months')
     ], default='3', validators=[DataRequired()])
+    repayment_mode = SelectField('Preferred Repayment Mode', choices=[
+        ('monthly', 'Monthly'),
+        ('weekly', 'Weekly'),
+        ('lump_sum', 'Lump Sum')
+    ], default='monthly', validators=[DataRequired()])
     
     # Personal Information
     occupation = StringField('Occupation', validators=[Optional(), Length(max=100)])
     monthly_income = FloatField('Monthly Income (KSh)', validators=[Optional(), NumberRange(min=0)])
     
     # External loan fields
-    guarantor_id = SelectField('Guarantor (Member)', choices=[], validators=[Optional()], coerce=int)
+    guarantor_id = PickerSelectField('Guarantor (Member)', choices=[], validators=[Optional()], kind='members')
     kra_pin = StringField('KRA PIN', validators=[Optional(), Length(max=11)], 
                          render_kw={"placeholder": "A123456789B"})
     id_number = StringField('ID Number', validators=[Optional(), Length(max=10)], 
@@ -280,15 +319,20 @@ class LoanApprovalForm(FlaskForm):
         ('Active', 'Approve Loan'),
         ('Rejected', 'Reject Loan')
     ], validators=[DataRequired()])
+    repayment_mode = SelectField('Repayment Mode', choices=[
+        ('monthly', 'Monthly'),
+        ('weekly', 'Weekly'),
+        ('lump_sum', 'Lump Sum')
+    ], default='monthly', validators=[DataRequired()])
     approval_notes = TextAreaField('Approval/Rejection Notes', validators=[Optional()],
                                  render_kw={"placeholder": "Add any notes about this decision"})
 
 class LoanRepaymentForm(FlaskForm):
-    loan_id = SelectField('Loan', choices=[], validators=[DataRequired()], coerce=int)
+    loan_id = PickerSelectField('Loan', choices=[], validators=[DataRequired()], kind='loans')
     amount = FloatField('Repayment Amount', validators=[DataRequired(), NumberRange(min=0.01)])
 
 class FineForm(FlaskForm):
-    member_id = SelectField('Member', choices=[], validators=[DataRequired()], coerce=int)
+    member_id = PickerSelectField('Member', choices=[], validators=[DataRequired()], kind='members')
     amount = FloatField('Fine Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     fine_type = SelectField('Type', choices=[
         ('Absence', 'Absence from Meeting'),
@@ -404,7 +448,7 @@ class PaymentForm(FlaskForm):
         ('fine_payment', 'Fine Payment'),
         ('contribution', 'Contribution Payment')
     ], validators=[DataRequired()])
-    reference_id = SelectField('Reference', choices=[], validators=[DataRequired()], coerce=int)
+    reference_id = PickerSelectField('Reference', choices=[], validators=[DataRequired()], kind='loans')
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     payment_method = SelectField('Payment Method', choices=[
         ('cash', 'Cash'),
@@ -415,12 +459,12 @@ class PaymentForm(FlaskForm):
                                       render_kw={"placeholder": "M-Pesa code, bank reference, etc."})
 
 class WelfareContributionForm(FlaskForm):
-    member_id = SelectField('Member', choices=[], validators=[DataRequired()], coerce=int)
+    member_id = PickerSelectField('Member', choices=[], validators=[DataRequired()], kind='members')
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     notes = TextAreaField('Notes', validators=[Optional()])
 
 class WelfareExpenseForm(FlaskForm):
-    beneficiary_id = SelectField('Beneficiary', choices=[], validators=[DataRequired()], coerce=int)
+    beneficiary_id = PickerSelectField('Beneficiary', choices=[], validators=[DataRequired()], kind='members')
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     expense_type = SelectField('Expense Type', choices=[
         ('funeral', 'Funeral Support'),
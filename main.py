@@ -1,6 +1,7 @@
 
 from app import app
 from routes import *
+import scheduler  # starts each worker's background job runner on its first request
 from app import app, db
 import models
 
@@ -1,5 +1,6 @@
 
 import os
+from datetime import datetime
 from app import app, db
 from models import *
 from werkzeug.security import generate_password_hash
@@ -37,5 +38,88 @@ def migrate_database():
         
         print("Database migration completed successfully!")
 
+def add_missing_columns():
+    """Add columns that models gained after their tables were created, as nullable columns.
+
+    create_all() only creates missing tables; backfilling the new columns is left to the model.
+    Returns the columns that were added.
+    """
+    added = []
+    with app.app_context(), db.engine.begin() as connection:
+        inspector = db.inspect(connection)
+        quote = connection.dialect.identifier_preparer.quote
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(db.text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+# Timestamps that list pages keyset-paginate on; a row with NULL there is never reached by a cursor
+SORT_TIMESTAMP_COLUMNS = (Contribution.date_recorded, Loan.application_date, Fine.date_issued,
+                          Announcement.date_created, Document.upload_date, Notification.created_at,
+                          MembershipApplication.application_date, ActivityLog.timestamp)
+
+def require_sort_timestamps():
+    """Fill NULL sort timestamps left by older code and make the columns NOT NULL where the database allows.
+
+    A NULL becomes the column's earliest value (now, if every value is NULL), so the row lists as the
+    oldest. SQLite cannot change an existing column's nullability, so there only the values are filled.
+    Returns the columns that held NULLs.
+    """
+    filled = []
+    with app.app_context(), db.engine.begin() as connection:
+        inspector = db.inspect(connection)
+        for attribute in SORT_TIMESTAMP_COLUMNS:
+            column = attribute.expression
+            table = column.table
+            nullable = {info['name']: info['nullable'] for info in inspector.get_columns(table.name)}
+            if not nullable.get(column.name):
+                continue
+            earliest = db.select(db.func.min(column)).scalar_subquery()
+            if connection.execute(table.update().where(column.is_(None))
+                                  .values({column.name: db.func.coalesce(earliest, datetime.utcnow())})).rowcount:
+                filled.append(f'{table.name}.{column.name}')
+            if connection.dialect.name == 'postgresql':
+                quote = connection.dialect.identifier_preparer.quote
+                connection.execute(db.text(f'ALTER TABLE {quote(table.name)} ALTER COLUMN {quote(column.name)} SET NOT NULL'))
+    return filled
+
+def migrate_money_columns():
+    """Move float money columns to exact NUMERIC(14, 2) and round stored amounts to the cent.
+
+    Postgres columns are altered in place; SQLite has no column types to change, so only the values
+    are rounded. Safe to run again. Returns the columns that were changed.
+    """
+    changed = []
+    with app.app_context(), db.engine.begin() as connection:
+        inspector = db.inspect(connection)
+        quote = connection.dialect.identifier_preparer.quote
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            current_types = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if not isinstance(column.type, Money):
+                    continue
+                name, column_name = quote(table.name), quote(column.name)
+                if connection.dialect.name == 'postgresql':
+                    if not isinstance(current_types[column.name], db.Float):
+                        continue
+                    connection.execute(db.text(f'ALTER TABLE {name} ALTER COLUMN {column_name} '
+                                               f'TYPE NUMERIC(14, 2) USING ROUND({column_name}::numeric, 2)'))
+                else:
+                    rounded = connection.execute(db.text(f'UPDATE {name} SET {column_name} = ROUND({column_name}, 2) '
+                                                         f'WHERE {column_name} <> ROUND({column_name}, 2)')).rowcount
+                    if not rounded:
+                        continue
+                changed.append(f'{table.name}.{column.name}')
+    return changed
+
 if __name__ == '__main__':
     migrate_database()
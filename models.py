@@ -1,8 +1,41 @@
 
+import calendar
+from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime, timedelta
 from app import db
 from flask_login import UserMixin
-from sqlalchemy.sql import func
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func, ClauseElement
+from sqlalchemy.types import TypeDecorator
+
+class Money(TypeDecorator):
+    """A KSh amount stored as an exact NUMERIC(14, 2), so SUM() in SQL is exact.
+
+    Values are rounded half-up to the cent on the way in and read back as floats, so existing
+    arithmetic keeps working but nothing finer than a cent ever reaches the database.
+    """
+    impl = db.Numeric(14, 2, asdecimal=False)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return float(Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+    def process_result_value(self, value, dialect):
+        # SQLite keeps NUMERIC as binary floating point, so its sums are rounded back to the cent
+        return None if value is None else round(value, 2)
+
+# Fine type of the late fees issued by Loan.sweep_overdue()
+LATE_FEE_TYPE = 'Late Payment'
+
+def days_between(start, end):
+    """SQL expression for the fractional days from start to end; each may be a column or a datetime."""
+    start, end = (db.literal(value, db.DateTime) if isinstance(value, datetime) else value for value in (start, end))
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.julianday(end) - func.julianday(start)
+    return db.extract('epoch', end - start) / 86400
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,38 +49,172 @@ class User(UserMixin, db.Model):
     date_joined = db.Column(db.DateTime, default=datetime.utcnow)
     two_factor_enabled = db.Column(db.Boolean, default=False)
     profile_picture = db.Column(db.String(255), nullable=True)  # Filename of uploaded profile picture
+
+    __table_args__ = (
+        # Case-insensitive username prefix lookups for the login typeahead; text_pattern_ops lets LIKE use it on Postgres
+        db.Index('ix_user_active_username_lower', func.lower(username).label('username_lower'),
+                 postgresql_ops={'username_lower': 'text_pattern_ops'},
+                 sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
     
     # Relationships - specify foreign keys to avoid ambiguity
     contributions = db.relationship('Contribution', foreign_keys='Contribution.member_id', lazy=True, cascade='all, delete-orphan', overlaps="member")
     loans = db.relationship('Loan', foreign_keys='Loan.member_id', lazy=True, cascade='all, delete-orphan', overlaps="member")
     fines = db.relationship('Fine', foreign_keys='Fine.member_id', lazy=True, cascade='all, delete-orphan', overlaps="member")
     
+    balance = db.relationship('MemberBalance', uselist=False, lazy=True, cascade='all, delete-orphan')
+    
     def get_total_contributions(self):
-        return sum(c.amount for c in self.contributions) if self.contributions else 0.0
+        return self.balance.savings if self.balance else 0.0
+    
+    def get_total_welfare(self):
+        return self.balance.welfare if self.balance else 0.0
     
     def get_active_loans(self):
-        return [loan for loan in self.loans if loan.status == 'Active'] if self.loans else []
+        return [loan for loan in self.loans if loan.status == 'Active' and not loan.is_deleted] if self.loans else []
     
     def get_total_loan_balance(self):
-        active_loans = self.get_active_loans()
-        return sum(loan.remaining_amount for loan in active_loans) if active_loans else 0.0
+        return self.balance.loan_balance if self.balance else 0.0
     
     def get_unpaid_fines(self):
-        return [fine for fine in self.fines if not fine.is_paid] if self.fines else []
+        return [fine for fine in self.fines if not fine.is_paid and not fine.is_deleted] if self.fines else []
     
     def get_total_unpaid_fines(self):
-        unpaid_fines = self.get_unpaid_fines()
-        return sum(fine.amount for fine in unpaid_fines) if unpaid_fines else 0.0
+        return self.balance.unpaid_fines if self.balance else 0.0
     
+    @classmethod
+    def username_prefix_query(cls, prefix, limit=8):
+        """Select usernames of active users starting with prefix (ignoring case), shaped to use ix_user_active_username_lower."""
+        prefix = prefix.lstrip().lower()
+        lowered = func.lower(cls.username)
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # SQLite only uses expression indexes for comparisons, not LIKE
+            condition = db.and_(lowered >= prefix, lowered < prefix + '\U0010ffff')
+        else:
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            condition = lowered.like(escaped + '%', escape='\\')
+        return db.select(cls.username).where(condition, cls.is_active == True).order_by(lowered).limit(limit)
+
+    @classmethod
+    def search_usernames(cls, prefix, limit=8):
+        return db.session.scalars(cls.username_prefix_query(prefix, limit)).all()
+
+    @classmethod
+    def find_active(cls, username):
+        """The active user with this username, matched exactly or else case-insensitively when that is unambiguous."""
+        username = username.strip()
+        user = cls.query.filter_by(username=username, is_active=True).first()
+        if user:
+            return user
+        matches = cls.query.filter(func.lower(cls.username) == username.lower(), cls.is_active == True).limit(2).all()
+        return matches[0] if len(matches) == 1 else None
+
     def __repr__(self):
         return f'<User {self.username}>'
 
+class MemberBalance(db.Model):
+    """Per-member balance snapshot, updated in the same transaction as every money write."""
+    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    savings = db.Column(Money, nullable=False, default=0.0)
+    welfare = db.Column(Money, nullable=False, default=0.0)
+    loan_balance = db.Column(Money, nullable=False, default=0.0)  # Remaining amount on active loans
+    unpaid_fines = db.Column(Money, nullable=False, default=0.0)
+    last_activity = db.Column(db.DateTime)
+    
+    @classmethod
+    def apply(cls, member_id, savings=0.0, welfare=0.0, loan_balance=0.0, unpaid_fines=0.0):
+        """Add deltas to a member's snapshot. The caller commits."""
+        if not member_id:
+            return None
+        
+        deltas = {'savings': savings, 'welfare': welfare, 'loan_balance': loan_balance, 'unpaid_fines': unpaid_fines}
+        balance = db.session.get(cls, member_id)
+        if balance is None:
+            balance = cls(member_id=member_id, **{name: delta or 0.0 for name, delta in deltas.items()})
+            db.session.add(balance)
+        else:
+            # Column expressions keep concurrent writers from overwriting each other; a second
+            # apply() before the flush adds to the expression already pending
+            for name, delta in deltas.items():
+                if delta:
+                    pending = getattr(balance, name)
+                    base = pending if isinstance(pending, ClauseElement) else getattr(cls, name)
+                    setattr(balance, name, base + delta)
+        balance.last_activity = datetime.utcnow()
+        return balance
+    
+    @classmethod
+    def rebuild(cls):
+        """Recompute every snapshot from the ledger tables (drift repair). The caller commits."""
+        totals = {}
+        
+        def collect(field, query):
+            for member_id, value in query:
+                if member_id is None or value is None:
+                    continue
+                values = totals.setdefault(member_id, {})
+                values[field] = max(values[field], value) if field in values else value
+        
+        collect('savings', db.session.query(Contribution.member_id, func.sum(Contribution.amount))
+                .filter(Contribution.is_deleted == False).group_by(Contribution.member_id))
+        collect('welfare', db.session.query(WelfareContribution.member_id, func.sum(WelfareContribution.amount))
+                .filter(WelfareContribution.is_deleted == False).group_by(WelfareContribution.member_id))
+        collect('loan_balance', db.session.query(Loan.member_id, func.sum(Loan.remaining_amount))
+                .filter(Loan.status == 'Active', Loan.is_deleted == False).group_by(Loan.member_id))
+        collect('unpaid_fines', db.session.query(Fine.member_id, func.sum(Fine.amount))
+                .filter(Fine.is_paid == False, Fine.is_deleted == False).group_by(Fine.member_id))
+        collect('last_activity', db.session.query(Contribution.member_id, func.max(Contribution.date_recorded))
+                .group_by(Contribution.member_id))
+        collect('last_activity', db.session.query(WelfareContribution.member_id, func.max(WelfareContribution.date_recorded))
+                .group_by(WelfareContribution.member_id))
+        collect('last_activity', db.session.query(Loan.member_id, func.max(LoanRepayment.date_paid))
+                .join(LoanRepayment, LoanRepayment.loan_id == Loan.id).group_by(Loan.member_id))
+        
+        db.session.query(cls).delete()
+        db.session.bulk_insert_mappings(cls, [
+            dict({'savings': 0.0, 'welfare': 0.0, 'loan_balance': 0.0, 'unpaid_fines': 0.0, 'last_activity': None},
+                 member_id=member_id, **values)
+            for member_id, values in totals.items()
+        ])
+        return len(totals)
+
+    @classmethod
+    def add_savings(cls, totals, when=None):
+        """Add {member_id: amount} to members' savings in three statements, for batch writes. The caller commits."""
+        when = when or datetime.utcnow()
+        table = cls.__table__
+        existing = set(db.session.scalars(db.select(cls.member_id).where(cls.member_id.in_(totals))))
+        missing = [{'member_id': member_id, 'savings': amount, 'welfare': 0.0, 'loan_balance': 0.0,
+                    'unpaid_fines': 0.0, 'last_activity': when}
+                   for member_id, amount in totals.items() if member_id not in existing]
+        if missing:
+            db.session.execute(table.insert(), missing)
+        if existing:
+            db.session.execute(table.update().where(table.c.member_id == db.bindparam('b_member_id'))
+                               .values(savings=table.c.savings + db.bindparam('b_amount'), last_activity=when),
+                               [{'b_member_id': member_id, 'b_amount': totals[member_id]} for member_id in existing])
+
+    @classmethod
+    def add_unpaid_fines(cls, *conditions):
+        """Add the fines matching the conditions to their members' snapshots in two statements. The caller commits."""
+        new_fines = db.select(Fine.member_id).where(*conditions)
+        db.session.execute(db.insert(cls).from_select(
+            ['member_id', 'savings', 'welfare', 'loan_balance', 'unpaid_fines'],
+            db.select(Fine.member_id, db.literal(0.0), db.literal(0.0), db.literal(0.0), db.literal(0.0))
+            .where(*conditions, ~db.exists().where(cls.member_id == Fine.member_id))
+            .distinct()))
+        added = (db.select(func.coalesce(func.sum(Fine.amount), 0.0))
+                 .where(*conditions, Fine.member_id == cls.member_id).scalar_subquery())
+        db.session.execute(db.update(cls).where(cls.member_id.in_(new_fines))
+                           .values(unpaid_fines=cls.unpaid_fines + added),
+                           execution_options={'synchronize_session': False})
+
 class Contribution(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     contribution_type = db.Column(db.String(50), default='Regular')  # Regular, Special
-    date_recorded = db.Column(db.DateTime, default=datetime.utcnow)
+    date_recorded = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     recorded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     notes = db.Column(db.Text)
     is_deleted = db.Column(db.Boolean, default=False)
@@ -55,6 +222,12 @@ class Contribution(db.Model):
     deleted_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     deleted_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        db.Index('ix_contribution_member_date', 'member_id', 'date_recorded'),
+        db.Index('ix_contribution_live_date', 'date_recorded',
+                 sqlite_where=is_deleted == False, postgresql_where=is_deleted == False),
+    )
+    
     # Set up relationships with explicit foreign keys
     member = db.relationship('User', foreign_keys=[member_id], overlaps="contributions")
     recorder = db.relationship('User', foreign_keys=[recorded_by])
@@ -63,11 +236,11 @@ class Contribution(db.Model):
 class Loan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Nullable for external loans
-    amount = db.Column(db.Float, nullable=False)
-    remaining_amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
+    remaining_amount = db.Column(Money, nullable=False)
     interest_rate = db.Column(db.Float, default=20.0)  # Percentage
     status = db.Column(db.String(20), default='Pending')  # Pending, Active, Completed, Rejected
-    application_date = db.Column(db.DateTime, default=datetime.utcnow)
+    application_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     approval_date = db.Column(db.DateTime)
     due_date = db.Column(db.DateTime)
     approved_by = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -87,7 +260,7 @@ class Loan(db.Model):
     
     # Additional loan details
     occupation = db.Column(db.String(100))
-    monthly_income = db.Column(db.Float)
+    monthly_income = db.Column(Money)
     
     # External loan fields
     loan_type = db.Column(db.String(10), default='Internal')  # Internal, External
@@ -97,7 +270,7 @@ class Loan(db.Model):
     borrower_phone = db.Column(db.String(15), nullable=True)
     borrower_name = db.Column(db.String(100), nullable=True)
     borrower_address = db.Column(db.Text, nullable=True)
-    total_repayment = db.Column(db.Float, nullable=True)
+    total_repayment = db.Column(Money, nullable=True)
     
     # Repayment mode
     repayment_mode = db.Column(db.String(20), default='monthly')  # weekly, monthly, lump_sum
@@ -109,6 +282,14 @@ class Loan(db.Model):
     deleted_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     deleted_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        db.Index('ix_loan_member_status', 'member_id', 'status'),
+        db.Index('ix_loan_live_status_due', 'status', 'due_date',
+                 sqlite_where=is_deleted == False, postgresql_where=is_deleted == False),
+        db.Index('ix_loan_live_status_applied', 'status', 'application_date',
+                 sqlite_where=is_deleted == False, postgresql_where=is_deleted == False),
+    )
+    
     # Set up relationships with explicit foreign keys
     member = db.relationship('User', foreign_keys=[member_id], overlaps="loans")
     approver = db.relationship('User', foreign_keys=[approved_by])
@@ -147,22 +328,192 @@ class Loan(db.Model):
                 return True
         return False
 
+    @classmethod
+    def sweep_overdue(cls, now=None):
+        """Mark overdue loans and issue late fees across the whole portfolio in set-based statements.
+
+        Late fees go to loans overdue for longer than their grace period that have not been fined
+        (auto_fine_applied), so re-running the sweep never fines a loan twice. Meant to run under the
+        scheduler's overdue_sweep lease. The caller commits. Returns (loans marked overdue, fines issued).
+        """
+        now = now or datetime.utcnow()
+        marked = db.session.execute(
+            db.update(cls)
+            .where(cls.status == 'Active', cls.is_deleted == False, cls.due_date < now, cls.is_overdue.is_not(True))
+            .values(is_overdue=True, overdue_since=now),
+            execution_options={'synchronize_session': False}).rowcount
+
+        # Whole days overdue, matching calculate_late_fee()
+        days_overdue = days_between(cls.overdue_since, now)
+        due_for_fee = (cls.status == 'Active', cls.is_deleted == False, cls.is_overdue == True,
+                       cls.auto_fine_applied.is_not(True), cls.member_id.is_not(None),
+                       days_overdue >= cls.grace_period_days + 1)
+
+        system_user = db.select(func.min(User.id)).where(User.role == 'Admin').scalar_subquery()
+        late_fees = (db.select(cls.member_id,
+                               func.round(db.cast(cls.remaining_amount * cls.late_fee_percentage / 100, db.Numeric), 2),
+                               db.literal(LATE_FEE_TYPE), db.literal('Loan #') + db.cast(cls.id, db.String),
+                               db.literal(now), db.literal(False), db.literal(False),
+                               func.coalesce(cls.approved_by, system_user))
+                     .where(*due_for_fee, cls.remaining_amount > 0))
+        fined = db.session.execute(db.insert(Fine).from_select(
+            ['member_id', 'amount', 'fine_type', 'reason', 'date_issued', 'is_paid', 'is_deleted', 'recorded_by'],
+            late_fees)).rowcount
+        db.session.execute(db.update(cls).where(*due_for_fee).values(auto_fine_applied=True),
+                           execution_options={'synchronize_session': False})
+
+        if fined:
+            MemberBalance.add_unpaid_fines(Fine.fine_type == LATE_FEE_TYPE, Fine.date_issued == now)
+        if marked or fined:
+            # Bulk statements skip the flush listener that normally bumps cache versions
+            connection = db.session.connection()
+            for name, models in DataVersion.tracked.items():
+                if models & {cls, Fine}:
+                    DataVersion.bump(connection, name)
+        return marked, fined
+
 class LoanRepayment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     loan_id = db.Column(db.Integer, db.ForeignKey('loan.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     date_paid = db.Column(db.DateTime, default=datetime.utcnow)
     recorded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_loan_repayment_loan', 'loan_id'),
+    )
+    
     recorder = db.relationship('User', foreign_keys=[recorded_by])
 
+def _add_months(moment, months):
+    """The same day `months` later, clamped to the end of shorter months."""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+class LoanInstallment(db.Model):
+    """One scheduled repayment of an active loan, generated when the loan is approved."""
+    id = db.Column(db.Integer, primary_key=True)
+    loan_id = db.Column(db.Integer, db.ForeignKey('loan.id'), nullable=False)
+    member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Copied from the loan; None for external loans
+    sequence = db.Column(db.Integer, nullable=False)
+    due_date = db.Column(db.DateTime, nullable=False)
+    principal = db.Column(Money, nullable=False)
+    interest = db.Column(Money, nullable=False)
+    amount_paid = db.Column(Money, nullable=False, default=0.0)
+    is_settled = db.Column(db.Boolean, nullable=False, default=False)
+    settled_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_loan_installment_loan_sequence', 'loan_id', 'sequence', unique=True),
+        db.Index('ix_loan_installment_member_due', 'member_id', 'due_date'),
+        db.Index('ix_loan_installment_open_due', 'due_date',
+                 sqlite_where=is_settled == False, postgresql_where=is_settled == False),
+    )
+
+    loan = db.relationship('Loan', foreign_keys=[loan_id])
+
+    @property
+    def amount_due(self):
+        return self.principal + self.interest
+
+    @property
+    def outstanding(self):
+        return max(round(self.amount_due - self.amount_paid, 2), 0.0)
+
+    @classmethod
+    def build_schedule(cls, loan, start, paid=0.0):
+        """Installment rows for a loan starting at `start`, with `paid` already applied oldest first.
+
+        Weekly loans pay every 7 days for the loan's duration, monthly loans on the same day each
+        month and lump-sum loans once at the end. Interest is flat, so every installment carries an
+        equal share of principal and interest; the last one absorbs rounding.
+        """
+        months = max(loan.duration_months or 0, 1)
+        if loan.repayment_mode == 'weekly':
+            due_dates = [start + timedelta(weeks=n) for n in range(1, round(months * 52 / 12) + 1)]
+        elif loan.repayment_mode == 'lump_sum':
+            due_dates = [_add_months(start, months)]
+        else:
+            due_dates = [_add_months(start, n) for n in range(1, months + 1)]
+
+        count = len(due_dates)
+        interest = (loan.total_repayment or loan.calculate_total_repayment()) - loan.amount
+        principal_share = round(loan.amount / count, 2)
+        interest_share = round(interest / count, 2)
+        rows = []
+        for sequence, due_date in enumerate(due_dates, start=1):
+            last = sequence == count
+            row = {
+                'loan_id': loan.id, 'member_id': loan.member_id, 'sequence': sequence, 'due_date': due_date,
+                'principal': round(loan.amount - principal_share * (count - 1), 2) if last else principal_share,
+                'interest': round(interest - interest_share * (count - 1), 2) if last else interest_share,
+            }
+            applied = min(paid, row['principal'] + row['interest'])
+            paid = round(paid - applied, 2)
+            row['amount_paid'] = round(applied, 2)
+            row['is_settled'] = row['amount_paid'] >= round(row['principal'] + row['interest'], 2)
+            row['settled_at'] = start if row['is_settled'] else None
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def generate(cls, loan, start=None):
+        """Replace a loan's schedule and move its due date to the final installment. The caller commits."""
+        rows = cls.build_schedule(loan, start or datetime.utcnow())
+        db.session.execute(db.delete(cls).where(cls.loan_id == loan.id))
+        db.session.execute(db.insert(cls), rows)
+        loan.due_date = rows[-1]['due_date']
+        return len(rows)
+
+    @classmethod
+    def backfill(cls):
+        """Build schedules for active loans approved before installments existed, counting repayments
+        made so far. The caller commits. Returns the number of loans scheduled."""
+        loans = Loan.query.filter(Loan.status == 'Active', Loan.is_deleted == False,
+                                  ~db.exists().where(cls.loan_id == Loan.id)).all()
+        rows = []
+        for loan in loans:
+            paid = max((loan.total_repayment or loan.remaining_amount) - loan.remaining_amount, 0.0)
+            schedule = cls.build_schedule(loan, loan.approval_date or loan.application_date, paid)
+            loan.due_date = schedule[-1]['due_date']
+            rows.extend(schedule)
+        if rows:
+            db.session.execute(db.insert(cls), rows)
+        return len(loans)
+
+    @classmethod
+    def apply_payment(cls, loan_id, amount, paid_at=None):
+        """Allocate a repayment to a loan's open installments, oldest first. The caller commits."""
+        paid_at = paid_at or datetime.utcnow()
+        for installment in (cls.query.filter_by(loan_id=loan_id, is_settled=False)
+                            .order_by(cls.sequence).all()):
+            if amount <= 0:
+                break
+            applied = min(amount, installment.outstanding)
+            installment.amount_paid = round(installment.amount_paid + applied, 2)
+            amount = round(amount - applied, 2)
+            if installment.outstanding <= 0:
+                installment.is_settled = True
+                installment.settled_at = paid_at
+
+    @classmethod
+    def open_due(cls, before, after=None):
+        """Query for unsettled installments of live active loans due before `before` (and on or after `after`)."""
+        query = (cls.query.join(Loan, Loan.id == cls.loan_id)
+                 .filter(cls.is_settled == False, cls.due_date < before,
+                         Loan.status == 'Active', Loan.is_deleted == False))
+        if after is not None:
+            query = query.filter(cls.due_date >= after)
+        return query.order_by(cls.due_date)
+
 class Fine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     fine_type = db.Column(db.String(50), nullable=False)  # Absence, Lateness, etc.
     reason = db.Column(db.String(100))  # With Apology, Without Apology
-    date_issued = db.Column(db.DateTime, default=datetime.utcnow)
+    date_issued = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     is_paid = db.Column(db.Boolean, default=False)
     date_paid = db.Column(db.DateTime)
     payment_notes = db.Column(db.Text)
@@ -172,6 +523,12 @@ class Fine(db.Model):
     deleted_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     deleted_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        db.Index('ix_fine_member_paid', 'member_id', 'is_paid'),
+        db.Index('ix_fine_live_issued', 'date_issued',
+                 sqlite_where=is_deleted == False, postgresql_where=is_deleted == False),
+    )
+    
     # Set up relationships with explicit foreign keys
     member = db.relationship('User', foreign_keys=[member_id], overlaps="fines")
     recorder = db.relationship('User', foreign_keys=[recorded_by])
@@ -181,7 +538,7 @@ class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     is_urgent = db.Column(db.Boolean, default=False)
     is_deleted = db.Column(db.Boolean, default=False)
@@ -189,6 +546,11 @@ class Announcement(db.Model):
     deleted_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     deleted_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        db.Index('ix_announcement_live_created', 'date_created',
+                 sqlite_where=is_deleted == False, postgresql_where=is_deleted == False),
+    )
+    
     creator = db.relationship('User', foreign_keys=[created_by])
     deleter = db.relationship('User', foreign_keys=[deleted_by])
 
@@ -207,6 +569,10 @@ class MeetingRecord(db.Model):
     deleted_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     deleted_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        db.Index('ix_meeting_record_date_held', 'date_held'),
+    )
+    
     recorder = db.relationship('User', foreign_keys=[recorded_by])
     deleter = db.relationship('User', foreign_keys=[deleted_by])
 
@@ -216,11 +582,15 @@ class Document(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(10), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
-    upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     description = db.Column(db.Text)
     category = db.Column(db.String(50), default='General')
     
+    __table_args__ = (
+        db.Index('ix_document_upload_date', 'upload_date'),
+    )
+    
     uploader = db.relationship('User', foreign_keys=[uploaded_by])
 
 class Project(db.Model):
@@ -228,7 +598,7 @@ class Project(db.Model):
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='Planned')
-    budget = db.Column(db.Float, default=0.0)
+    budget = db.Column(Money, default=0.0)
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -243,10 +613,75 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=False)
     notification_type = db.Column(db.String(50), nullable=False)
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_notification_user_read', 'user_id', 'is_read', 'created_at'),
+    )
     
     user = db.relationship('User', foreign_keys=[user_id])
 
+class NotificationCounter(db.Model):
+    """Unread notification count per user, adjusted in the same transaction as notification inserts and reads."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def add(cls, user_ids, delta):
+        """Add delta to each user's unread count in one UPDATE. The caller commits."""
+        user_ids = set(user_ids)
+        if not user_ids or not delta:
+            return
+        result = db.session.execute(db.update(cls).where(cls.user_id.in_(user_ids))
+                                    .values(unread=cls.unread + delta))
+        if result.rowcount == len(user_ids):
+            return
+        
+        # Users without a counter yet get one counted from the table, which already includes this change
+        existing = set(db.session.scalars(db.select(cls.user_id).where(cls.user_id.in_(user_ids))))
+        missing = user_ids - existing
+        counts = dict(db.session.execute(
+            db.select(Notification.user_id, func.count(Notification.id))
+            .where(Notification.user_id.in_(missing), Notification.is_read == False)
+            .group_by(Notification.user_id)).all())
+        db.session.execute(db.insert(cls), [{'user_id': user_id, 'unread': counts.get(user_id, 0)}
+                                            for user_id in missing])
+    
+    @classmethod
+    def _recount(cls):
+        return db.session.execute(
+            db.select(Notification.user_id, func.count(Notification.id))
+            .where(Notification.is_read == False).group_by(Notification.user_id)).all()
+    
+    @classmethod
+    def rebuild(cls):
+        """Recount every user's unread notifications (drift repair). The caller commits."""
+        counts = cls._recount()
+        db.session.query(cls).delete()
+        db.session.bulk_insert_mappings(cls, [{'user_id': user_id, 'unread': count} for user_id, count in counts])
+        return len(counts)
+    
+    @classmethod
+    def drift(cls):
+        """{user_id: (counter, recount)} for every user whose counter disagrees with what rebuild() would store."""
+        actual = dict(cls._recount())
+        stored = dict(db.session.execute(db.select(cls.user_id, cls.unread)).all())
+        return {user_id: (stored.get(user_id, 0), actual.get(user_id, 0))
+                for user_id in stored.keys() | actual.keys()
+                if stored.get(user_id, 0) != actual.get(user_id, 0)}
+
+class LiveEvent(db.Model):
+    """Compact change events for the /events stream, shared by every worker through the database."""
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # loan_pending, payment_recorded, vote_cast, announcement_posted
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    roles = db.Column(db.String(200))  # Comma-separated roles that receive it, empty for everyone
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_live_event_created', 'created_at'),
+    )
+
 class MembershipApplication(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(100), nullable=False)
@@ -257,11 +692,16 @@ class MembershipApplication(db.Model):
     occupation = db.Column(db.String(100), nullable=False)
     reason_for_joining = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='Pending')  # Pending, Approved, Rejected
-    application_date = db.Column(db.DateTime, default=datetime.utcnow)
+    application_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     reviewed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     review_date = db.Column(db.DateTime, nullable=True)
     review_notes = db.Column(db.Text)
     
+    __table_args__ = (
+        db.Index('ix_membership_application_date', 'application_date'),
+        db.Index('ix_membership_application_email_status', 'email', 'status'),
+    )
+    
     reviewer = db.relationship('User', foreign_keys=[reviewed_by])
 
 class ActivityLog(db.Model):
@@ -272,9 +712,16 @@ class ActivityLog(db.Model):
     entity_id = db.Column(db.Integer, nullable=True)  # ID of the affected entity
     description = db.Column(db.Text, nullable=False)  # Human readable description
     ip_address = db.Column(db.String(45))  # User's IP address
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     additional_data = db.Column(db.Text)  # JSON data for extra details
     
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_activity_log_entity', 'entity_type', 'entity_id'),
+        db.Index('ix_activity_log_action_timestamp', 'action', 'timestamp'),
+    )
+    
     user = db.relationship('User', foreign_keys=[user_id])
 
 class Payment(db.Model):
@@ -282,7 +729,7 @@ class Payment(db.Model):
     member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     payment_type = db.Column(db.String(20), nullable=False)  # loan_repayment, fine_payment, contribution
     reference_id = db.Column(db.Integer, nullable=False)  # ID of loan, fine, or contribution
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     payment_method = db.Column(db.String(20), nullable=False)  # cash, mpesa, bank_transfer
     transaction_reference = db.Column(db.String(100))
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -291,6 +738,11 @@ class Payment(db.Model):
     receipt_generated = db.Column(db.Boolean, default=False)
     qr_code_path = db.Column(db.String(255))
     
+    __table_args__ = (
+        db.Index('ix_payment_date', 'payment_date'),
+        db.Index('ix_payment_member', 'member_id'),
+    )
+    
     member = db.relationship('User', foreign_keys=[member_id])
     processor = db.relationship('User', foreign_keys=[processed_by])
 
@@ -305,28 +757,83 @@ class DigitalReceipt(db.Model):
     generated_at = db.Column(db.DateTime, default=datetime.utcnow)
     downloaded = db.Column(db.Boolean, default=False)
     download_count = db.Column(db.Integer, default=0)
+    # Copied from the receipted record when the receipt is generated, so listings and access checks need no joins
+    owner_member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # None for external borrowers
+    receipt_type = db.Column(db.String(20))  # contribution, loan_repayment, welfare, payment
+    amount = db.Column(Money)
+    occurred_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_digital_receipt_generated', 'generated_at'),
+        db.Index('ix_digital_receipt_payment', 'payment_id'),
+        db.Index('ix_digital_receipt_contribution', 'contribution_id'),
+        db.Index('ix_digital_receipt_loan_repayment', 'loan_repayment_id'),
+        db.Index('ix_digital_receipt_welfare', 'welfare_contribution_id'),
+        db.Index('ix_digital_receipt_owner_occurred', 'owner_member_id', 'occurred_at'),
+        db.Index('ix_digital_receipt_occurred', 'occurred_at'),
+    )
     
     payment = db.relationship('Payment', backref='receipt')
     contribution = db.relationship('Contribution', backref='receipt')
     loan_repayment = db.relationship('LoanRepayment', backref='receipt')
     welfare_contribution = db.relationship('WelfareContribution', backref='receipt')
 
+    @classmethod
+    def backfill(cls):
+        """Fill owner, type, amount and date on receipts generated before those columns existed,
+        with one UPDATE per receipted table. The caller commits. Returns the number of receipts filled."""
+        table = cls.__table__
+        pending = table.c.receipt_type.is_(None)
+        filled = 0
+        sources = (
+            ('contribution', table.c.contribution_id, Contribution.__table__, Contribution.member_id,
+             Contribution.amount, Contribution.date_recorded),
+            ('welfare', table.c.welfare_contribution_id, WelfareContribution.__table__, WelfareContribution.member_id,
+             WelfareContribution.amount, WelfareContribution.date_recorded),
+            ('payment', table.c.payment_id, Payment.__table__, Payment.member_id, Payment.amount, Payment.payment_date),
+        )
+        for receipt_type, link, source, member_id, amount, occurred_at in sources:
+            def column(value):
+                return db.select(value).where(source.c.id == link).scalar_subquery()
+            filled += db.session.execute(
+                table.update().where(pending, link.isnot(None))
+                .values(receipt_type=receipt_type, owner_member_id=column(member_id), amount=column(amount),
+                        occurred_at=db.func.coalesce(column(occurred_at), table.c.generated_at))).rowcount
+
+        # Loan repayments are owned by the borrowing member, one join further away
+        def repayment(value):
+            return (db.select(value).select_from(LoanRepayment).join(Loan, Loan.id == LoanRepayment.loan_id)
+                    .where(LoanRepayment.id == table.c.loan_repayment_id).scalar_subquery())
+        filled += db.session.execute(
+            table.update().where(pending, table.c.loan_repayment_id.isnot(None))
+            .values(receipt_type='loan_repayment', owner_member_id=repayment(Loan.member_id),
+                    amount=repayment(LoanRepayment.amount),
+                    occurred_at=db.func.coalesce(repayment(LoanRepayment.date_paid), table.c.generated_at))).rowcount
+
+        db.session.execute(table.update().where(table.c.occurred_at.is_(None))
+                           .values(occurred_at=db.func.coalesce(table.c.generated_at, db.func.current_timestamp())))
+        return filled
+
 class WelfareContribution(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     date_recorded = db.Column(db.DateTime, default=datetime.utcnow)
     recorded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     notes = db.Column(db.Text)
     is_deleted = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (
+        db.Index('ix_welfare_contribution_member', 'member_id', 'date_recorded'),
+    )
+    
     member = db.relationship('User', foreign_keys=[member_id])
     recorder = db.relationship('User', foreign_keys=[recorded_by])
 
 class WelfareExpense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     beneficiary_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     expense_type = db.Column(db.String(50), nullable=False)  # funeral, emergency, medical, etc.
     description = db.Column(db.Text, nullable=False)
     date_disbursed = db.Column(db.DateTime, default=datetime.utcnow)
@@ -349,6 +856,10 @@ class VotingProposal(db.Model):
     requires_majority = db.Column(db.Boolean, default=True)
     minimum_participation = db.Column(db.Float, default=50.0)  # Percentage
     
+    __table_args__ = (
+        db.Index('ix_voting_proposal_status', 'status', 'created_date'),
+    )
+    
     creator = db.relationship('User', foreign_keys=[created_by])
     votes = db.relationship('Vote', backref='proposal', lazy=True, cascade='all, delete-orphan')
 
@@ -360,6 +871,10 @@ class Vote(db.Model):
     vote_date = db.Column(db.DateTime, default=datetime.utcnow)
     comment = db.Column(db.Text)
     
+    __table_args__ = (
+        db.Index('ix_vote_proposal_member', 'proposal_id', 'member_id'),
+    )
+    
     member = db.relationship('User', foreign_keys=[member_id])
 
 class Badge(db.Model):
@@ -378,6 +893,10 @@ class UserBadge(db.Model):
     earned_date = db.Column(db.DateTime, default=datetime.utcnow)
     points_earned = db.Column(db.Integer, default=0)
     
+    __table_args__ = (
+        db.Index('ix_user_badge_member', 'member_id', 'badge_id'),
+    )
+    
     member = db.relationship('User', foreign_keys=[member_id])
     badge = db.relationship('Badge', foreign_keys=[badge_id])
 
@@ -388,12 +907,16 @@ class MemberPoints(db.Model):
     level = db.Column(db.String(50), default='Bronze')  # Bronze, Silver, Gold, Platinum
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_member_points_member', 'member_id'),
+    )
+    
     member = db.relationship('User', foreign_keys=[member_id])
 
 class LoanSettlement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     loan_id = db.Column(db.Integer, db.ForeignKey('loan.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     payment_method = db.Column(db.String(20), nullable=False)  # cash, mpesa, bank_transfer
     transaction_reference = db.Column(db.String(100))
     settlement_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -407,7 +930,7 @@ class LoanSettlement(db.Model):
 class FineSettlement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     fine_id = db.Column(db.Integer, db.ForeignKey('fine.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     payment_method = db.Column(db.String(20), nullable=False)  # cash, mpesa, bank_transfer
     transaction_reference = db.Column(db.String(100))
     settlement_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -451,3 +974,78 @@ class OTPVerification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', foreign_keys=[user_id])
+
+class ScheduledJob(db.Model):
+    """Persisted state of a background job; the lease columns let only one process run it at a time."""
+    name = db.Column(db.String(50), primary_key=True)
+    next_run = db.Column(db.DateTime, nullable=False)
+    last_run = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))  # success, failed
+    last_error = db.Column(db.Text)
+    last_duration = db.Column(db.Float)  # Seconds
+    lease_owner = db.Column(db.String(100))  # host:pid of the process running the job
+    lease_expires_at = db.Column(db.DateTime)
+
+class ReceiptCounter(db.Model):
+    """Next unreserved receipt sequence number; processes reserve numbers from it in blocks."""
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+    @classmethod
+    def reserve(cls, name, count):
+        """Reserve count numbers in a transaction of their own, so they stay reserved even if the
+        caller's transaction rolls back. Returns the first reserved number."""
+        table = cls.__table__
+        with db.engine.begin() as connection:
+            end = connection.execute(table.update().where(table.c.name == name)
+                                     .values(next_value=table.c.next_value + count)
+                                     .returning(table.c.next_value)).scalar()
+            if end is None:
+                connection.execute(table.insert().values(name=name, next_value=1 + count))
+                end = 1 + count
+        return end - count
+
+class DataVersion(db.Model):
+    """Monotonic counters that bump whenever the tracked tables change, used to key in-process caches."""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Version name -> model classes whose writes bump it
+    tracked = {}
+    
+    @classmethod
+    def track(cls, name, *models):
+        cls.tracked.setdefault(name, set()).update(models)
+    
+    @classmethod
+    def current(cls, name):
+        """Read the current version in a single primary-key lookup."""
+        version = db.session.query(cls.version).filter(cls.name == name).scalar()
+        return version or 0
+    
+    @classmethod
+    def bump(cls, connection, name):
+        """Increment a version on the given connection, inside the caller's transaction."""
+        table = cls.__table__
+        result = connection.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, version=1))
+
+DataVersion.track('statistics', User, Contribution, Loan, Fine)
+DataVersion.track('reports', User, Contribution, Loan, Fine)
+DataVersion.track('officers', User)
+DataVersion.track('member_choices', User)
+DataVersion.track('loan_choices', User, Loan)
+DataVersion.track('list_aggregates', User, Contribution, Loan, Fine, Document)
+
+@event.listens_for(Session, 'after_flush')
+def bump_data_versions(session, flush_context):
+    """Bump the version of every tracked group touched by this flush."""
+    changed = {type(obj) for obj in list(session.new) + list(session.dirty) + list(session.deleted)}
+    if not changed:
+        return
+    
+    connection = session.connection()
+    for name, models in DataVersion.tracked.items():
+        if changed & models:
+            DataVersion.bump(connection, name)
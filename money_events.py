@@ -0,0 +1,108 @@
+import json
+import logging
+import threading
+from datetime import datetime
+from app import db
+from models import DigitalReceipt, ReceiptCounter
+from notifications import run_in_background
+
+# Receipt number prefix per receipt type
+RECEIPT_PREFIXES = {
+    'contribution': 'CONT',
+    'loan_repayment': 'LOANSETTLE',
+    'welfare': 'WELFARE',
+    'payment': 'PAM',
+}
+
+# Numbers each process reserves from ReceiptCounter per round trip
+RECEIPT_NUMBER_BLOCK = 50
+
+class ReceiptNumberAllocator:
+    """Hands out receipt sequence numbers from blocks reserved in ReceiptCounter.
+
+    Numbers are unique across processes but not gap-free: a block left unused when a process
+    exits, or a number taken by an event that rolls back, is skipped.
+    """
+
+    def __init__(self, name='receipt', block_size=RECEIPT_NUMBER_BLOCK):
+        self.name = name
+        self.block_size = block_size
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next = ReceiptCounter.reserve(self.name, self.block_size)
+                self._end = self._next + self.block_size
+            number = self._next
+            self._next += 1
+        return number
+
+    def receipt_number(self, receipt_type, when=None):
+        return self._format(receipt_type, self.allocate(), when)
+
+    def receipt_number_block(self, receipt_type, count, when=None):
+        """count consecutive receipt numbers from one reservation of their own, for batch writes."""
+        first = ReceiptCounter.reserve(self.name, count)
+        return [self._format(receipt_type, first + offset, when) for offset in range(count)]
+
+    @staticmethod
+    def _format(receipt_type, number, when):
+        # The dash keeps these apart from the older PREFIX+date+record-id numbers
+        return f"{RECEIPT_PREFIXES[receipt_type]}{(when or datetime.now()).strftime('%Y%m%d')}-{number:06d}"
+
+receipt_numbers = ReceiptNumberAllocator()
+
+class MoneyEvent:
+    """Writes one money event in a single transaction, then runs its side effects.
+
+    The record, its balance updates and its receipt are added to the session and committed once.
+    Once the commit succeeds, side effects queued with in_background() (badge awards and other
+    database work) go to the background notification writer, and those queued with after_commit()
+    run in the request. The latter are for effects that only hand work to a queue of their own,
+    such as notify_roles() and log_activity(), which needs the request's user and address.
+    A side effect that fails is logged and does not stop the others.
+
+    A receipt_type reserves the receipt number when the event starts, before anything is written,
+    so the allocator never needs the record's id or a flush.
+    """
+
+    def __init__(self, receipt_type=None):
+        self.receipt_type = receipt_type
+        self.receipt_number = receipt_numbers.receipt_number(receipt_type) if receipt_type else None
+        self.receipt = None
+        self._side_effects = []
+        self._background = []
+
+    def issue_receipt(self, owner_member_id, amount, occurred_at, qr_data, **record):
+        """Add the event's receipt, linked through a relationship keyword such as contribution=..."""
+        qr_data = dict(qr_data, receipt_number=self.receipt_number)
+        self.receipt = DigitalReceipt(receipt_number=self.receipt_number, qr_code_data=json.dumps(qr_data),
+                                      generated_at=datetime.utcnow(), owner_member_id=owner_member_id,
+                                      receipt_type=self.receipt_type, amount=amount, occurred_at=occurred_at,
+                                      **record)
+        db.session.add(self.receipt)
+        return self.receipt
+
+    def after_commit(self, func, *args, **kwargs):
+        self._side_effects.append((func, args, kwargs))
+
+    def in_background(self, func, *args, **kwargs):
+        self._background.append((func, args, kwargs))
+
+    def commit(self):
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for func, args, kwargs in self._background:
+            run_in_background(func, *args, **kwargs)
+        for func, args, kwargs in self._side_effects:
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Side effect {func.__name__} failed after money event: {str(e)}")
@@ -0,0 +1,204 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from app import app, db
+from models import User, Notification, NotificationCounter, LiveEvent, DataVersion
+from utils import format_currency
+
+# Roles that receive loan and payment notifications
+OFFICER_ROLES = ('Admin', 'Treasurer', 'Secretary', 'Chairman')
+
+# Per-process cache of active user ids per role, keyed by the 'officers' data version
+_recipient_cache = {}
+
+# A single writer keeps background fan-out ordered and off the request thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notify')
+
+# Navbar badge counts are reused for a few seconds; reads in this process drop the entry at once
+UNREAD_CACHE_TTL = 15
+_unread_cache = {}
+
+# Live event streams: events older than the retention are pruned; each stream reconnects after
+# EVENT_STREAM_SECONDS so a long-lived connection never pins a worker indefinitely
+EVENT_RETENTION = timedelta(days=1)
+EVENT_STREAM_SECONDS = 60
+EVENT_POLL_INTERVAL = 2
+EVENT_HEARTBEAT_INTERVAL = 15
+# A browser turned away because every stream slot is taken tries again after this long
+EVENT_STREAM_BUSY_RETRY_MS = 30000
+
+# Each open stream holds a worker thread, so a worker serves at most EVENT_STREAMS_PER_WORKER of them
+_stream_slots = threading.BoundedSemaphore(app.config['EVENT_STREAMS_PER_WORKER'])
+
+# Streams in this process wait here and are woken as soon as this process publishes an event
+_event_published = threading.Condition()
+
+def recipients_for_roles(roles=OFFICER_ROLES):
+    """Ids of active users holding any of the given roles."""
+    version = DataVersion.current('officers')
+    if any(_recipient_cache.get(role, (None,))[0] != version for role in roles):
+        by_role = {role: [] for role in roles}
+        rows = db.session.execute(db.select(User.id, User.role)
+                                  .where(User.role.in_(roles), User.is_active == True)
+                                  .order_by(User.id))
+        for user_id, role in rows:
+            by_role[role].append(user_id)
+        for role, user_ids in by_role.items():
+            _recipient_cache[role] = (version, tuple(user_ids))
+    return sorted({user_id for role in roles for user_id in _recipient_cache[role][1]})
+
+def insert_notifications(user_ids, title, message, notification_type, created_at=None):
+    """Write one notification per user with a single bulk insert. The caller commits."""
+    created_at = created_at or datetime.utcnow()
+    rows = [{'user_id': user_id, 'title': title, 'message': message,
+             'notification_type': notification_type, 'is_read': False, 'created_at': created_at}
+            for user_id in user_ids]
+    if rows:
+        db.session.execute(db.insert(Notification), rows)
+        NotificationCounter.add(user_ids, 1)
+    return len(rows)
+
+def unread_count(user_id):
+    """Unread notifications for a user, from the counter table or the short-lived per-user cache."""
+    cached = _unread_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    count = db.session.scalar(db.select(NotificationCounter.unread)
+                              .where(NotificationCounter.user_id == user_id)) or 0
+    _unread_cache[user_id] = (time.monotonic() + UNREAD_CACHE_TTL, count)
+    return count
+
+def mark_read(user_id, notification_ids=None):
+    """Mark some (or, with no ids, all) of a user's notifications as read and commit. Returns how many changed."""
+    statement = db.update(Notification).where(Notification.user_id == user_id, Notification.is_read == False)
+    if notification_ids is not None:
+        statement = statement.where(Notification.id.in_(notification_ids))
+    changed = db.session.execute(statement.values(is_read=True), execution_options={'synchronize_session': False}).rowcount
+    NotificationCounter.add([user_id], -changed)
+    db.session.commit()
+    _unread_cache.pop(user_id, None)
+    return changed
+
+def insert_event(event_type, payload, roles=None, created_at=None):
+    """Record a live event for /events streams and prune expired ones. The caller commits."""
+    created_at = created_at or datetime.utcnow()
+    db.session.execute(db.insert(LiveEvent).values(
+        event_type=event_type, payload=json.dumps(payload, default=str),
+        roles=','.join(roles) if roles else None, created_at=created_at))
+    db.session.execute(db.delete(LiveEvent).where(LiveEvent.created_at < created_at - EVENT_RETENTION))
+
+def _deliver(roles, title, message, notification_type, created_at, event):
+    try:
+        if title:
+            insert_notifications(recipients_for_roles(roles), title, message, notification_type, created_at)
+        if event:
+            insert_event(*event, created_at=created_at)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to send '{title or event[0]}' notifications: {str(e)}")
+        return
+    with _event_published:
+        _event_published.notify_all()
+
+def _deliver_in_background(*args):
+    with app.app_context():
+        _deliver(*args)
+
+def _dispatch(*args):
+    if app.config.get('NOTIFICATION_FANOUT') == 'inline':
+        _deliver(*args)
+    else:
+        _executor.submit(_deliver_in_background, *args)
+
+def _run_in_background(func, args, kwargs):
+    with app.app_context():
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Background task {func.__name__} failed: {str(e)}")
+
+def run_in_background(func, *args, **kwargs):
+    """Run func on the notification writer thread, after the notifications queued before it.
+
+    Runs inline when NOTIFICATION_FANOUT is 'inline'. Arguments must not be ORM objects of the caller's session.
+    """
+    if app.config.get('NOTIFICATION_FANOUT') == 'inline':
+        _run_in_background(func, args, kwargs)
+    else:
+        _executor.submit(_run_in_background, func, args, kwargs)
+
+def notify_roles(title, message, notification_type, roles=OFFICER_ROLES, event=None):
+    """Notify every active user in the given roles, in the background unless NOTIFICATION_FANOUT is 'inline'.
+
+    event is an optional (event_type, payload) pair published to the same roles' live streams.
+    """
+    roles = tuple(roles)
+    _dispatch(roles, title, message, notification_type, datetime.utcnow(),
+              (event[0], event[1], roles) if event else None)
+
+def publish_event(event_type, payload, roles=None):
+    """Publish a live event without creating notifications; roles=None reaches everyone."""
+    _dispatch(None, None, None, None, datetime.utcnow(), (event_type, payload, roles))
+
+def create_loan_notification(loan):
+    """Create notification for loan application."""
+    borrower_name = loan.borrower_name if loan.loan_type == 'External' else loan.member.full_name
+    message = f'{borrower_name} has applied for a {loan.loan_type.lower()} loan of {format_currency(loan.amount)}'
+    notify_roles('New Loan Application', message, 'loan_application',
+                 event=('loan_pending', {'loan_id': loan.id, 'amount': loan.amount, 'text': message}))
+
+def create_payment_notification(payment_type, member_name, amount):
+    """Create notification for payments."""
+    message = f'{member_name} has made a {payment_type.lower()} payment of {format_currency(amount)}'
+    notify_roles(f'New {payment_type} Payment', message, 'payment_recorded',
+                 event=('payment_recorded', {'payment_type': payment_type, 'amount': amount, 'text': message}))
+
+def _latest_event_id():
+    with db.engine.connect() as connection:
+        return connection.scalar(db.select(db.func.max(LiveEvent.id))) or 0
+
+def _events_after(last_id):
+    # A short-lived connection per poll, so an idle stream does not hold one from the pool
+    # (the /events route releases the request's session before streaming)
+    with db.engine.connect() as connection:
+        return connection.execute(db.select(LiveEvent.id, LiveEvent.event_type, LiveEvent.payload, LiveEvent.roles)
+                                  .where(LiveEvent.id > last_id).order_by(LiveEvent.id).limit(100)).all()
+
+def event_stream(role, last_event_id=None):
+    """Yield Server-Sent Events for the given role, starting after last_event_id (or from now)."""
+    try:
+        last_id = int(last_event_id)
+    except (TypeError, ValueError):
+        last_id = _latest_event_id()
+
+    # Taken when the stream starts, so a response that is never iterated holds no slot
+    if not _stream_slots.acquire(blocking=False):
+        yield f'retry: {EVENT_STREAM_BUSY_RETRY_MS}\nid: {last_id}\n\n'
+        return
+    try:
+        yield f'retry: 3000\nid: {last_id}\n\n'
+        deadline = time.monotonic() + EVENT_STREAM_SECONDS
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            for event_id, event_type, payload, roles in _events_after(last_id):
+                last_id = event_id
+                if roles and role not in roles.split(','):
+                    continue
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+                last_sent = time.monotonic()
+
+            if time.monotonic() - last_sent >= EVENT_HEARTBEAT_INTERVAL:
+                # Comment lines keep proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            with _event_published:
+                _event_published.wait(EVENT_POLL_INTERVAL)
+        # Carry the position forward even when every event was for other roles
+        yield f'id: {last_id}\n\n'
+    finally:
+        _stream_slots.release()
@@ -0,0 +1,203 @@
+import base64
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from flask import request
+from app import db
+from models import DataVersion
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+# Version group whose tables feed list aggregates; totals are cached per filtered query until it bumps
+AGGREGATES_VERSION = 'list_aggregates'
+AGGREGATES_CACHE_SIZE = 512
+
+# (version, statement, parameters) -> aggregate values, least recently used first
+_aggregates_cache = OrderedDict()
+_aggregates_lock = threading.Lock()
+
+def encode_cursor(value, row_id):
+    """Encode a (sort value, id) position as an opaque URL-safe token."""
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, column):
+    """Decode a cursor token back into a (sort value, id) pair typed for the sort column."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        python_type = column.type.python_type
+        if value is not None and python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif value is not None and python_type is date:
+            value = date.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _aggregates(query, aggregates):
+    """Totals over the whole filtered query, computed once per data version rather than on every page."""
+    names = list(aggregates)
+    statement = query.with_entities(*[aggregates[name] for name in names]).order_by(None).statement
+    compiled = statement.compile(db.session.get_bind())
+    key = (DataVersion.current(AGGREGATES_VERSION), str(compiled), tuple(sorted((name, repr(value)) for name, value in compiled.params.items())))
+    with _aggregates_lock:
+        values = _aggregates_cache.get(key)
+        if values is not None:
+            _aggregates_cache.move_to_end(key)
+            return dict(values)
+
+    row = db.session.execute(statement).one()
+    values = {name: value or 0 for name, value in zip(names, row)}
+    with _aggregates_lock:
+        _aggregates_cache[key] = values
+        while len(_aggregates_cache) > AGGREGATES_CACHE_SIZE:
+            _aggregates_cache.popitem(last=False)
+    return dict(values)
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+class KeysetPage:
+    """One page of a keyset-paginated list plus the parameters that produced it."""
+
+    def __init__(self, items, per_page, sort, order, params, next_cursor=None, prev_cursor=None, aggregates=None):
+        self.items = items
+        self.per_page = per_page
+        self.sort = sort
+        self.order = order
+        self.params = params
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.aggregates = aggregates or {}
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def link_args(self, **overrides):
+        """Query-string arguments for a link to another page of the same list."""
+        args = {key: value for key, value in self.params.items() if value not in (None, '')}
+        args.pop('cursor', None)
+        args.pop('before', None)
+        args.update({key: value for key, value in overrides.items() if value is not None})
+        return args
+
+    def to_dict(self, serialize):
+        return {
+            'items': [serialize(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'per_page': self.per_page,
+            'sort': self.sort,
+            'order': self.order,
+            'aggregates': self.aggregates,
+        }
+
+def paginate(query, id_column, sort_columns, default_sort, search_columns=(), date_column=None,
+             filters=None, aggregates=None, default_order='desc'):
+    """Filter, sort and keyset-paginate a query from the request's query string.
+
+    Recognised arguments: cursor / before (page tokens), per_page, sort (a key of
+    sort_columns), order (asc/desc), q (text search over search_columns),
+    date_from / date_to (YYYY-MM-DD, inclusive, on date_column) and any key of
+    filters (equality on the mapped column). Sort columns must be non-nullable, as a
+    cursor comparison never reaches a NULL. aggregates are cached until a table in the
+    list_aggregates version group changes, so only the page itself is read each time.
+    """
+    args = request.args
+    try:
+        per_page = min(max(int(args.get('per_page', DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    sort = args.get('sort') if args.get('sort') in sort_columns else default_sort
+    order = args.get('order') if args.get('order') in ('asc', 'desc') else default_order
+    params = {'per_page': per_page, 'sort': sort, 'order': order}
+
+    search = args.get('q', '').strip()
+    if search and search_columns:
+        pattern = f'%{_escape_like(search)}%'
+        query = query.filter(db.or_(*[column.ilike(pattern, escape='\\') for column in search_columns]))
+        params['q'] = search
+
+    if date_column is not None:
+        date_from = _parse_date(args.get('date_from'))
+        date_to = _parse_date(args.get('date_to'))
+        # Plain DATE columns must be compared with dates, not datetimes
+        as_date = date_column.type.python_type is date
+        if date_from:
+            query = query.filter(date_column >= (date_from.date() if as_date else date_from))
+            params['date_from'] = args.get('date_from')
+        if date_to:
+            end = date_to + timedelta(days=1)
+            query = query.filter(date_column < (end.date() if as_date else end))
+            params['date_to'] = args.get('date_to')
+
+    for name, column in (filters or {}).items():
+        if args.get(name):
+            query = query.filter(column == args.get(name))
+            params[name] = args.get(name)
+
+    page_aggregates = _aggregates(query, aggregates) if aggregates else {}
+
+    sort_column = sort_columns[sort]
+    if sort_column.expression.nullable:
+        raise ValueError(f'{sort_column} is nullable and cannot be keyset-paginated')
+    before = args.get('before')
+    token = before or args.get('cursor')
+    position = decode_cursor(token, sort_column) if token else None
+
+    # Walking backwards flips the comparison and the order, then the page is reversed
+    descending = (order == 'desc') != bool(before and position)
+    if position:
+        value, row_id = position
+        if descending:
+            condition = db.or_(sort_column < value, db.and_(sort_column == value, id_column < row_id))
+        else:
+            condition = db.or_(sort_column > value, db.and_(sort_column == value, id_column > row_id))
+        query = query.filter(condition)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if before and position:
+        rows.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, bool(position)
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    next_cursor = cursor_for(rows[-1]) if rows and has_next else None
+    prev_cursor = cursor_for(rows[0]) if rows and has_prev else None
+    return KeysetPage(rows, per_page, sort, order, params, next_cursor, prev_cursor, page_aggregates)
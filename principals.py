@@ -0,0 +1,105 @@
+import time
+import threading
+from collections import OrderedDict
+from flask import g
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import app, db
+from models import User, DataVersion
+from utils import ROLE_PERMISSIONS
+
+# user id -> (expires at, principal), least recently used first
+_principals = OrderedDict()
+# user id -> lowest version this process may cache, raised when an edit commits here
+_version_floors = {}
+_principals_lock = threading.Lock()
+
+def _version_name(user_id):
+    return f'user:{user_id}'
+
+class UserPrincipal(UserMixin):
+    """Read-only snapshot of the logged-in user that request handlers and templates read as current_user.
+
+    Attributes outside the snapshot (email, relationships, balance helpers) are read from the User row,
+    loaded at most once per request.
+    """
+    def __init__(self, id, username, full_name, role, active, profile_picture, version):
+        values = dict(id=id, username=username, full_name=full_name, role=role, active=bool(active),
+                      profile_picture=profile_picture, version=version or 0,
+                      permissions=frozenset(ROLE_PERMISSIONS.get(role, ())))
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    @property
+    def is_active(self):
+        return self.active
+
+    @property
+    def user(self):
+        """The User row, for pages that need more than the snapshot or change the user."""
+        # The identity map only holds rows weakly, so keep this one for the rest of the request
+        user = g.get('principal_user')
+        if user is None or user.id != self.id:
+            user = g.principal_user = db.session.get(User, self.id)
+        return user
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UserPrincipal is read-only; change current_user.user.{name} instead")
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.username} v{self.version}>'
+
+def _load_principal(user_id):
+    row = db.session.execute(
+        db.select(User.id, User.username, User.full_name, User.role, User.is_active, User.profile_picture,
+                  DataVersion.version)
+        .outerjoin(DataVersion, DataVersion.name == db.literal('user:') + db.cast(User.id, db.String))
+        .where(User.id == user_id)).first()
+    return UserPrincipal(*row) if row else None
+
+def get_principal(user_id):
+    """The cached principal for a user id, loaded with one query on a miss or once its TTL has passed."""
+    now = time.monotonic()
+    with _principals_lock:
+        entry = _principals.get(user_id)
+        if entry and entry[0] > now:
+            _principals.move_to_end(user_id)
+            return entry[1]
+
+    principal = _load_principal(user_id)
+    if principal is None:
+        return None
+    with _principals_lock:
+        # A request that read the row before an edit committed must not cache the old copy
+        if principal.version >= _version_floors.get(user_id, 0):
+            _principals[user_id] = (now + app.config['USER_CACHE_TTL'], principal)
+            _principals.move_to_end(user_id)
+            while len(_principals) > app.config['USER_CACHE_SIZE']:
+                _principals.popitem(last=False)
+    return principal
+
+def bump_user_version(user_id):
+    """Bump a user's version inside the current transaction; this process drops its cached copy on commit."""
+    name = _version_name(user_id)
+    DataVersion.bump(db.session.connection(), name)
+    db.session.info.setdefault('bumped_principals', {})[user_id] = DataVersion.current(name)
+
+@event.listens_for(Session, 'after_commit')
+def _forget_bumped_principals(session):
+    bumped = session.info.pop('bumped_principals', None)
+    if not bumped:
+        return
+    with _principals_lock:
+        for user_id, version in bumped.items():
+            _principals.pop(user_id, None)
+            _version_floors[user_id] = max(version, _version_floors.get(user_id, 0))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_bumped_principals(session):
+    session.info.pop('bumped_principals', None)
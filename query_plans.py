@@ -0,0 +1,119 @@
+import json
+from datetime import datetime, timedelta
+from app import db
+from models import (Contribution, Loan, Fine, Announcement, MeetingRecord, Document, Notification,
+                    MembershipApplication, Payment, DigitalReceipt, Vote, VotingProposal,
+                    UserBadge, ActivityLog, LoanInstallment, User)
+
+def hot_queries():
+    """The filter/sort shapes used by the busiest pages, keyed by a short description."""
+    soon = datetime.utcnow() + timedelta(days=7)
+    return {
+        'login usernames': User.username_prefix_query('sa'),
+        'contributions (member)': db.select(Contribution).where(Contribution.member_id == 1)
+            .order_by(Contribution.date_recorded.desc()),
+        'contributions (officer)': db.select(Contribution).where(Contribution.is_deleted == False)
+            .order_by(Contribution.date_recorded.desc()),
+        'loans (member)': db.select(Loan).where(Loan.member_id == 1, Loan.is_deleted == False)
+            .order_by(Loan.application_date.desc()),
+        'loans pending': db.select(Loan).where(Loan.status == 'Pending', Loan.is_deleted == False)
+            .order_by(Loan.application_date.desc()),
+        'loans active': db.select(Loan).where(Loan.status == 'Active', Loan.is_deleted == False)
+            .order_by(Loan.approval_date.desc()),
+        'loans due soon (member)': db.select(Loan).where(Loan.member_id == 1, Loan.status == 'Active',
+                                                          Loan.due_date <= soon).order_by(Loan.due_date),
+        'loans overdue': db.select(Loan).where(Loan.status == 'Active', Loan.is_deleted == False,
+                                               Loan.due_date < datetime.utcnow()),
+        'installments due this week': db.select(LoanInstallment).where(
+            LoanInstallment.is_settled == False, LoanInstallment.due_date >= datetime.utcnow(),
+            LoanInstallment.due_date < soon),
+        'installments (member)': db.select(LoanInstallment).where(LoanInstallment.member_id == 1,
+                                                                  LoanInstallment.due_date < soon),
+        'installments (loan)': db.select(LoanInstallment).where(LoanInstallment.loan_id == 1,
+                                                                LoanInstallment.is_settled == False)
+            .order_by(LoanInstallment.sequence),
+        'fines (member)': db.select(Fine).where(Fine.member_id == 1, Fine.is_paid == False, Fine.is_deleted == False)
+            .order_by(Fine.date_issued.desc()),
+        'fines (officer)': db.select(Fine).where(Fine.is_deleted == False).order_by(Fine.date_issued.desc()),
+        'notifications unread': db.select(Notification).where(Notification.user_id == 1, Notification.is_read == False)
+            .order_by(Notification.created_at.desc()),
+        'notifications inbox': db.select(Notification).where(Notification.user_id == 1)
+            .order_by(Notification.created_at.desc(), Notification.id.desc()).limit(25),
+        'vote lookup': db.select(Vote).where(Vote.proposal_id == 1, Vote.member_id == 1),
+        'proposals active': db.select(VotingProposal).where(VotingProposal.status == 'Active'),
+        'receipts (officer)': db.select(DigitalReceipt).order_by(DigitalReceipt.occurred_at.desc()),
+        'receipts (member)': db.select(DigitalReceipt).where(DigitalReceipt.owner_member_id == 1)
+            .order_by(DigitalReceipt.occurred_at.desc(), DigitalReceipt.id.desc()),
+        'payments recent': db.select(Payment).order_by(Payment.payment_date.desc()).limit(20),
+        'announcements': db.select(Announcement).where(Announcement.is_deleted == False)
+            .order_by(Announcement.date_created.desc()),
+        'meetings': db.select(MeetingRecord).order_by(MeetingRecord.date_held.desc()),
+        'documents': db.select(Document).order_by(Document.upload_date.desc()),
+        'membership applications': db.select(MembershipApplication)
+            .order_by(MembershipApplication.application_date.desc()),
+        'activity log': db.select(ActivityLog).order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(25),
+        'activity log (user)': db.select(ActivityLog).where(ActivityLog.user_id == 1)
+            .order_by(ActivityLog.timestamp.desc()),
+        'activity log (entity)': db.select(ActivityLog).where(ActivityLog.entity_type == 'loan', ActivityLog.entity_id == 1),
+        'activity log (action)': db.select(ActivityLog).where(ActivityLog.action == 'approved')
+            .order_by(ActivityLog.timestamp.desc()),
+        'directory badge counts': db.select(UserBadge.member_id, db.func.count(UserBadge.id))
+            .where(UserBadge.member_id.in_([1, 2, 3])).group_by(UserBadge.member_id),
+    }
+
+def _execute_explain(connection, prefix, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    return connection.exec_driver_sql(prefix + str(compiled), params).all()
+
+def _sqlite_full_scans(connection, statement):
+    tables = set(db.metadata.tables)
+    scans = []
+    for row in _execute_explain(connection, 'EXPLAIN QUERY PLAN ', statement):
+        detail = row[-1]
+        words = detail.split()
+        # "SCAN <table>" without "USING ... INDEX" reads every row of the table
+        if len(words) >= 2 and words[0] == 'SCAN' and words[1] in tables and 'USING' not in words:
+            scans.append(detail)
+    return scans
+
+def _postgresql_full_scans(connection, statement):
+    # Disable sequential scans so the planner only falls back to one when no index applies
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    plan = _execute_explain(connection, 'EXPLAIN (FORMAT JSON) ', statement)[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = []
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get('Plans', []):
+            walk(child)
+    walk(plan[0]['Plan'])
+    return scans
+
+def find_full_scans():
+    """Explain every hot query and return {description: [full scan details]} for those that scan a table."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        check = _sqlite_full_scans
+    elif dialect == 'postgresql':
+        check = _postgresql_full_scans
+    else:
+        raise RuntimeError(f'Query plan checks are not supported on {dialect}')
+
+    failures = {}
+    with db.engine.connect() as connection:
+        for description, statement in hot_queries().items():
+            transaction = connection.begin()
+            try:
+                scans = check(connection, statement)
+            finally:
+                transaction.rollback()
+            if scans:
+                failures[description] = scans
+    return failures
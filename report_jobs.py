@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import json
+import uuid
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from app import app
+from models import DataVersion
+
+# Background renderers shared by every request handled in this process
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='report')
+
+# A pending marker older than this belongs to a render that died with its worker
+REPORT_JOB_TIMEOUT = 600
+REPORT_CACHE_MAX_FILES = 50
+
+_JOB_ID = re.compile(r'^[a-z_]+-[0-9a-f]{32}$')
+
+def _render_financial_pdf():
+    from utils import generate_financial_report_pdf
+    return generate_financial_report_pdf()
+
+# report type -> (renderer, DataVersion name whose bump makes cached copies stale)
+REPORT_TYPES = {
+    'financial': (_render_financial_pdf, 'reports'),
+}
+
+def _cache_dir():
+    path = app.config['REPORT_CACHE_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _paths(job_id):
+    base = os.path.join(_cache_dir(), job_id)
+    return base + '.pdf', base + '.pending', base + '.failed'
+
+def report_job_id(report_type, params=None):
+    """Cache key for a report: its type, parameters and the current version of the data it reads."""
+    _, version_name = REPORT_TYPES[report_type]
+    key = json.dumps([report_type, params or {}, DataVersion.current(version_name)], sort_keys=True, default=str)
+    return f"{report_type}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}"
+
+def _is_stale(path):
+    return time.time() - os.path.getmtime(path) >= REPORT_JOB_TIMEOUT
+
+def _claim(pending_path):
+    """Create the pending marker for this render and return its token, or None if another render holds it.
+
+    A marker left by a render that died is taken over by renaming it aside: only one worker's
+    rename can succeed, so two workers never both reclaim it.
+    """
+    if os.path.exists(pending_path):
+        try:
+            if not _is_stale(pending_path):
+                return None
+            reclaimed = f'{pending_path}.{uuid.uuid4().hex}.reclaimed'
+            os.rename(pending_path, reclaimed)
+        except FileNotFoundError:
+            return None  # finished or reclaimed by another worker meanwhile
+        if not _is_stale(reclaimed):
+            # Another worker claimed it between our check and the rename; hand its marker back
+            try:
+                os.link(reclaimed, pending_path)
+            except FileExistsError:
+                pass
+            os.remove(reclaimed)
+            return None
+        os.remove(reclaimed)
+
+    token = uuid.uuid4().hex
+    try:
+        # Exclusive create so concurrent workers only start one render per key
+        fd = os.open(pending_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+def _release(pending_path, token):
+    # A render that outlived its timeout must not remove the marker of the render that replaced it
+    try:
+        with open(pending_path) as f:
+            if f.read() != token:
+                return
+        os.remove(pending_path)
+    except FileNotFoundError:
+        pass
+
+def submit_report(report_type, params=None, wait=False):
+    """Queue a report for rendering unless an up-to-date copy is cached or already being built. Returns the job id.
+
+    With wait=True the render runs on the calling thread instead, as scheduled pre-builds do.
+    """
+    job_id = report_job_id(report_type, params)
+    pdf_path, pending_path, failed_path = _paths(job_id)
+    if os.path.exists(pdf_path):
+        return job_id
+    token = _claim(pending_path)
+    if token is None:
+        return job_id
+    if os.path.exists(failed_path):
+        os.remove(failed_path)
+
+    if wait:
+        _render(job_id, report_type, params or {}, token)
+    else:
+        _executor.submit(_render, job_id, report_type, params or {}, token)
+    return job_id
+
+def _render(job_id, report_type, params, token):
+    renderer, _ = REPORT_TYPES[report_type]
+    pdf_path, pending_path, failed_path = _paths(job_id)
+    try:
+        with app.app_context():
+            buffer = renderer(**params)
+        # A unique temp file per render, so a reclaimed job never shares one with the render it replaced
+        fd, temp_path = tempfile.mkstemp(dir=_cache_dir(), prefix=job_id + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(temp_path, pdf_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        _prune_cache()
+    except Exception as e:
+        logging.error(f"Report job {job_id} failed: {str(e)}")
+        with open(failed_path, 'w') as f:
+            f.write(str(e))
+    finally:
+        _release(pending_path, token)
+
+def _prune_cache():
+    files = [os.path.join(_cache_dir(), name) for name in os.listdir(_cache_dir()) if name.endswith('.pdf')]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[REPORT_CACHE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    # Temp files of renders that died with their worker
+    for name in os.listdir(_cache_dir()):
+        if name.endswith('.tmp'):
+            try:
+                path = os.path.join(_cache_dir(), name)
+                if _is_stale(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+def report_status(job_id):
+    """Status of a report job: 'ready', 'pending', 'failed' or 'unknown'."""
+    if not _JOB_ID.match(job_id):
+        return {'job_id': job_id, 'status': 'unknown'}
+    pdf_path, pending_path, failed_path = _paths(job_id)
+    if os.path.exists(pdf_path):
+        return {'job_id': job_id, 'status': 'ready'}
+    if os.path.exists(failed_path):
+        with open(failed_path) as f:
+            return {'job_id': job_id, 'status': 'failed', 'error': f.read()}
+    if os.path.exists(pending_path):
+        if time.time() - os.path.getmtime(pending_path) < REPORT_JOB_TIMEOUT:
+            return {'job_id': job_id, 'status': 'pending'}
+        return {'job_id': job_id, 'status': 'failed', 'error': 'Report generation timed out'}
+    return {'job_id': job_id, 'status': 'unknown'}
+
+def report_path(job_id):
+    """Path of a rendered report, or None if it is not ready."""
+    if not _JOB_ID.match(job_id):
+        return None
+    pdf_path = _paths(job_id)[0]
+    return pdf_path if os.path.exists(pdf_path) else None
@@ -1,46 +1,18 @@
 import os
-import json
 from datetime import datetime, timedelta
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, make_response
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, make_response, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 from app import app, db
-from models import User, Contribution, Loan, LoanRepayment, Fine, Announcement, MeetingRecord, Document, Project, Notification, MembershipApplication, OfflineData, MemberPoints, UserBadge, Badge, Vote, VotingProposal, Payment, DigitalReceipt, WelfareContribution, WelfareExpense
+from models import User, MemberBalance, Contribution, Loan, LoanInstallment, LoanRepayment, Fine, Announcement, MeetingRecord, Document, Project, Notification, MembershipApplication, OfflineData, MemberPoints, UserBadge, Badge, Vote, VotingProposal, Payment, DigitalReceipt, WelfareContribution, WelfareExpense
 from forms import *
 from utils import *
 from utils import format_date, format_datetime
-
-# Notification helper functions
-def create_loan_notification(loan):
-    """Create notification for loan application."""
-    notification_users = User.query.filter(User.role.in_(['Admin', 'Treasurer', 'Secretary', 'Chairman']), User.is_active == True).all()
-
-    borrower_name = loan.borrower_name if loan.loan_type == 'External' else loan.member.full_name
-
-    for user in notification_users:
-        notification = Notification(
-            user_id=user.id,
-            title='New Loan Application',
-            message=f'{borrower_name} has applied for a {loan.loan_type.lower()} loan of {format_currency(loan.amount)}',
-            notification_type='loan_application'
-        )
-        db.session.add(notification)
-    db.session.commit()
-
-def create_payment_notification(payment_type, member_name, amount):
-    """Create notification for payments."""
-    notification_users = User.query.filter(User.role.in_(['Admin', 'Treasurer', 'Secretary', 'Chairman']), User.is_active == True).all()
-
-    for user in notification_users:
-        notification = Notification(
-            user_id=user.id,
-            title=f'New {payment_type} Payment',
-            message=f'{member_name} has made a {payment_type.lower()} payment of {format_currency(amount)}',
-            notification_type='payment_recorded'
-        )
-        db.session.add(notification)
-    db.session.commit()
+from pagination import paginate
+from principals import bump_user_version
+from notifications import create_loan_notification, create_payment_notification, publish_event, notify_roles
+from money_events import MoneyEvent
 
 def initialize_default_badges():
     """Initialize default badges in the database."""
@@ -122,26 +94,9 @@ def check_and_award_badges(member_id, activity_type):
             db.session.add(new_badge)
             badges_awarded.append("Consistent Saver")
 
-    db.session.commit()
-    return badges_awarded
-
-# Payment reminder functionality (placeholder)
-def send_payment_reminder(member_id, loan_id):
-    """Sends a payment reminder to a member."""
-    # In a real app, this would send an email or in-app notification
-    member = User.query.get(member_id)
-    loan = Loan.query.get(loan_id)
-    if member and loan:
-        print(f"Sending payment reminder to {member.full_name} for loan {loan.id}. Due: {loan.due_date}")
-        # Example: Create a notification
-        notification = Notification(
-            user_id=member_id,
-            title="Loan Payment Reminder",
-            message=f"Your loan payment of {format_currency(loan.remaining_amount)} is due on {format_date(loan.due_date)}.",
-            notification_type="payment_reminder"
-        )
-        db.session.add(notification)
+    if badges_awarded:
         db.session.commit()
+    return badges_awarded
 
 # Placeholder for delete functionality with reason
 def delete_record_with_reason(record, record_type, reason, deleted_by_user_id):
@@ -149,6 +104,15 @@ def delete_record_with_reason(record, record_type, reason, deleted_by_user_id):
     if not hasattr(record, 'is_deleted'):
         raise AttributeError(f"{record_type} record does not have 'is_deleted' attribute.")
 
+    # Reverse the record's effect on the member's balance snapshot
+    if not record.is_deleted:
+        if isinstance(record, Contribution):
+            MemberBalance.apply(record.member_id, savings=-record.amount)
+        elif isinstance(record, Loan) and record.status == 'Active':
+            MemberBalance.apply(record.member_id, loan_balance=-record.remaining_amount)
+        elif isinstance(record, Fine) and not record.is_paid:
+            MemberBalance.apply(record.member_id, unpaid_fines=-record.amount)
+
     record.is_deleted = True
     record.deletion_reason = reason
     record.deleted_by = deleted_by_user_id
@@ -188,18 +152,14 @@ def index():
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    """Login page with username dropdown."""
+    """Login page with username typeahead."""
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
 
     form = LoginForm()
 
-    # Populate username choices
-    active_users = User.query.filter_by(is_active=True).all()
-    form.username.choices = [(user.username, user.username) for user in active_users]
-
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data, is_active=True).first()
+        user = User.find_active(form.username.data)
 
         if user and check_password_hash(user.password_hash, form.password.data):
             # 2FA temporarily disabled - to be implemented in future
@@ -214,6 +174,34 @@ def login():
 
     return render_template('login.html', form=form)
 
+@app.route('/login/usernames')
+def login_usernames():
+    """Username suggestions for the login page, matched by prefix."""
+    if rate_limited(('login_usernames', request.remote_addr), app.config['USERNAME_LOOKUP_RATE_PER_MINUTE']):
+        return jsonify({'success': False, 'message': 'Too many requests, please slow down'}), 429
+
+    prefix = request.args.get('q', '')[:100]
+    usernames = []
+    if len(prefix.strip()) >= app.config['USERNAME_LOOKUP_MIN_PREFIX']:
+        usernames = User.search_usernames(prefix, limit=app.config['USERNAME_LOOKUP_LIMIT'])
+    response = jsonify({'success': True, 'usernames': usernames})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/choices/<kind>')
+@login_required
+def search_choices(kind):
+    """Search the member or loan choice lists for the searchable dropdowns."""
+    if kind == 'members':
+        choices = get_member_choices()
+    elif kind == 'loans' and has_permission(current_user, 'manage_finances'):
+        choices = get_loan_choices()
+    else:
+        return jsonify({'success': False, 'message': 'Unknown or forbidden choice list'}), 404
+
+    results = filter_choices(choices, request.args.get('q', ''), limit=min(request.args.get('limit', 20, type=int), 50))
+    return jsonify({'success': True, 'results': [{'id': value, 'text': label} for value, label in results]})
+
 @app.route('/verify-2fa/<int:user_id>', methods=['GET', 'POST'])
 def verify_2fa(user_id):
     """Verify Two-Factor Authentication - TEMPORARILY DISABLED."""
@@ -267,15 +255,11 @@ def dashboard():
     # Active proposals for voting
     active_proposals = VotingProposal.query.filter_by(status='Active').all()
 
-    # Active payment reminders (example)
+    # Installments due within a week or already in arrears
     active_reminders = []
     if current_user.role == 'Member':
-        # Fetch loans that are due soon or overdue
-        active_reminders = Loan.query.filter(
-            Loan.member_id == current_user.id,
-            Loan.status == 'Active',
-            Loan.due_date <= datetime.utcnow() + timedelta(days=7) # Due within a week
-        ).order_by(Loan.due_date).all()
+        active_reminders = (LoanInstallment.open_due(before=datetime.utcnow() + timedelta(days=7))
+                            .filter(LoanInstallment.member_id == current_user.id).all())
 
 
     return render_template('dashboard.html', 
@@ -365,6 +349,7 @@ def edit_member(member_id):
         if form.password.data:  # Only update password if provided
             member.password_hash = generate_password_hash(form.password.data)
 
+        bump_user_version(member.id)
         db.session.commit()
         flash(f'Member {member.full_name} has been updated successfully', 'success')
         return redirect(url_for('members'))
@@ -385,6 +370,7 @@ def deactivate_member(member_id):
         return redirect(url_for('members'))
 
     member.is_active = False
+    bump_user_version(member.id)
     db.session.commit()
     flash(f'Member {member.full_name} has been deactivated', 'success')
     return redirect(url_for('members'))
@@ -397,14 +383,27 @@ def contributions():
         flash('You do not have permission to view this page', 'error')
         return redirect(url_for('dashboard'))
 
+    page = contribution_page()
+    return render_template('contributions.html', contributions=page, page=page, is_member_view=current_user.role == 'Member')
+
+def contribution_page():
+    """Current user's view of contributions, filtered and paginated from the query string."""
+    query = Contribution.query.join(User, Contribution.member_id == User.id)
     if current_user.role == 'Member':
         # Members see only their own contributions
-        user_contributions = Contribution.query.filter_by(member_id=current_user.id).order_by(Contribution.date_recorded.desc()).all()
-        return render_template('contributions.html', contributions=user_contributions, is_member_view=True)
+        query = query.filter(Contribution.member_id == current_user.id)
     else:
         # Treasurer/Admin see all contributions (excluding deleted ones)
-        all_contributions = Contribution.query.filter_by(is_deleted=False).order_by(Contribution.date_recorded.desc()).all()
-        return render_template('contributions.html', contributions=all_contributions, is_member_view=False)
+        query = query.filter(Contribution.is_deleted == False)
+
+    return paginate(query, Contribution.id,
+                    sort_columns={'date': Contribution.date_recorded, 'amount': Contribution.amount},
+                    default_sort='date',
+                    search_columns=(User.full_name, Contribution.contribution_type, Contribution.notes),
+                    date_column=Contribution.date_recorded,
+                    filters={'contribution_type': Contribution.contribution_type},
+                    aggregates={'total_amount': db.func.sum(Contribution.amount),
+                                'count': db.func.count(Contribution.id)})
 
 @app.route('/contributions/add', methods=['GET', 'POST'])
 @login_required
@@ -417,97 +416,117 @@ def add_contribution():
     form = ContributionForm()
 
     # Populate member choices
-    active_members = User.query.filter_by(is_active=True).all()
-    form.member_id.choices = [(member.id, member.full_name) for member in active_members]
+    form.member_id.choices = get_member_choices()
 
     if form.validate_on_submit():
+        member = User.query.get(form.member_id.data)
+        event = MoneyEvent('contribution')
+
         contribution = Contribution(
-            member_id=form.member_id.data,
+            member_id=member.id,
             amount=form.amount.data,
             contribution_type=form.contribution_type.data,
             notes=form.notes.data,
-            recorded_by=current_user.id
+            recorded_by=current_user.id,
+            date_recorded=datetime.utcnow()
         )
-
         db.session.add(contribution)
-        db.session.commit()
-
-        member = User.query.get(form.member_id.data)
+        MemberBalance.apply(contribution.member_id, savings=contribution.amount)
+        event.issue_receipt(member.id, contribution.amount, contribution.date_recorded, {
+            'type': 'contribution',
+            'amount': contribution.amount,
+            'member': member.full_name,
+            'date': contribution.date_recorded.isoformat(),
+            'recorded_by': current_user.full_name
+        }, contribution=contribution)
+
+        event.after_commit(create_payment_notification, 'Contribution', member.full_name, contribution.amount)
+        # Award badges for consistent saving
+        event.in_background(check_and_award_badges, member.id, 'contribution')
 
-        # Create notification for payment recording
         try:
-            create_payment_notification('Contribution', member.full_name, form.amount.data)
-        except:
-            pass  # Continue even if notification fails
+            event.commit()
+        except Exception as e:
+            app.logger.error(f'Contribution recording error: {str(e)}')
+            flash('Contribution could not be recorded. Please try again.', 'error')
+            return render_template('contributions.html', form=form, action='Add')
 
-        # Generate digital receipt
-        try:
-            receipt_number = f"CONT{datetime.now().strftime('%Y%m%d')}{contribution.id:04d}"
-            qr_data = {
-                'receipt_number': receipt_number,
-                'type': 'contribution',
-                'amount': contribution.amount,
-                'member': member.full_name,
-                'date': contribution.date_recorded.isoformat(),
-                'recorded_by': current_user.full_name
-            }
+        flash(f'Contribution of {format_currency(contribution.amount)} recorded for {member.full_name}. Receipt #{event.receipt_number} generated.', 'success')
+        return redirect(url_for('contributions'))
 
-            # Placeholder for actual QR code generation and storage
-            digital_receipt = DigitalReceipt(
-                payment_id=None, # This is a contribution, not a direct payment record in the Payment table
-                contribution_id=contribution.id, # Link to contribution
-                receipt_number=receipt_number,
-                qr_code_data=json.dumps(qr_data),
-                generated_at=datetime.utcnow()
-            )
-            db.session.add(digital_receipt)
-            db.session.commit()
+    return render_template('contributions.html', form=form, action='Add')
 
-            flash(f'Contribution of {format_currency(form.amount.data)} recorded for {member.full_name}. Receipt #{receipt_number} generated.', 'success')
-        except Exception as e:
-            flash(f'Contribution recorded but receipt generation failed: {str(e)}', 'warning')
+@app.route('/contributions/import', methods=['GET', 'POST'])
+@login_required
+def import_contributions():
+    """Record a batch of contributions from a CSV file or pasted rows (Treasurer/Admin only)."""
+    if not has_permission(current_user, 'record_contributions'):
+        flash('You do not have permission to record contributions', 'error')
+        return redirect(url_for('contributions'))
 
-        # Award badges for consistent saving
-        try:
-            badges_awarded = check_and_award_badges(member.id, 'contribution')
-            if badges_awarded:
-                flash(f'Congratulations! {member.full_name} earned badges: {", ".join(badges_awarded)}', 'info')
-        except:
-            pass
+    from contribution_import import parse_rows, member_lookup, validate_rows, import_contributions as record_batch
+    import_form = ContributionImportForm()
+    import_errors = []
 
-        return redirect(url_for('contributions'))
+    if import_form.validate_on_submit():
+        if import_form.file.data:
+            text = import_form.file.data.read().decode('utf-8-sig', errors='replace')
+        else:
+            text = import_form.rows.data or ''
+        rows = parse_rows(text)
+        entries, import_errors = validate_rows(rows, member_lookup())
+        if not rows:
+            flash('Upload a CSV file or paste at least one row', 'error')
+        elif import_errors:
+            # Nothing is recorded until every row is valid
+            import_form.rows.data = text
+            flash(f'{len(import_errors)} of {len(rows)} rows need fixing; nothing was recorded.', 'error')
+        else:
+            try:
+                total = record_batch(entries, current_user)
+            except Exception as e:
+                app.logger.error(f'Contribution import error: {str(e)}')
+                flash('Contributions could not be imported. Please try again.', 'error')
+            else:
+                flash(f'{len(entries)} contributions totalling {format_currency(total)} recorded, with receipts.', 'success')
+                return redirect(url_for('contributions'))
 
-    return render_template('contributions.html', form=form, action='Add')
+    return render_template('contributions.html', import_form=import_form, import_errors=import_errors[:50],
+                           import_error_count=len(import_errors), action='Import')
 
 @app.route('/loans')
 @login_required
 def loans():
     """Loans management page."""
-    if current_user.role == 'Member':
-        # Members see only their own loans
-        user_loans = Loan.query.filter_by(member_id=current_user.id, is_deleted=False).order_by(Loan.application_date.desc()).all()
-        return render_template('loans.html', loans=user_loans, is_member_view=True, form=None, action=None)
-    elif has_permission(current_user, 'approve_loans'):
-        # Admin View: Applied, Existing, Expired Loans
-        applied_loans = Loan.query.filter_by(status='Pending', is_deleted=False).order_by(Loan.application_date.desc()).all()
-        existing_loans = Loan.query.filter_by(status='Active', is_deleted=False).order_by(Loan.approval_date.desc()).all()
-        expired_loans = Loan.query.filter_by(status='Expired', is_deleted=False).order_by(Loan.due_date.desc()).all()
-        
-        # For repayment mode, we'll need to infer it from the loan details or add a specific field
-        # Repayment Mode could be a string like 'Weekly', 'Monthly', 'Lump Sum' stored in the Loan model
-        # Assuming 'repayment_mode' field exists in Loan model:
-        # loans_with_mode = Loan.query.filter_by(is_deleted=False).all()
-        
-        return render_template('loans.html', 
-                               applied_loans=applied_loans,
-                               existing_loans=existing_loans,
-                               expired_loans=expired_loans,
-                               is_member_view=False,
-                               form=None, action=None)
-    else:
+    if current_user.role != 'Member' and not has_permission(current_user, 'approve_loans'):
         flash('You do not have permission to view this page', 'error')
         return redirect(url_for('dashboard'))
 
+    # Officers narrow the list with ?status=Pending/Active/Expired/... instead of separate tables
+    page = loan_page()
+    return render_template('loans.html', loans=page, page=page, is_member_view=current_user.role == 'Member', form=None, action=None)
+
+def loan_page():
+    """Current user's view of loans, filtered and paginated from the query string."""
+    query = Loan.query.outerjoin(User, Loan.member_id == User.id).filter(Loan.is_deleted == False)
+    if current_user.role == 'Member':
+        # Members see only their own loans
+        query = query.filter(Loan.member_id == current_user.id)
+
+    def count_status(status):
+        return db.func.count(db.case((Loan.status == status, 1)))
+
+    return paginate(query, Loan.id,
+                    sort_columns={'applied': Loan.application_date, 'amount': Loan.amount},
+                    default_sort='applied',
+                    search_columns=(User.full_name, Loan.borrower_name, Loan.purpose),
+                    date_column=Loan.application_date,
+                    filters={'status': Loan.status, 'loan_type': Loan.loan_type},
+                    aggregates={'count': db.func.count(Loan.id),
+                                'pending': count_status('Pending'),
+                                'active': count_status('Active'),
+                                'completed': count_status('Completed')})
+
 @app.route('/loans/apply', methods=['GET', 'POST'])
 @login_required
 def apply_loan():
@@ -519,8 +538,7 @@ def apply_loan():
     form = LoanApplicationForm()
 
     # Populate guarantor choices for external loans
-    active_members = User.query.filter_by(is_active=True).all()
-    form.guarantor_id.choices = [(0, 'Select Guarantor')] + [(member.id, member.full_name) for member in active_members]
+    form.guarantor_id.choices = [(0, 'Select Guarantor')] + get_member_choices()
 
     # Calculate and display loan limit
     total_savings = current_user.get_total_contributions() # Assuming contributions are savings
@@ -633,6 +651,9 @@ def approve_loan(loan_id):
             interest = form.amount.data * (form.interest_rate.data / 100) * (int(form.duration_months.data) / 12)
             total_repayment = form.amount.data + interest
 
+            # Outstanding balance this loan currently contributes to the member's snapshot
+            previous_balance = loan.remaining_amount if loan.status == 'Active' and not loan.is_deleted else 0.0
+
             loan.amount = form.amount.data
             loan.remaining_amount = total_repayment
             loan.interest_rate = form.interest_rate.data
@@ -645,8 +666,13 @@ def approve_loan(loan_id):
             loan.repayment_mode = form.repayment_mode.data # Update repayment mode
 
             if form.status.data == 'Active':
-                # Set due date based on duration and start date (e.g., approval date)
-                loan.due_date = datetime.utcnow() + timedelta(days=int(form.duration_months.data) * 30) # Approximation
+                # The installment schedule sets the due date to the final installment
+                LoanInstallment.generate(loan, loan.approval_date)
+            else:
+                LoanInstallment.query.filter_by(loan_id=loan.id).delete()
+
+            new_balance = loan.remaining_amount if loan.status == 'Active' and not loan.is_deleted else 0.0
+            MemberBalance.apply(loan.member_id, loan_balance=new_balance - previous_balance)
 
             db.session.commit()
 
@@ -727,9 +753,50 @@ def activity_log():
         flash('You do not have permission to view activity logs', 'error')
         return redirect(url_for('dashboard'))
 
-    from activity_logger import get_recent_activities
-    activities = get_recent_activities(100)
-    return render_template('activity_log.html', activities=activities)
+    from activity_logger import activity_query
+    from models import ActivityLog
+    page = paginate(activity_query(), ActivityLog.id,
+                    sort_columns={'date': ActivityLog.timestamp},
+                    default_sort='date',
+                    search_columns=(ActivityLog.description,),
+                    date_column=ActivityLog.timestamp,
+                    filters={'user': ActivityLog.user_id,
+                             'entity': ActivityLog.entity_type,
+                             'action': ActivityLog.action})
+
+    filter_options = {
+        'user': [(str(user_id), name) for user_id, name in
+                 db.session.execute(db.select(User.id, User.full_name).order_by(User.full_name))],
+        'entity': [(value, value.replace('_', ' ').title()) for value in
+                   db.session.scalars(db.select(ActivityLog.entity_type).distinct().order_by(ActivityLog.entity_type))],
+        'action': [(value, value.replace('_', ' ').title()) for value in
+                   db.session.scalars(db.select(ActivityLog.action).distinct().order_by(ActivityLog.action))],
+    }
+    return render_template('activity_log.html', activities=page, page=page, filter_options=filter_options)
+
+@app.route('/admin/activity-log/archive')
+@login_required
+def activity_log_archive():
+    """Browse the file-based activity log kept from before activity moved into the database (Admin only)."""
+    if current_user.role != 'Admin':
+        flash('You do not have permission to view activity logs', 'error')
+        return redirect(url_for('dashboard'))
+
+    from activity_archive import read_activities
+    filters = {name: request.args.get(name, '').strip() for name in ('date_from', 'date_to', 'user', 'q')}
+    try:
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d') if filters['date_from'] else None
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1) if filters['date_to'] else None
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('activity_log_archive'))
+
+    activities, next_cursor = read_activities(limit=50, cursor=request.args.get('cursor'),
+                                              date_from=date_from, date_to=date_to,
+                                              user=filters['user'] or None, search=filters['q'] or None)
+    users = [name for name in db.session.scalars(db.select(User.full_name).order_by(User.full_name))] + ['System']
+    return render_template('activity_log_archive.html', activities=activities, next_cursor=next_cursor,
+                           filters=filters, users=users, paged=bool(request.args.get('cursor')))
 
 @app.route('/admin/clear-activity-log', methods=['POST'])
 @login_required
@@ -757,23 +824,12 @@ def loan_repayment():
 
     form = LoanRepaymentForm()
 
-    # Populate active loan choices
-    active_loans = Loan.query.filter_by(status='Active', is_deleted=False).all()
-    form.loan_id.choices = [('', 'Select a loan to process repayment...')]
-
-    for loan in active_loans:
-        if loan.loan_type == 'Internal' and loan.member:
-            borrower_name = loan.member.full_name
-        elif loan.loan_type == 'External' and loan.borrower_name:
-            borrower_name = loan.borrower_name
-        else:
-            borrower_name = 'Unknown Borrower'
-
-        form.loan_id.choices.append((loan.id, f"{borrower_name} - {format_currency(loan.remaining_amount)}"))
-    
-    # If no active loans, update placeholder message
-    if len(form.loan_id.choices) == 1:
-        form.loan_id.choices = [('', 'No active loans available for repayment')]
+    # Populate active loan choices; the placeholder is 0 so the int coercion accepts it and DataRequired rejects it
+    loan_choices = get_loan_choices()
+    if loan_choices:
+        form.loan_id.choices = [(0, 'Select a loan to process repayment...')] + loan_choices
+    else:
+        form.loan_id.choices = [(0, 'No active loans available for repayment')]
 
     if form.validate_on_submit():
         try:
@@ -788,70 +844,47 @@ def loan_repayment():
                 flash('Repayment amount cannot exceed remaining loan balance', 'error')
                 return render_template('loans.html', form=form, action='Repayment', loans=[], is_member_view=False)
 
+            borrower_name = loan.member.full_name if loan.member else loan.borrower_name
+            settles_loan = round(loan.remaining_amount - repayment_amount, 2) <= 0
+            # Only the settling repayment gets a receipt
+            event = MoneyEvent('loan_repayment' if settles_loan else None)
+
             # Record repayment
             repayment = LoanRepayment(
                 loan_id=loan.id,
                 amount=repayment_amount,
-                recorded_by=current_user.id
+                recorded_by=current_user.id,
+                date_paid=datetime.utcnow()
             )
+            db.session.add(repayment)
 
             # Update loan balance
-            loan.remaining_amount -= repayment_amount
+            loan.remaining_amount = round(loan.remaining_amount - repayment_amount, 2)
+            MemberBalance.apply(loan.member_id, loan_balance=-repayment_amount)
+            LoanInstallment.apply_payment(loan.id, repayment_amount, repayment.date_paid)
 
-            # Mark loan as completed if fully paid
-            if loan.remaining_amount <= 0:
+            # Mark loan as completed if fully paid, with a settlement receipt
+            if settles_loan:
                 loan.status = 'Completed'
+                event.issue_receipt(loan.member_id, repayment_amount, repayment.date_paid, {
+                    'type': 'loan_settlement',
+                    'amount': repayment_amount, # Amount of the final payment
+                    'loan_id': loan.id,
+                    'member': borrower_name,
+                    'date': repayment.date_paid.isoformat(),
+                    'recorded_by': current_user.full_name
+                }, loan_repayment=repayment)
                 # Consider awarding "On-Time Payment" badge if applicable
-                try:
-                    check_and_award_badges(loan.member_id, 'loan_repayment')
-                except:
-                    pass # Ignore errors in badge awarding
+                event.in_background(check_and_award_badges, loan.member_id, 'loan_repayment')
 
-            db.session.add(repayment)
-            db.session.commit()
-
-            # Determine borrower name for notification
-            borrower_name = loan.member.full_name if loan.member else loan.borrower_name
-
-            # Log activity
-            try:
-                from activity_logger import log_activity
-                log_activity('recorded', 'loan_repayment', repayment.id, f'Recorded loan repayment of {format_currency(repayment_amount)} for {borrower_name}')
-            except:
-                pass  # Continue even if logging fails
-
-            # Create payment notification
-            try:
-                create_payment_notification('Loan Repayment', borrower_name, repayment_amount)
-            except:
-                pass # Continue even if notification fails
-                
-            # Generate digital receipt for loan settlement
-            if loan.remaining_amount <= 0 and loan.status == 'Completed':
-                try:
-                    receipt_number = f"LOANSETTLE{datetime.now().strftime('%Y%m%d')}{loan.id:04d}"
-                    qr_data = {
-                        'receipt_number': receipt_number,
-                        'type': 'loan_settlement',
-                        'amount': repayment_amount, # Amount of the final payment
-                        'loan_id': loan.id,
-                        'member': borrower_name,
-                        'date': datetime.utcnow().isoformat(),
-                        'recorded_by': current_user.full_name
-                    }
-                    digital_receipt = DigitalReceipt(
-                        payment_id=None, # Not from Payment table directly
-                        loan_repayment_id=repayment.id, # Link to the repayment record
-                        receipt_number=receipt_number,
-                        qr_code_data=json.dumps(qr_data),
-                        generated_at=datetime.utcnow()
-                    )
-                    db.session.add(digital_receipt)
-                    db.session.commit()
-                    flash(f'Loan settled successfully. Receipt #{receipt_number} generated.', 'success')
-                except Exception as e:
-                    flash(f'Loan repayment recorded, but settlement receipt generation failed: {str(e)}', 'warning')
+            from activity_logger import log_activity
+            event.after_commit(lambda: log_activity('recorded', 'loan_repayment', repayment.id,
+                                                    f'Recorded loan repayment of {format_currency(repayment_amount)} for {borrower_name}'))
+            event.after_commit(create_payment_notification, 'Loan Repayment', borrower_name, repayment_amount)
+            event.commit()
 
+            if settles_loan:
+                flash(f'Loan settled successfully. Receipt #{event.receipt_number} generated.', 'success')
             flash(f'Repayment of {format_currency(repayment_amount)} recorded for {borrower_name}', 'success')
             return redirect(url_for('loans'))
         except Exception as e:
@@ -865,15 +898,13 @@ def loan_repayment():
 def fines():
     """Fines management page."""
     if current_user.role == 'Member':
-        # Members see only their own unpaid fines (settled fines disappear from view)
-        user_fines = Fine.query.filter_by(member_id=current_user.id, is_paid=False, is_deleted=False).order_by(Fine.date_issued.desc()).all()
-        return render_template('contributions.html', fines=user_fines, is_member_view=True, show_fines=True)
+        page = fine_page()
+        return render_template('contributions.html', fines=page, page=page, is_member_view=True, show_fines=True)
     elif has_permission(current_user, 'issue_fines'):
         form = FineForm()
 
         # Populate member choices
-        active_members = User.query.filter_by(is_active=True).all()
-        form.member_id.choices = [(member.id, member.full_name) for member in active_members]
+        form.member_id.choices = get_member_choices()
 
         if form.validate_on_submit():
             fine = Fine(
@@ -885,6 +916,7 @@ def fines():
             )
 
             db.session.add(fine)
+            MemberBalance.apply(fine.member_id, unpaid_fines=fine.amount)
             db.session.commit()
 
             member = User.query.get(form.member_id.data)
@@ -898,18 +930,43 @@ def fines():
             
             return redirect(url_for('fines'))
 
-        all_fines = Fine.query.filter_by(is_deleted=False).order_by(Fine.date_issued.desc()).all()
-        return render_template('contributions.html', fines=all_fines, form=form, is_member_view=False, show_fines=True)
+        page = fine_page()
+        return render_template('contributions.html', fines=page, page=page, form=form, is_member_view=False, show_fines=True)
     else:
         flash('You do not have permission to view this page', 'error')
         return redirect(url_for('dashboard'))
 
+def fine_page():
+    """Current user's view of fines, filtered and paginated from the query string."""
+    query = Fine.query.join(User, Fine.member_id == User.id).filter(Fine.is_deleted == False)
+    if current_user.role == 'Member':
+        # Members see only their own unpaid fines (settled fines disappear from view)
+        query = query.filter(Fine.member_id == current_user.id, Fine.is_paid == False)
+
+    return paginate(query, Fine.id,
+                    sort_columns={'date': Fine.date_issued, 'amount': Fine.amount},
+                    default_sort='date',
+                    search_columns=(User.full_name, Fine.fine_type, Fine.reason),
+                    date_column=Fine.date_issued,
+                    filters={'fine_type': Fine.fine_type},
+                    aggregates={'total_amount': db.func.sum(Fine.amount),
+                                'unpaid_amount': db.func.sum(db.case((Fine.is_paid == False, Fine.amount), else_=0)),
+                                'paid_amount': db.func.sum(db.case((Fine.is_paid == True, Fine.amount), else_=0))})
+
 @app.route('/announcements')
 @login_required
 def announcements():
     """Announcements page."""
-    all_announcements = Announcement.query.filter_by(is_deleted=False).order_by(Announcement.date_created.desc()).all()
-    return render_template('announcements.html', announcements=all_announcements)
+    page = announcement_page()
+    return render_template('announcements.html', announcements=page, page=page)
+
+def announcement_page():
+    """Announcements filtered and paginated from the query string."""
+    return paginate(Announcement.query.filter(Announcement.is_deleted == False), Announcement.id,
+                    sort_columns={'date': Announcement.date_created},
+                    default_sort='date',
+                    search_columns=(Announcement.title, Announcement.content),
+                    date_column=Announcement.date_created)
 
 @app.route('/announcements/add', methods=['GET', 'POST'])
 @login_required
@@ -932,6 +989,12 @@ def add_announcement():
         db.session.add(announcement)
         db.session.commit()
 
+        try:
+            publish_event('announcement_posted', {'announcement_id': announcement.id, 'is_urgent': announcement.is_urgent,
+                                                  'text': f'New announcement: {announcement.title}'})
+        except:
+            pass  # Continue even if the live update fails
+
         flash('Announcement created successfully', 'success')
         return redirect(url_for('announcements'))
 
@@ -941,8 +1004,16 @@ def add_announcement():
 @login_required
 def meetings():
     """Meeting records page."""
-    all_meetings = MeetingRecord.query.order_by(MeetingRecord.date_held.desc()).all()
-    return render_template('announcements.html', meetings=all_meetings, show_meetings=True)
+    page = meeting_page()
+    return render_template('announcements.html', meetings=page, page=page, show_meetings=True)
+
+def meeting_page():
+    """Meeting records filtered and paginated from the query string."""
+    return paginate(MeetingRecord.query.filter(MeetingRecord.is_deleted == False), MeetingRecord.id,
+                    sort_columns={'date': MeetingRecord.date_held},
+                    default_sort='date',
+                    search_columns=(MeetingRecord.title, MeetingRecord.agenda, MeetingRecord.minutes),
+                    date_column=MeetingRecord.date_held)
 
 @app.route('/meetings/add', methods=['GET', 'POST'])
 @login_required
@@ -977,8 +1048,24 @@ def add_meeting():
 @login_required
 def documents():
     """Documents management page."""
-    all_documents = Document.query.order_by(Document.upload_date.desc()).all()
-    return render_template('documents.html', documents=all_documents)
+    page = document_page()
+    return render_template('documents.html', documents=page, page=page)
+
+def document_page():
+    """Documents filtered and paginated from the query string."""
+    def count_types(*file_types):
+        return db.func.count(db.case((Document.file_type.in_(file_types), 1)))
+
+    return paginate(Document.query, Document.id,
+                    sort_columns={'date': Document.upload_date, 'title': Document.title},
+                    default_sort='date',
+                    search_columns=(Document.title, Document.description),
+                    date_column=Document.upload_date,
+                    filters={'category': Document.category},
+                    aggregates={'count': db.func.count(Document.id),
+                                'pdf': count_types('pdf'),
+                                'word': count_types('doc', 'docx'),
+                                'image': count_types('jpg', 'jpeg', 'png')})
 
 @app.route('/documents/upload', methods=['GET', 'POST'])
 @login_required
@@ -1070,9 +1157,11 @@ def reports():
         db.func.sum(Contribution.amount).label('total')
     ).group_by(db.func.date_trunc('month', Contribution.date_recorded)).order_by('month').all()
 
-    # You can add more report generation logic here (e.g., loan performance, fine collection)
+    # Expected loan repayments per week from the open installment schedules
+    from forecast import cash_flow_forecast
+    forecast = cash_flow_forecast()
 
-    return render_template('reports.html', stats=stats, monthly_contributions=monthly_contributions)
+    return render_template('reports.html', stats=stats, monthly_contributions=monthly_contributions, forecast=forecast)
 
 @app.route('/reports/export/<format>')
 @login_required
@@ -1083,33 +1172,77 @@ def export_report(format):
         return redirect(url_for('reports'))
 
     if format == 'pdf':
-        try:
-            from utils import generate_financial_report_pdf
-            buffer = generate_financial_report_pdf()
-            return send_file(buffer, as_attachment=True, 
-                           download_name=f"pamoja_financial_report_{datetime.now().strftime('%Y%m%d')}.pdf",
-                           mimetype='application/pdf')
-        except Exception as e:
-            flash(f'Error generating PDF report: {str(e)}', 'error')
-            return redirect(url_for('reports'))
+        from report_jobs import submit_report, report_status
+        job_id = submit_report('financial')
+        status = report_status(job_id)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(_report_job_payload(status))
+        if status['status'] == 'ready':
+            return redirect(url_for('download_report_job', job_id=job_id))
+        return render_template('report_job.html', job_id=job_id)
 
     elif format == 'csv':
+        from utils import generate_financial_report_csv, CSV_LEDGERS
+        ledger = request.args.get('ledger', 'summary')
+        if ledger not in CSV_LEDGERS:
+            flash('Invalid ledger selected for export', 'error')
+            return redirect(url_for('reports'))
+
         try:
-            from utils import generate_financial_report_csv
-            from io import BytesIO
-            csv_data = generate_financial_report_csv()
-            
-            return send_file(BytesIO(csv_data.encode('utf-8')), as_attachment=True,
-                           download_name=f"pamoja_financial_report_{datetime.now().strftime('%Y%m%d')}.csv",
-                           mimetype='text/csv')
-        except Exception as e:
-            flash(f'Error generating CSV report: {str(e)}', 'error')
+            date_from = request.args.get('date_from')
+            date_to = request.args.get('date_to')
+            date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+            date_to = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1) if date_to else None
+        except ValueError:
+            flash('Dates must be in YYYY-MM-DD format', 'error')
             return redirect(url_for('reports'))
 
+        # Stream the rows as they are read instead of building the file in memory
+        filename = f"pamoja_{ledger}_report_{datetime.now().strftime('%Y%m%d')}.csv"
+        return Response(stream_with_context(generate_financial_report_csv(ledger, date_from, date_to)),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
     else:
         flash('Invalid export format', 'error')
         return redirect(url_for('reports'))
 
+def _report_job_payload(status):
+    payload = dict(status, success=status['status'] != 'failed')
+    if status['status'] == 'ready':
+        payload['download_url'] = url_for('download_report_job', job_id=status['job_id'])
+    return payload
+
+@app.route('/reports/jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    """Poll the status of a background report job."""
+    if not has_permission(current_user, 'manage_finances') and current_user.role != 'Admin':
+        return jsonify({'success': False, 'error': 'Permission denied'}), 403
+
+    from report_jobs import report_status
+    status = report_status(job_id)
+    if status['status'] == 'unknown':
+        return jsonify(dict(status, success=False, error='Report job not found')), 404
+    return jsonify(_report_job_payload(status))
+
+@app.route('/reports/jobs/<job_id>/download')
+@login_required
+def download_report_job(job_id):
+    """Download a rendered report from the cache."""
+    if not has_permission(current_user, 'manage_finances') and current_user.role != 'Admin':
+        flash('You do not have permission to export reports', 'error')
+        return redirect(url_for('reports'))
+
+    from report_jobs import report_path
+    path = report_path(job_id)
+    if not path:
+        flash('That report is no longer available, please export it again', 'error')
+        return redirect(url_for('reports'))
+    return send_file(path, as_attachment=True,
+                     download_name=f"pamoja_financial_report_{datetime.now().strftime('%Y%m%d')}.pdf",
+                     mimetype='application/pdf')
+
 @app.route('/profile')
 @login_required
 def profile():
@@ -1120,7 +1253,8 @@ def profile():
 @login_required
 def edit_profile():
     """Edit user profile."""
-    form = MemberForm(obj=current_user)
+    user = current_user.user
+    form = MemberForm(obj=user)
 
     if form.validate_on_submit():
         try:
@@ -1147,28 +1281,29 @@ def edit_profile():
                     file.save(file_path)
 
                     # Delete old profile picture if it exists
-                    if current_user.profile_picture:
-                        old_file_path = os.path.join(app.config['UPLOAD_FOLDER'], current_user.profile_picture)
+                    if user.profile_picture:
+                        old_file_path = os.path.join(app.config['UPLOAD_FOLDER'], user.profile_picture)
                         if os.path.exists(old_file_path):
                             os.remove(old_file_path)
 
-                    current_user.profile_picture = filename
+                    user.profile_picture = filename
                 else:
                     flash('Invalid file type. Please upload JPG, JPEG, or PNG images only.', 'error')
                     return render_template('profile.html', form=form, action='Edit')
 
-            current_user.username = form.username.data
-            current_user.full_name = form.full_name.data
-            current_user.email = form.email.data
-            current_user.phone = form.phone.data
+            user.username = form.username.data
+            user.full_name = form.full_name.data
+            user.email = form.email.data
+            user.phone = form.phone.data
 
             # Only admin can change role
             if current_user.role == 'Admin':
-                current_user.role = form.role.data
+                user.role = form.role.data
 
             if form.password.data:  # Only update password if provided
-                current_user.password_hash = generate_password_hash(form.password.data)
+                user.password_hash = generate_password_hash(form.password.data)
 
+            bump_user_version(user.id)
             db.session.commit()
             flash('Profile updated successfully', 'success')
             return redirect(url_for('profile'))
@@ -1195,7 +1330,8 @@ def change_password():
             flash('New passwords do not match', 'error')
             return redirect(url_for('profile'))
 
-        current_user.password_hash = generate_password_hash(form.new_password.data)
+        current_user.user.password_hash = generate_password_hash(form.new_password.data)
+        bump_user_version(current_user.id)
         db.session.commit()
 
         flash('Password changed successfully', 'success')
@@ -1214,11 +1350,8 @@ def payments():
 
     form = PaymentForm()
 
-    # Populate reference choices based on payment type
-    if request.method == 'GET':
-        # Default to loan repayments
-        active_loans = Loan.query.filter_by(status='Active', is_deleted=False).all()
-        form.reference_id.choices = [(loan.id, f"{loan.member.full_name if loan.member else loan.borrower_name} - {format_currency(loan.remaining_amount)}") for loan in active_loans]
+    # Populate reference choices (loan repayments); set on POST too so the selection validates
+    form.reference_id.choices = get_loan_choices()
 
     if form.validate_on_submit():
         payment = Payment(
@@ -1229,49 +1362,27 @@ def payments():
             payment_method=form.payment_method.data,
             transaction_reference=form.transaction_reference.data,
             processed_by=current_user.id,
-            status='Approved' # Assuming payments are automatically approved or handled by another process
+            status='Approved', # Assuming payments are automatically approved or handled by another process
+            payment_date=datetime.utcnow(),
+            receipt_generated=True
         )
 
+        event = MoneyEvent('payment')
         db.session.add(payment)
-        db.session.commit() # Commit to get payment.id
-
-        # Generate receipt
-        receipt_number = f"PAM{datetime.now().strftime('%Y%m%d')}{payment.id:04d}"
-        qr_data = {
-            'receipt_number': receipt_number,
+        event.issue_receipt(payment.member_id, payment.amount, payment.payment_date, {
             'amount': payment.amount,
             'payment_type': payment.payment_type,
             'date': payment.payment_date.isoformat(),
             'member': current_user.full_name
-        }
-
-        receipt = DigitalReceipt(
-            payment_id=payment.id,
-            receipt_number=receipt_number,
-            qr_code_data=json.dumps(qr_data)
-        )
-
-        db.session.add(receipt)
-        db.session.commit()
-
-        # Update payment to indicate receipt was generated
-        payment.receipt_generated = True
-        db.session.commit()
-
-        # Create notification for payment recording
-        try:
-            create_payment_notification(payment.payment_type, current_user.full_name, payment.amount)
-        except:
-            pass # Continue even if notification fails
+        }, payment=payment)
 
+        event.after_commit(create_payment_notification, payment.payment_type, current_user.full_name, payment.amount)
         # Potentially award badges based on payment type/consistency
         if payment.payment_type.lower() == 'loan repayment':
-             try:
-                check_and_award_badges(current_user.id, 'loan_repayment')
-             except:
-                 pass
+            event.in_background(check_and_award_badges, current_user.id, 'loan_repayment')
+        event.commit()
 
-        flash(f'Payment of {format_currency(payment.amount)} recorded successfully. Receipt #{receipt_number} generated.', 'success')
+        flash(f'Payment of {format_currency(payment.amount)} recorded successfully. Receipt #{event.receipt_number} generated.', 'success')
         return redirect(url_for('payments'))
 
     # Get recent payments
@@ -1292,16 +1403,7 @@ def welfare():
     welfare_contributions = WelfareContribution.query.filter_by(is_deleted=False).all()
     welfare_expenses = WelfareExpense.query.all()
 
-    total_contributions = sum(w.amount for w in welfare_contributions)
-    total_expenses = sum(w.amount for w in welfare_expenses)
-    balance = total_contributions - total_expenses
-
-    stats = {
-        'total_contributions': total_contributions,
-        'total_expenses': total_expenses,
-        'balance': balance,
-        'beneficiaries': len(set(w.beneficiary_id for w in welfare_expenses))
-    }
+    stats = get_welfare_statistics()
 
     return render_template('welfare.html', 
                          welfare_contributions=welfare_contributions,
@@ -1320,59 +1422,36 @@ def welfare_contribute():
     form = WelfareContributionForm()
 
     # Populate member choices
-    active_members = User.query.filter_by(is_active=True).all()
-    form.member_id.choices = [(member.id, member.full_name) for member in active_members]
+    form.member_id.choices = get_member_choices()
 
     if form.validate_on_submit():
+        member = User.query.get(form.member_id.data)
+        event = MoneyEvent('welfare')
+
         welfare = WelfareContribution(
-            member_id=form.member_id.data,
+            member_id=member.id,
             amount=form.amount.data,
             notes=form.notes.data,
-            recorded_by=current_user.id
+            recorded_by=current_user.id,
+            date_recorded=datetime.utcnow()
         )
-
         db.session.add(welfare)
-        db.session.commit()
-
-        member = User.query.get(form.member_id.data)
-        flash(f'Welfare contribution of {format_currency(form.amount.data)} recorded for {member.full_name}', 'success')
-
-        # Create notification for welfare contribution
-        try:
-            create_payment_notification('Welfare Contribution', member.full_name, form.amount.data)
-        except:
-            pass # Continue even if notification fails
-
-        # Generate digital receipt for welfare contribution
-        try:
-            receipt_number = f"WELFARE{datetime.now().strftime('%Y%m%d')}{welfare.id:04d}"
-            qr_data = {
-                'receipt_number': receipt_number,
-                'type': 'welfare_contribution',
-                'amount': welfare.amount,
-                'member': member.full_name,
-                'date': welfare.date_recorded.isoformat(),
-                'recorded_by': current_user.full_name
-            }
-            digital_receipt = DigitalReceipt(
-                payment_id=None, # Not from Payment table directly
-                welfare_contribution_id=welfare.id, # Link to welfare contribution
-                receipt_number=receipt_number,
-                qr_code_data=json.dumps(qr_data),
-                generated_at=datetime.utcnow()
-            )
-            db.session.add(digital_receipt)
-            db.session.commit()
-            flash(f'Welfare contribution recorded. Receipt #{receipt_number} generated.', 'success')
-        except Exception as e:
-            flash(f'Welfare contribution recorded, but receipt generation failed: {str(e)}', 'warning')
-            
+        MemberBalance.apply(welfare.member_id, welfare=welfare.amount)
+        event.issue_receipt(member.id, welfare.amount, welfare.date_recorded, {
+            'type': 'welfare_contribution',
+            'amount': welfare.amount,
+            'member': member.full_name,
+            'date': welfare.date_recorded.isoformat(),
+            'recorded_by': current_user.full_name
+        }, welfare_contribution=welfare)
+
+        event.after_commit(create_payment_notification, 'Welfare Contribution', member.full_name, welfare.amount)
         # Award badges for consistent saving
-        try:
-            check_and_award_badges(member.id, 'contribution')
-        except:
-            pass
+        event.in_background(check_and_award_badges, member.id, 'contribution')
+        event.commit()
 
+        flash(f'Welfare contribution of {format_currency(welfare.amount)} recorded for {member.full_name}', 'success')
+        flash(f'Welfare contribution recorded. Receipt #{event.receipt_number} generated.', 'success')
         return redirect(url_for('welfare'))
 
     # Get the same data as the main welfare view
@@ -1384,16 +1463,7 @@ def welfare_contribute():
     welfare_contributions = WelfareContribution.query.filter_by(is_deleted=False).all()
     welfare_expenses = WelfareExpense.query.all()
 
-    total_contributions = sum(w.amount for w in welfare_contributions)
-    total_expenses = sum(w.amount for w in welfare_expenses)
-    balance = total_contributions - total_expenses
-
-    stats = {
-        'total_contributions': total_contributions,
-        'total_expenses': total_expenses,
-        'balance': balance,
-        'beneficiaries': len(set(w.beneficiary_id for w in welfare_expenses))
-    }
+    stats = get_welfare_statistics()
 
     return render_template('welfare.html', 
                          welfare_contributions=welfare_contributions,
@@ -1414,14 +1484,11 @@ def welfare_expense():
     form = WelfareExpenseForm()
 
     # Populate beneficiary choices
-    active_members = User.query.filter_by(is_active=True).all()
-    form.beneficiary_id.choices = [(member.id, member.full_name) for member in active_members]
+    form.beneficiary_id.choices = get_member_choices()
 
     if form.validate_on_submit():
         # Check available welfare funds
-        total_contributions = sum(w.amount for w in WelfareContribution.query.filter_by(is_deleted=False).all())
-        total_expenses = sum(w.amount for w in WelfareExpense.query.all())
-        available_funds = total_contributions - total_expenses
+        available_funds = get_welfare_statistics()['balance']
 
         if form.amount.data > available_funds:
             flash(f'Insufficient welfare funds. Available: {format_currency(available_funds)}, Requested: {format_currency(form.amount.data)}', 'error')
@@ -1453,16 +1520,7 @@ def welfare_expense():
     welfare_contributions = WelfareContribution.query.filter_by(is_deleted=False).all()
     welfare_expenses = WelfareExpense.query.all()
 
-    total_contributions = sum(w.amount for w in welfare_contributions)
-    total_expenses = sum(w.amount for w in welfare_expenses)
-    balance = total_contributions - total_expenses
-
-    stats = {
-        'total_contributions': total_contributions,
-        'total_expenses': total_expenses,
-        'balance': balance,
-        'beneficiaries': len(set(w.beneficiary_id for w in welfare_expenses))
-    }
+    stats = get_welfare_statistics()
 
     return render_template('welfare.html', 
                          welfare_contributions=welfare_contributions,
@@ -1554,6 +1612,11 @@ def cast_vote(proposal_id):
         db.session.add(vote)
         db.session.commit()
 
+        try:
+            publish_event('vote_cast', {'proposal_id': proposal_id, 'text': f'A vote was cast on "{proposal.title}"'})
+        except:
+            pass  # Continue even if the live update fails
+
         flash('Your vote has been recorded successfully', 'success')
         return redirect(url_for('voting'))
 
@@ -1567,22 +1630,8 @@ def member_directory():
         flash('You do not have permission to view member directory', 'error')
         return redirect(url_for('dashboard'))
 
-    members = User.query.filter_by(is_active=True).all()
-
-    # Enhanced member data with statistics
-    enhanced_members = []
-    for member in members:
-        member_data = {
-            'member': member,
-            'total_contributions': member.get_total_contributions(),
-            'total_welfare': sum(w.amount for w in WelfareContribution.query.filter_by(member_id=member.id)),
-            'active_loans': len(member.get_active_loans()),
-            'loan_balance': member.get_total_loan_balance(),
-            'unpaid_fines': member.get_total_unpaid_fines(),
-            'points': MemberPoints.query.filter_by(member_id=member.id).first(),
-            'badges': UserBadge.query.filter_by(member_id=member.id).all()
-        }
-        enhanced_members.append(member_data)
+    # Per-member figures come from grouped queries, not one query set per member
+    enhanced_members = get_member_directory()
 
     return render_template('member_directory.html', members=enhanced_members)
 
@@ -1608,41 +1657,25 @@ def gamification():
 @login_required
 def receipts():
     """View member's digital receipts."""
-    if current_user.role == 'Member':
-        # Get receipts for contributions made by this member
-        contribution_receipts = DigitalReceipt.query.join(Contribution).filter(
-            Contribution.member_id == current_user.id
-        ).all()
-        
-        # Get receipts for loan repayments (if any)
-        loan_repayment_receipts = DigitalReceipt.query.join(LoanRepayment).join(Loan).filter(
-            Loan.member_id == current_user.id
-        ).all()
-        
-        # Get receipts for welfare contributions
-        welfare_receipts = DigitalReceipt.query.join(WelfareContribution).filter(
-            WelfareContribution.member_id == current_user.id
-        ).all()
-        
-        # Get receipts for payments made by this member
-        payment_receipts = DigitalReceipt.query.join(Payment).filter(
-            Payment.member_id == current_user.id
-        ).all()
-        
-        # Combine all receipts
-        all_receipts = contribution_receipts + loan_repayment_receipts + welfare_receipts + payment_receipts
-        
-        # Sort by date (newest first)
-        all_receipts.sort(key=lambda x: x.generated_at, reverse=True)
-        
-    elif has_permission(current_user, 'manage_finances'):
-        # Admin/Treasurer can see all receipts
-        all_receipts = DigitalReceipt.query.order_by(DigitalReceipt.generated_at.desc()).all()
-    else:
+    if current_user.role != 'Member' and not has_permission(current_user, 'manage_finances'):
         flash('You do not have permission to view receipts', 'error')
         return redirect(url_for('dashboard'))
-    
-    return render_template('receipts.html', receipts=all_receipts)
+
+    page = receipt_page()
+    return render_template('receipts.html', receipts=page, page=page)
+
+def receipt_page():
+    """Current user's view of receipts, filtered and paginated from the query string."""
+    query = DigitalReceipt.query
+    if current_user.role == 'Member':
+        query = query.filter(DigitalReceipt.owner_member_id == current_user.id)
+
+    return paginate(query, DigitalReceipt.id,
+                    sort_columns={'date': DigitalReceipt.occurred_at},
+                    default_sort='date',
+                    search_columns=(DigitalReceipt.receipt_number,),
+                    date_column=DigitalReceipt.occurred_at,
+                    filters={'type': DigitalReceipt.receipt_type})
 
 @app.route('/receipts/<int:receipt_id>/download')
 @login_required
@@ -1650,101 +1683,36 @@ def download_receipt(receipt_id):
     """Download a digital receipt as PDF."""
     receipt = DigitalReceipt.query.get_or_404(receipt_id)
     
-    # Check permissions
-    can_access = False
+    # Members may only download their own receipts
     if current_user.role == 'Member':
-        # Check if this receipt belongs to the current member
-        if receipt.contribution_id:
-            contribution = Contribution.query.get(receipt.contribution_id)
-            if contribution and contribution.member_id == current_user.id:
-                can_access = True
-        elif receipt.loan_repayment_id:
-            loan_repayment = LoanRepayment.query.get(receipt.loan_repayment_id)
-            if loan_repayment and loan_repayment.loan.member_id == current_user.id:
-                can_access = True
-        elif receipt.welfare_contribution_id:
-            welfare = WelfareContribution.query.get(receipt.welfare_contribution_id)
-            if welfare and welfare.member_id == current_user.id:
-                can_access = True
-        elif receipt.payment_id:
-            payment = Payment.query.get(receipt.payment_id)
-            if payment and payment.member_id == current_user.id:
-                can_access = True
-    elif has_permission(current_user, 'manage_finances'):
-        can_access = True
+        can_access = receipt.owner_member_id == current_user.id
+    else:
+        can_access = has_permission(current_user, 'manage_finances')
     
     if not can_access:
         flash('You do not have permission to access this receipt', 'error')
         return redirect(url_for('receipts'))
     
     try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib import colors
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-        from reportlab.lib.units import inch
-        from io import BytesIO
-        import json
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch)
-        
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Header
-        title = Paragraph("Pamoja Agencies SHG", styles['Title'])
-        subtitle = Paragraph("Official Digital Receipt", styles['Heading2'])
-        story.append(title)
-        story.append(subtitle)
-        story.append(Spacer(1, 20))
-        
-        # Receipt details
-        qr_data = json.loads(receipt.qr_code_data) if receipt.qr_code_data else {}
-        
-        receipt_data = [
-            ['Receipt Number:', receipt.receipt_number],
-            ['Date:', format_datetime(receipt.generated_at)],
-            ['Member:', qr_data.get('member', current_user.full_name)],
-            ['Payment Type:', qr_data.get('type', 'Payment').replace('_', ' ').title()],
-            ['Amount:', format_currency(qr_data.get('amount', 0))],
-        ]
-        
-        if qr_data.get('recorded_by'):
-            receipt_data.append(['Recorded By:', qr_data.get('recorded_by')])
-        
-        receipt_table = Table(receipt_data, colWidths=[2*inch, 3*inch])
-        receipt_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(receipt_table)
-        story.append(Spacer(1, 30))
-        
-        # Footer
-        footer = Paragraph("This is an official digital receipt from Pamoja Agencies SHG", styles['Normal'])
-        story.append(footer)
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-        # Update download count
-        receipt.download_count += 1
-        receipt.downloaded = True
-        db.session.commit()
-        
-        return send_file(buffer, as_attachment=True, 
-                        download_name=f"receipt_{receipt.receipt_number}.pdf",
-                        mimetype='application/pdf')
-        
+        from utils import get_receipt_pdf
+        path, digest = get_receipt_pdf(receipt, current_user.full_name)
     except Exception as e:
         flash(f'Error generating receipt PDF: {str(e)}', 'error')
         return redirect(url_for('receipts'))
 
+    # Receipts are immutable, so the content hash doubles as the ETag
+    response = send_file(path, as_attachment=True,
+                         download_name=f"receipt_{receipt.receipt_number}.pdf",
+                         mimetype='application/pdf', etag=digest, conditional=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    if response.status_code == 200:
+        receipt.download_count = (receipt.download_count or 0) + 1
+        receipt.downloaded = True
+        db.session.commit()
+    return response
+
 @app.route('/offline-sync')
 @login_required
 def offline_sync():
@@ -1955,6 +1923,8 @@ def pay_fine(fine_id):
     fine.is_paid = True
     fine.date_paid = datetime.utcnow()
     fine.payment_notes = getattr(fine, 'payment_notes', '') or notes
+    if not fine.is_deleted:
+        MemberBalance.apply(fine.member_id, unpaid_fines=-fine.amount)
     
     db.session.commit()
     
@@ -2029,17 +1999,9 @@ def apply_membership():
         db.session.add(application)
         db.session.commit()
 
-        # Create notification for admins and chairman
-        notification_users = User.query.filter(User.role.in_(['Admin', 'Chairman']), User.is_active == True).all()
-        for user in notification_users:
-            notification = Notification(
-                user_id=user.id,
-                title='New Membership Application',
-                message=f'{form.full_name.data} has applied for membership in the group',
-                notification_type='membership_application'
-            )
-            db.session.add(notification)
-        db.session.commit()
+        # Notify admins and chairman
+        notify_roles('New Membership Application', f'{form.full_name.data} has applied for membership in the group',
+                     'membership_application', roles=('Admin', 'Chairman'))
 
         flash('Your membership application has been submitted successfully. We will review and get back to you soon.', 'success')
         return redirect(url_for('index'))
@@ -2054,8 +2016,18 @@ def membership_applications():
         flash('You do not have permission to view membership applications', 'error')
         return redirect(url_for('dashboard'))
 
-    applications = MembershipApplication.query.order_by(MembershipApplication.application_date.desc()).all()
-    return render_template('membership_applications.html', applications=applications)
+    page = membership_application_page()
+    return render_template('membership_applications.html', applications=page, page=page)
+
+def membership_application_page():
+    """Membership applications filtered and paginated from the query string."""
+    return paginate(MembershipApplication.query, MembershipApplication.id,
+                    sort_columns={'date': MembershipApplication.application_date, 'name': MembershipApplication.full_name},
+                    default_sort='date',
+                    search_columns=(MembershipApplication.full_name, MembershipApplication.email,
+                                    MembershipApplication.phone, MembershipApplication.location),
+                    date_column=MembershipApplication.application_date,
+                    filters={'status': MembershipApplication.status})
 
 @app.route('/membership-applications/<int:app_id>/review', methods=['POST'])
 @login_required
@@ -2135,6 +2107,204 @@ def review_membership_application(app_id):
         flash(f'Error processing application: {str(e)}', 'error')
         return redirect(url_for('membership_applications'))
 
+@app.route('/notifications')
+@login_required
+def notifications():
+    """Notification inbox for the current user."""
+    page = notification_page()
+    return render_template('notifications.html', notifications=page, page=page)
+
+def notification_page():
+    """The current user's notifications, filtered and paginated from the query string."""
+    query = Notification.query.filter(Notification.user_id == current_user.id)
+    if request.args.get('unread'):
+        query = query.filter(Notification.is_read == False)
+    page = paginate(query, Notification.id,
+                    sort_columns={'date': Notification.created_at},
+                    default_sort='date',
+                    search_columns=(Notification.title, Notification.message),
+                    date_column=Notification.created_at,
+                    filters={'type': Notification.notification_type})
+    if request.args.get('unread'):
+        page.params['unread'] = '1'
+    return page
+
+@app.route('/events')
+@login_required
+def events():
+    """Server-Sent Events stream of pending loans, payments, votes and announcements (officers only)."""
+    from notifications import event_stream, OFFICER_ROLES
+    if current_user.role not in OFFICER_ROLES:
+        # 204 tells EventSource not to reconnect
+        return Response(status=204)
+    role = current_user.role
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    # stream_with_context keeps the request's session until the stream ends; release its
+    # connection now, as the stream only reads through short-lived connections of its own
+    db.session.remove()
+    return Response(stream_with_context(event_stream(role, last_event_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """Mark selected notifications, or all of them, as read."""
+    from notifications import mark_read, unread_count
+    data = request.get_json(silent=True) or {}
+    mark_all = data.get('all') or request.form.get('all')
+    ids = data.get('ids') if request.is_json else request.form.getlist('ids')
+    try:
+        ids = None if mark_all else [int(notification_id) for notification_id in ids or []]
+    except (TypeError, ValueError):
+        ids = []
+
+    changed = mark_read(current_user.id, ids) if ids is None or ids else 0
+    if request.is_json:
+        return jsonify({'success': True, 'marked': changed, 'unread_count': unread_count(current_user.id)})
+    flash(f'{changed} notification{"s" if changed != 1 else ""} marked as read', 'success')
+    return redirect(request.referrer or url_for('notifications'))
+
+# JSON list endpoints (same filters and cursors as the HTML list pages)
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _json_page(page, serialize):
+    return jsonify(dict(page.to_dict(serialize), success=True))
+
+def _json_forbidden():
+    return jsonify({'success': False, 'message': 'You do not have permission to view this list'}), 403
+
+@app.route('/api/contributions')
+@login_required
+def api_contributions():
+    if not has_permission(current_user, 'record_contributions') and current_user.role != 'Member':
+        return _json_forbidden()
+    return _json_page(contribution_page(), lambda c: {
+        'id': c.id,
+        'member_id': c.member_id,
+        'member_name': c.member.full_name if c.member else None,
+        'amount': c.amount,
+        'contribution_type': c.contribution_type,
+        'date_recorded': _isoformat(c.date_recorded),
+        'notes': c.notes
+    })
+
+@app.route('/api/loans')
+@login_required
+def api_loans():
+    if current_user.role != 'Member' and not has_permission(current_user, 'approve_loans'):
+        return _json_forbidden()
+    return _json_page(loan_page(), lambda l: {
+        'id': l.id,
+        'member_id': l.member_id,
+        'borrower_name': l.borrower_name if l.loan_type == 'External' else (l.member.full_name if l.member else None),
+        'loan_type': l.loan_type,
+        'amount': l.amount,
+        'remaining_amount': l.remaining_amount,
+        'interest_rate': l.interest_rate,
+        'status': l.status,
+        'repayment_mode': l.repayment_mode,
+        'application_date': _isoformat(l.application_date),
+        'due_date': _isoformat(l.due_date)
+    })
+
+@app.route('/api/fines')
+@login_required
+def api_fines():
+    if current_user.role != 'Member' and not has_permission(current_user, 'issue_fines'):
+        return _json_forbidden()
+    return _json_page(fine_page(), lambda f: {
+        'id': f.id,
+        'member_id': f.member_id,
+        'member_name': f.member.full_name if f.member else None,
+        'amount': f.amount,
+        'fine_type': f.fine_type,
+        'reason': f.reason,
+        'date_issued': _isoformat(f.date_issued),
+        'is_paid': bool(f.is_paid),
+        'date_paid': _isoformat(f.date_paid)
+    })
+
+@app.route('/api/announcements')
+@login_required
+def api_announcements():
+    return _json_page(announcement_page(), lambda a: {
+        'id': a.id,
+        'title': a.title,
+        'content': a.content,
+        'is_urgent': bool(a.is_urgent),
+        'date_created': _isoformat(a.date_created),
+        'created_by': a.creator.full_name if a.creator else None
+    })
+
+@app.route('/api/meetings')
+@login_required
+def api_meetings():
+    return _json_page(meeting_page(), lambda m: {
+        'id': m.id,
+        'title': m.title,
+        'date_held': _isoformat(m.date_held),
+        'agenda': m.agenda,
+        'minutes': m.minutes,
+        'decisions': m.decisions
+    })
+
+@app.route('/api/documents')
+@login_required
+def api_documents():
+    return _json_page(document_page(), lambda d: {
+        'id': d.id,
+        'title': d.title,
+        'category': d.category,
+        'file_type': d.file_type,
+        'file_size': d.file_size,
+        'upload_date': _isoformat(d.upload_date),
+        'download_url': url_for('download_document', doc_id=d.id)
+    })
+
+@app.route('/api/receipts')
+@login_required
+def api_receipts():
+    if current_user.role != 'Member' and not has_permission(current_user, 'manage_finances'):
+        return _json_forbidden()
+    return _json_page(receipt_page(), lambda r: {
+        'id': r.id,
+        'receipt_number': r.receipt_number,
+        'generated_at': _isoformat(r.generated_at),
+        'download_count': r.download_count,
+        'download_url': url_for('download_receipt', receipt_id=r.id)
+    })
+
+@app.route('/api/membership-applications')
+@login_required
+def api_membership_applications():
+    if current_user.role not in ['Admin', 'Chairman']:
+        return _json_forbidden()
+    return _json_page(membership_application_page(), lambda a: {
+        'id': a.id,
+        'full_name': a.full_name,
+        'email': a.email,
+        'phone': a.phone,
+        'location': a.location,
+        'status': a.status,
+        'application_date': _isoformat(a.application_date)
+    })
+
+@app.route('/api/notifications')
+@login_required
+def api_notifications():
+    from notifications import unread_count
+    page = notification_page().to_dict(lambda n: {
+        'id': n.id,
+        'title': n.title,
+        'message': n.message,
+        'notification_type': n.notification_type,
+        'is_read': n.is_read,
+        'created_at': _isoformat(n.created_at)
+    })
+    return jsonify(dict(page, success=True, unread_count=unread_count(current_user.id)))
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
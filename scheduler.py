@@ -0,0 +1,166 @@
+import os
+import time
+import random
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta, time as daytime
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import ScheduledJob, Loan
+
+# Every gunicorn worker runs a scheduler thread; the lease on each ScheduledJob row makes sure
+# only one of them runs a given job. A lease left by a worker that died mid-job expires after JOB_LEASE.
+SCHEDULER_POLL_INTERVAL = 60
+JOB_LEASE = timedelta(minutes=30)
+
+_scheduler_lock = threading.Lock()
+_scheduler_pid = None
+
+class Job:
+    """A registered job: runs daily at `at` (a UTC time of day) or every `every` interval."""
+
+    def __init__(self, name, func, description, at=None, every=None):
+        self.name = name
+        self.func = func
+        self.description = description
+        self.at = at
+        self.every = every
+
+    def next_after(self, now):
+        if self.at:
+            run = datetime.combine(now.date(), self.at)
+            return run if run > now else run + timedelta(days=1)
+        return now + self.every
+
+JOBS = {}
+
+def register(name, description, at=None, every=None):
+    """Decorator that registers a function as a scheduled job."""
+    def decorator(func):
+        JOBS[name] = Job(name, func, description, at=at, every=every)
+        return func
+    return decorator
+
+# Job times are UTC; for the group (EAT, UTC+3) batch work lands after midnight and reminders at 09:00
+@register('overdue_sweep', 'Mark loans past their due date as overdue and issue late fees',
+          at=daytime(21, 30))
+def sweep_overdue_loans():
+    marked, fined = Loan.sweep_overdue()
+    db.session.commit()
+    return f"{marked} loans marked overdue, {fined} late fees issued"
+
+@register('financial_report', 'Pre-render the financial report PDF so morning downloads are cached',
+          at=daytime(22, 0))
+def build_financial_report():
+    from report_jobs import submit_report, report_status
+    status = report_status(submit_report('financial', wait=True))
+    if status['status'] != 'ready':
+        raise RuntimeError(status.get('error', 'Report was not rendered'))
+    return status['job_id']
+
+@register('debt_reminders', 'Send WhatsApp reminders for due loans and unpaid fines',
+          at=daytime(6, 0))
+def send_reminders():
+    from whatsapp_reminders import send_debt_reminders
+    summary = send_debt_reminders()
+    return f"{summary['sent']} of {summary['members']} members reminded"
+
+def lease_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def sync_jobs(now=None):
+    """Create rows for registered jobs that have never been scheduled."""
+    now = now or datetime.utcnow()
+    existing = set(db.session.scalars(db.select(ScheduledJob.name)))
+    for job in JOBS.values():
+        if job.name in existing:
+            continue
+        try:
+            db.session.add(ScheduledJob(name=job.name, next_run=job.next_after(now)))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.session.rollback()
+
+def acquire_lease(name, owner, now=None, force=False):
+    """Claim a job with one conditional UPDATE; the row lock it takes lets exactly one caller win.
+
+    Without force the job must also be due. Returns True if this owner now holds the lease.
+    """
+    now = now or datetime.utcnow()
+    statement = (db.update(ScheduledJob)
+                 .where(ScheduledJob.name == name,
+                        db.or_(ScheduledJob.lease_owner.is_(None), ScheduledJob.lease_expires_at < now)))
+    if not force:
+        statement = statement.where(ScheduledJob.next_run <= now)
+    claimed = db.session.execute(statement.values(lease_owner=owner, lease_expires_at=now + JOB_LEASE),
+                                 execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    return claimed == 1
+
+def run_job(name, owner=None, force=False):
+    """Run a job if this process can claim it. Returns (status, detail), status being 'skipped' when it could not."""
+    job = JOBS[name]
+    owner = owner or lease_owner()
+    if not acquire_lease(name, owner, force=force):
+        return 'skipped', None
+
+    started = datetime.utcnow()
+    clock = time.monotonic()
+    try:
+        status, detail = 'success', job.func()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Scheduled job {name} failed: {str(e)}")
+        status, detail = 'failed', str(e)
+
+    finished = datetime.utcnow()
+    db.session.execute(db.update(ScheduledJob)
+                       .where(ScheduledJob.name == name, ScheduledJob.lease_owner == owner)
+                       .values(last_run=started, last_status=status,
+                               last_error=detail if status == 'failed' else None,
+                               last_duration=round(time.monotonic() - clock, 2),
+                               next_run=job.next_after(finished), lease_owner=None, lease_expires_at=None),
+                       execution_options={'synchronize_session': False})
+    db.session.commit()
+    logging.info(f"Scheduled job {name} {status}: {detail}")
+    return status, detail
+
+def run_due_jobs():
+    """Run every registered job that is due and not leased by another process."""
+    now = datetime.utcnow()
+    sync_jobs(now)
+    due = db.session.scalars(db.select(ScheduledJob.name)
+                             .where(ScheduledJob.next_run <= now,
+                                    db.or_(ScheduledJob.lease_owner.is_(None), ScheduledJob.lease_expires_at < now))
+                             .order_by(ScheduledJob.next_run)).all()
+    for name in due:
+        if name in JOBS:
+            run_job(name)
+
+def _run_forever():
+    # Spread workers out so they do not all poll in the same instant
+    time.sleep(random.uniform(0, SCHEDULER_POLL_INTERVAL))
+    while True:
+        try:
+            with app.app_context():
+                run_due_jobs()
+        except Exception as e:
+            logging.error(f"Scheduler tick failed: {str(e)}")
+        time.sleep(SCHEDULER_POLL_INTERVAL)
+
+def ensure_started():
+    """Start this process's scheduler thread; threads do not survive a fork, so each worker starts its own."""
+    global _scheduler_pid
+    if _scheduler_pid == os.getpid():
+        return
+    with _scheduler_lock:
+        if _scheduler_pid != os.getpid():
+            threading.Thread(target=_run_forever, name='scheduler', daemon=True).start()
+            _scheduler_pid = os.getpid()
+
+@app.before_request
+def _start_scheduler():
+    if app.config.get('SCHEDULER_ENABLED') and not app.testing:
+        ensure_started()
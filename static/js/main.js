@@ -7,10 +7,12 @@ document.addEventListener('DOMContentLoaded', function() {
         initializeAlerts();
         initializeFormValidation();
         initializeFileUpload();
+        initializeChoicePickers();
         initializeDataTables();
         initializeConfirmations();
         initializeCurrencyFormatting();
         initializeCharts();
+        initializeLiveEvents();
 
         // Fix voting date inputs
         initializeDateTimeInputs();
@@ -171,6 +173,41 @@ function initializeFileUpload() {
     });
 }
 
+// Searchable member/loan dropdowns: long lists are rendered with only the selection,
+// and matching options are fetched from the server as the user types
+function initializeChoicePickers() {
+    document.querySelectorAll('select[data-picker-url]').forEach(select => {
+        const search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'form-control form-control-sm mb-1';
+        search.placeholder = 'Type to search...';
+        select.parentElement.insertBefore(search, select);
+
+        let timer = null;
+        search.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = search.value.trim();
+            if (!query) return;
+
+            timer = setTimeout(function() {
+                fetch(select.dataset.pickerUrl + '?q=' + encodeURIComponent(query))
+                    .then(response => response.ok ? response.json() : {results: []})
+                    .then(data => {
+                        // Keep the placeholder and the current selection, replace the rest with matches
+                        Array.from(select.options).forEach(option => {
+                            if (option.value !== '0' && !option.selected) option.remove();
+                        });
+                        (data.results || []).forEach(result => {
+                            if (select.querySelector(`option[value="${result.id}"]`)) return;
+                            select.add(new Option(result.text, result.id));
+                        });
+                    })
+                    .catch(error => console.warn('Choice search failed:', error));
+            }, 250);
+        });
+    });
+}
+
 // Update file information display
 function updateFileInfo(input, file) {
     const container = input.closest('.mb-3') || input.parentElement;
@@ -196,6 +233,11 @@ function initializeDataTables() {
     const tables = document.querySelectorAll('.table');
 
     tables.forEach(table => {
+        // Server-paginated lists are searched and sorted by the filter bar
+        if (table.hasAttribute('data-server-paginated')) {
+            return;
+        }
+
         // Add search functionality for large tables
         if (table.rows.length > 10) {
             addTableSearch(table);
@@ -745,6 +787,47 @@ function showNotification(message, type = 'info') {
     }, 5000);
 }
 
+// Live updates from the /events stream on pages that opt in with data-live-events
+const LIVE_EVENT_TYPES = ['loan_pending', 'payment_recorded', 'vote_cast', 'announcement_posted'];
+
+function initializeLiveEvents() {
+    const container = document.querySelector('[data-live-events]');
+    if (!container || !window.EventSource) {
+        return;
+    }
+
+    const source = new EventSource(container.dataset.liveEvents);
+    LIVE_EVENT_TYPES.forEach(type => {
+        source.addEventListener(type, event => {
+            let data = {};
+            try {
+                data = JSON.parse(event.data);
+            } catch (error) {
+                return;
+            }
+
+            document.querySelectorAll(`[data-live-count="${type}"]`).forEach(counter => {
+                counter.textContent = (parseInt(counter.textContent, 10) || 0) + 1;
+            });
+            document.querySelectorAll(`[data-live-container="${type}"]`).forEach(element => {
+                element.classList.remove('d-none');
+            });
+            if (type === 'loan_pending' || type === 'payment_recorded') {
+                const badge = document.getElementById('unreadBadge');
+                if (badge && !isNaN(parseInt(badge.textContent, 10))) {
+                    badge.textContent = parseInt(badge.textContent, 10) + 1;
+                }
+            }
+            if (data.text) {
+                // Event text includes user-entered titles and names, so it is inserted as text
+                const text = document.createElement('span');
+                text.textContent = data.text;
+                showNotification(text.innerHTML, 'info');
+            }
+        });
+    });
+}
+
 // Badge and points animation
 function animateBadges() {
     const badges = document.querySelectorAll('.badge-earned');
@@ -1,14 +1,20 @@
 import os
 import csv
-from io import StringIO
-from datetime import datetime
+import json
+import time
+import hashlib
+import threading
+import tempfile
+from collections import deque
+from datetime import datetime, timedelta
 from flask import current_app, make_response
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.units import inch
-from models import User, Contribution, Loan, Fine
+from app import db
+from models import User, Contribution, Loan, Fine, DataVersion
 
 def allowed_file(filename):
     """Check if file extension is allowed."""
@@ -106,15 +112,13 @@ def generate_financial_report_pdf():
     story.append(Spacer(1, 20))
     
     # Summary Statistics
-    total_contributions = sum(c.amount for c in Contribution.query.all())
-    total_loans = sum(l.amount for l in Loan.query.filter_by(status='Active').all())
-    total_fines = sum(f.amount for f in Fine.query.filter_by(is_paid=False).all())
+    totals = get_financial_totals()
     
     summary_data = [
-        ['Total Member Contributions', format_currency(total_contributions)],
-        ['Active Loans Outstanding', format_currency(total_loans)],
-        ['Unpaid Fines', format_currency(total_fines)],
-        ['Group Balance', format_currency(total_contributions - total_loans)]
+        ['Total Member Contributions', format_currency(totals['contributions'])],
+        ['Active Loans Outstanding', format_currency(totals['active_loans'])],
+        ['Unpaid Fines', format_currency(totals['unpaid_fines'])],
+        ['Group Balance', format_currency(totals['group_balance'])]
     ]
     
     summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
@@ -165,80 +169,406 @@ def generate_financial_report_pdf():
     buffer.seek(0)
     return buffer
 
-def generate_financial_report_csv():
-    """Generate CSV financial report."""
-    output = StringIO()
-    writer = csv.writer(output)
-    
+# Built once per process; rebuilding the sample stylesheet on every receipt is wasted work
+_receipt_styles = None
+
+def receipt_content(receipt, fallback_member=None):
+    """The fields printed on a receipt PDF; a receipt never changes once generated, so neither does this."""
+    qr_data = json.loads(receipt.qr_code_data) if receipt.qr_code_data else {}
+    return {
+        'receipt_number': receipt.receipt_number,
+        'date': format_datetime(receipt.generated_at),
+        'member': qr_data.get('member', fallback_member),
+        'type': qr_data.get('type', 'Payment').replace('_', ' ').title(),
+        'amount': format_currency(qr_data.get('amount', 0)),
+        'recorded_by': qr_data.get('recorded_by'),
+    }
+
+def render_receipt_pdf(content):
+    """Render receipt content as PDF bytes."""
+    from io import BytesIO
+    global _receipt_styles
+    if _receipt_styles is None:
+        _receipt_styles = getSampleStyleSheet()
+    styles = _receipt_styles
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch)
+    story = []
+
     # Header
-    writer.writerow(['Pamoja Agencies SHG - Financial Report'])
-    writer.writerow([f'Generated on: {datetime.now().strftime("%B %d, %Y")}'])
-    writer.writerow([])  # Empty row
-    
-    # Summary
-    writer.writerow(['FINANCIAL SUMMARY'])
-    total_contributions = sum(c.amount for c in Contribution.query.all())
-    total_loans = sum(l.amount for l in Loan.query.filter_by(status='Active').all())
-    total_fines = sum(f.amount for f in Fine.query.filter_by(is_paid=False).all())
-    
-    writer.writerow(['Total Member Contributions', total_contributions])
-    writer.writerow(['Active Loans Outstanding', total_loans])
-    writer.writerow(['Unpaid Fines', total_fines])
-    writer.writerow(['Group Balance', total_contributions - total_loans])
-    writer.writerow([])  # Empty row
-    
-    # Member details
-    writer.writerow(['MEMBER CONTRIBUTIONS'])
-    writer.writerow(['Member Name', 'Email', 'Total Contributions', 'Number of Contributions'])
-    
-    members = User.query.filter_by(is_active=True).all()
-    for member in members:
-        total_contrib = member.get_total_contributions()
-        num_contrib = len(member.contributions)
-        writer.writerow([member.full_name, member.email, total_contrib, num_contrib])
-    
-    output.seek(0)
-    return output.getvalue()
+    story.append(Paragraph("Pamoja Agencies SHG", styles['Title']))
+    story.append(Paragraph("Official Digital Receipt", styles['Heading2']))
+    story.append(Spacer(1, 20))
+
+    # Receipt details
+    receipt_data = [
+        ['Receipt Number:', content['receipt_number']],
+        ['Date:', content['date']],
+        ['Member:', content['member']],
+        ['Payment Type:', content['type']],
+        ['Amount:', content['amount']],
+    ]
+    if content['recorded_by']:
+        receipt_data.append(['Recorded By:', content['recorded_by']])
+
+    receipt_table = Table(receipt_data, colWidths=[2*inch, 3*inch])
+    receipt_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(receipt_table)
+    story.append(Spacer(1, 30))
+
+    # Footer
+    story.append(Paragraph("This is an official digital receipt from Pamoja Agencies SHG", styles['Normal']))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+def get_receipt_pdf(receipt, fallback_member=None):
+    """Return (path, digest) of the receipt PDF, rendering it into the content-addressed cache on first use."""
+    content = receipt_content(receipt, fallback_member)
+    digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+    folder = os.path.join(current_app.config['RECEIPT_CACHE_DIR'], digest[:2])
+    path = os.path.join(folder, digest + '.pdf')
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        # A unique temp file per render, as threads of one worker may render the same receipt at once
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(render_receipt_pdf(content))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return path, digest
+
+CSV_LEDGERS = ('summary', 'contributions', 'repayments', 'fines', 'welfare', 'payments', 'all')
+
+# Rows fetched per round trip and rows written per response chunk
+EXPORT_FETCH_SIZE = 1000
+EXPORT_CHUNK_ROWS = 500
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer yields each formatted line."""
+    def write(self, value):
+        return value
+
+def _stream_rows(statement):
+    """Execute a select with a server-side cursor, yielding rows in fixed-size batches."""
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_FETCH_SIZE))
+    for partition in result.partitions():
+        yield from partition
+
+def _csv_chunks(rows):
+    writer = csv.writer(_Echo())
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+def _in_period(column, date_from, date_to):
+    conditions = []
+    if date_from:
+        conditions.append(column >= date_from)
+    if date_to:
+        conditions.append(column < date_to)
+    return conditions
+
+def _sum(column, *conditions):
+    return db.session.scalar(db.select(db.func.coalesce(db.func.sum(column), 0)).where(*conditions)) or 0
+
+def get_financial_totals(date_from=None, date_to=None):
+    """Summary totals for financial reports, each summed exactly by the database."""
+    from models import WelfareContribution
+    contributions = _sum(Contribution.amount, Contribution.is_deleted == False,
+                         *_in_period(Contribution.date_recorded, date_from, date_to))
+    welfare = _sum(WelfareContribution.amount, WelfareContribution.is_deleted == False,
+                   *_in_period(WelfareContribution.date_recorded, date_from, date_to))
+    # Outstanding loans and fines are a position at export time, not a period total
+    active_loans = _sum(Loan.amount, Loan.status == 'Active', Loan.is_deleted == False)
+    unpaid_fines = _sum(Fine.amount, Fine.is_paid == False, Fine.is_deleted == False)
+    return {'contributions': contributions, 'welfare': welfare, 'active_loans': active_loans,
+            'unpaid_fines': unpaid_fines, 'group_balance': round(contributions - active_loans, 2)}
+
+def get_welfare_statistics():
+    """Welfare fund totals for the welfare pages, summed by the database."""
+    from models import WelfareContribution, WelfareExpense
+    total_contributions = _sum(WelfareContribution.amount, WelfareContribution.is_deleted == False)
+    total_expenses = _sum(WelfareExpense.amount)
+    return {
+        'total_contributions': total_contributions,
+        'total_expenses': total_expenses,
+        'balance': round(total_contributions - total_expenses, 2),
+        'beneficiaries': db.session.scalar(db.select(db.func.count(db.distinct(WelfareExpense.beneficiary_id)))) or 0,
+    }
+
+def _summary_rows(date_from, date_to):
+    totals = get_financial_totals(date_from, date_to)
+    yield ['FINANCIAL SUMMARY']
+    yield ['Total Member Contributions', totals['contributions']]
+    yield ['Total Welfare Contributions', totals['welfare']]
+    yield ['Active Loans Outstanding', totals['active_loans']]
+    yield ['Unpaid Fines', totals['unpaid_fines']]
+    yield ['Group Balance', totals['group_balance']]
+    yield []
+
+    yield ['MEMBER CONTRIBUTIONS']
+    yield ['Member Name', 'Email', 'Total Contributions', 'Number of Contributions']
+    joined = db.and_(Contribution.member_id == User.id, Contribution.is_deleted == False,
+                     *_in_period(Contribution.date_recorded, date_from, date_to))
+    statement = (db.select(User.full_name, User.email,
+                           db.func.coalesce(db.func.sum(Contribution.amount), 0),
+                           db.func.count(Contribution.id))
+                 .outerjoin(Contribution, joined)
+                 .where(User.is_active == True)
+                 .group_by(User.id, User.full_name, User.email)
+                 .order_by(User.full_name))
+    yield from _stream_rows(statement)
+    yield []
+
+def _ledger_rows(name, date_from, date_to):
+    from models import LoanRepayment, WelfareContribution, Payment
+    if name == 'contributions':
+        header = ['ID', 'Date', 'Member', 'Type', 'Amount', 'Notes']
+        statement = (db.select(Contribution.id, Contribution.date_recorded, User.full_name,
+                               Contribution.contribution_type, Contribution.amount, Contribution.notes)
+                     .join(User, Contribution.member_id == User.id)
+                     .where(Contribution.is_deleted == False,
+                            *_in_period(Contribution.date_recorded, date_from, date_to))
+                     .order_by(Contribution.date_recorded, Contribution.id))
+    elif name == 'repayments':
+        header = ['ID', 'Date', 'Member', 'Loan ID', 'Amount']
+        # External loans have no member; their borrower's name stands in
+        statement = (db.select(LoanRepayment.id, LoanRepayment.date_paid,
+                               db.func.coalesce(User.full_name, Loan.borrower_name),
+                               LoanRepayment.loan_id, LoanRepayment.amount)
+                     .join(Loan, LoanRepayment.loan_id == Loan.id)
+                     .outerjoin(User, Loan.member_id == User.id)
+                     .where(*_in_period(LoanRepayment.date_paid, date_from, date_to))
+                     .order_by(LoanRepayment.date_paid, LoanRepayment.id))
+    elif name == 'fines':
+        header = ['ID', 'Date Issued', 'Member', 'Type', 'Reason', 'Amount', 'Paid', 'Date Paid']
+        statement = (db.select(Fine.id, Fine.date_issued, User.full_name, Fine.fine_type, Fine.reason,
+                               Fine.amount, Fine.is_paid, Fine.date_paid)
+                     .join(User, Fine.member_id == User.id)
+                     .where(Fine.is_deleted == False, *_in_period(Fine.date_issued, date_from, date_to))
+                     .order_by(Fine.date_issued, Fine.id))
+    elif name == 'welfare':
+        header = ['ID', 'Date', 'Member', 'Amount', 'Notes']
+        statement = (db.select(WelfareContribution.id, WelfareContribution.date_recorded, User.full_name,
+                               WelfareContribution.amount, WelfareContribution.notes)
+                     .join(User, WelfareContribution.member_id == User.id)
+                     .where(WelfareContribution.is_deleted == False,
+                            *_in_period(WelfareContribution.date_recorded, date_from, date_to))
+                     .order_by(WelfareContribution.date_recorded, WelfareContribution.id))
+    else:
+        header = ['ID', 'Date', 'Member', 'Type', 'Reference ID', 'Method', 'Transaction Reference', 'Amount', 'Status']
+        statement = (db.select(Payment.id, Payment.payment_date, User.full_name, Payment.payment_type,
+                               Payment.reference_id, Payment.payment_method, Payment.transaction_reference,
+                               Payment.amount, Payment.status)
+                     .join(User, Payment.member_id == User.id)
+                     .where(*_in_period(Payment.payment_date, date_from, date_to))
+                     .order_by(Payment.payment_date, Payment.id))
+
+    yield [f'{name.upper()} LEDGER']
+    yield header
+    yield from _stream_rows(statement)
+    yield []
+
+def generate_financial_report_csv(ledger='summary', date_from=None, date_to=None):
+    """Generate a CSV financial report as a stream of text chunks.
+
+    ledger is one of CSV_LEDGERS; date_from / date_to are datetimes bounding the
+    period (date_to exclusive). Rows are read through a server-side cursor and
+    written as they arrive, so memory stays flat however large the ledger is.
+    """
+    def rows():
+        yield ['Pamoja Agencies SHG - Financial Report']
+        yield [f'Generated on: {datetime.now().strftime("%B %d, %Y")}']
+        if date_from or date_to:
+            start = date_from.strftime('%Y-%m-%d') if date_from else 'start'
+            end = (date_to - timedelta(days=1)).strftime('%Y-%m-%d') if date_to else 'today'
+            yield [f'Period: {start} to {end}']
+        yield []
+
+        if ledger in ('summary', 'all'):
+            yield from _summary_rows(date_from, date_to)
+        for name in ('contributions', 'repayments', 'fines', 'welfare', 'payments'):
+            if ledger in (name, 'all'):
+                yield from _ledger_rows(name, date_from, date_to)
+
+    return _csv_chunks(rows())
+
+# Recent hit times per rate-limit key, for this process
+_rate_limit_hits = {}
+_rate_limit_lock = threading.Lock()
+
+def rate_limited(key, limit, period=60):
+    """Record a hit for key and return True if it is over limit hits in the last period seconds.
+
+    Counts are per process, so with several workers a client gets up to limit hits on each.
+    """
+    now = time.monotonic()
+    with _rate_limit_lock:
+        hits = _rate_limit_hits.setdefault(key, deque())
+        while hits and hits[0] <= now - period:
+            hits.popleft()
+        if len(hits) >= limit:
+            return True
+        hits.append(now)
+        if len(_rate_limit_hits) > 10000:
+            # Forget clients with no recent hits so the table stays small
+            for stale in [k for k, v in _rate_limit_hits.items() if not v or v[-1] <= now - period]:
+                del _rate_limit_hits[stale]
+        return False
+
+# Per-process cache of form choice lists, keyed by the 'member_choices' / 'loan_choices' data versions
+_choices_cache = {}
+
+def _cached_choices(name, load):
+    version = DataVersion.current(name)
+    cached = _choices_cache.get(name)
+    if not cached or cached[0] != version:
+        cached = _choices_cache[name] = (version, tuple((value, label) for value, label in load()))
+    return list(cached[1])
+
+def get_member_choices():
+    """(id, full name) of every active member, for member dropdowns."""
+    return _cached_choices('member_choices', lambda: db.session.execute(
+        db.select(User.id, User.full_name).where(User.is_active == True).order_by(User.full_name, User.id)))
+
+def _load_loan_choices():
+    rows = db.session.execute(
+        db.select(Loan.id, Loan.loan_type, Loan.borrower_name, Loan.remaining_amount, User.full_name)
+        .outerjoin(User, User.id == Loan.member_id)
+        .where(Loan.status == 'Active', Loan.is_deleted == False)
+        .order_by(Loan.id))
+    for loan_id, loan_type, borrower_name, remaining_amount, member_name in rows:
+        if loan_type == 'Internal' and member_name:
+            name = member_name
+        elif loan_type == 'External' and borrower_name:
+            name = borrower_name
+        else:
+            name = member_name or borrower_name or 'Unknown Borrower'
+        yield loan_id, f"{name} - {format_currency(remaining_amount)}"
+
+def get_loan_choices():
+    """(id, borrower and balance) of every active loan, for repayment and payment dropdowns."""
+    return _cached_choices('loan_choices', _load_loan_choices)
+
+def filter_choices(choices, query, limit=20):
+    """The first choices whose label contains query, ignoring case."""
+    query = query.strip().casefold()
+    matches = (choice for choice in choices if query in choice[1].casefold())
+    return [choice for _, choice in zip(range(limit), matches)]
+
+# Per-process cache of group statistics, keyed by the 'statistics' data version
+_statistics_cache = {}
 
 def get_group_statistics():
     """Get comprehensive group statistics."""
-    stats = {}
-    
-    # Member statistics
-    stats['total_members'] = User.query.filter_by(is_active=True).count()
-    stats['total_admins'] = User.query.filter_by(role='Admin', is_active=True).count()
-    stats['total_treasurers'] = User.query.filter_by(role='Treasurer', is_active=True).count()
-    stats['total_secretaries'] = User.query.filter_by(role='Secretary', is_active=True).count()
-    
-    # Financial statistics
-    stats['total_contributions'] = sum(c.amount for c in Contribution.query.all())
-    stats['total_loans_issued'] = sum(l.amount for l in Loan.query.filter(Loan.status.in_(['Active', 'Completed'])).all())
-    stats['active_loans_amount'] = sum(l.remaining_amount for l in Loan.query.filter_by(status='Active').all())
-    stats['total_fines'] = sum(f.amount for f in Fine.query.all())
-    stats['unpaid_fines'] = sum(f.amount for f in Fine.query.filter_by(is_paid=False).all())
-    
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    cache_key = (DataVersion.current('statistics'), month_start)
+
+    cached = _statistics_cache.get('stats')
+    if cached and cached[0] == cache_key:
+        return dict(cached[1])
+
+    def total(column, *conditions):
+        return db.func.coalesce(db.func.sum(db.case((db.and_(*conditions), column), else_=0)), 0)
+
+    def count(*conditions):
+        return db.func.count(db.case((db.and_(*conditions), 1)))
+
+    # One conditional-aggregate subquery per table, all fetched in a single statement
+    members = db.select(
+        count(User.is_active == True).label('total_members'),
+        count(User.is_active == True, User.role == 'Admin').label('total_admins'),
+        count(User.is_active == True, User.role == 'Treasurer').label('total_treasurers'),
+        count(User.is_active == True, User.role == 'Secretary').label('total_secretaries'),
+    ).subquery()
+    contributions = db.select(
+        total(Contribution.amount, Contribution.is_deleted == False).label('total_contributions'),
+        count(Contribution.is_deleted == False, Contribution.date_recorded >= month_start).label('recent_contributions'),
+    ).subquery()
+    loans = db.select(
+        total(Loan.amount, Loan.is_deleted == False, Loan.status.in_(['Active', 'Completed'])).label('total_loans_issued'),
+        total(Loan.remaining_amount, Loan.is_deleted == False, Loan.status == 'Active').label('active_loans_amount'),
+        count(Loan.is_deleted == False, Loan.status == 'Pending').label('pending_loans'),
+    ).subquery()
+    fines = db.select(
+        total(Fine.amount, Fine.is_deleted == False).label('total_fines'),
+        total(Fine.amount, Fine.is_deleted == False, Fine.is_paid == False).label('unpaid_fines'),
+    ).subquery()
+
+    single_rows = members.join(contributions, db.true()).join(loans, db.true()).join(fines, db.true())
+    row = db.session.execute(db.select(members, contributions, loans, fines).select_from(single_rows)).mappings().one()
+    stats = dict(row)
+
     # Group balance
-    stats['group_balance'] = stats['total_contributions'] - stats['active_loans_amount']
-    
-    # Recent activity
-    stats['pending_loans'] = Loan.query.filter_by(status='Pending').count()
-    stats['recent_contributions'] = Contribution.query.filter(
-        Contribution.date_recorded >= datetime.now().replace(day=1)
-    ).count()
-    
-    return stats
+    stats['group_balance'] = round(stats['total_contributions'] - stats['active_loans_amount'], 2)
+
+    _statistics_cache['stats'] = (cache_key, stats)
+    return dict(stats)
+
+def get_member_directory():
+    """Load active members with their directory figures using a fixed number of queries."""
+    from models import MemberBalance, MemberPoints, UserBadge
+
+    rows = db.session.query(User, MemberBalance).outerjoin(
+        MemberBalance, MemberBalance.member_id == User.id
+    ).filter(User.is_active == True).order_by(User.full_name).all()
+    member_ids = [member.id for member, _ in rows]
+    if not member_ids:
+        return []
+
+    active_loans = dict(db.session.query(Loan.member_id, db.func.count(Loan.id)).filter(
+        Loan.member_id.in_(member_ids), Loan.status == 'Active', Loan.is_deleted == False
+    ).group_by(Loan.member_id).all())
+
+    badge_counts = dict(db.session.query(UserBadge.member_id, db.func.count(UserBadge.id)).filter(
+        UserBadge.member_id.in_(member_ids)
+    ).group_by(UserBadge.member_id).all())
+
+    points = {}
+    for member_points in MemberPoints.query.filter(MemberPoints.member_id.in_(member_ids)).order_by(MemberPoints.id):
+        points.setdefault(member_points.member_id, member_points)
+
+    directory = []
+    for member, balance in rows:
+        directory.append({
+            'member': member,
+            'total_contributions': balance.savings if balance else 0.0,
+            'total_welfare': balance.welfare if balance else 0.0,
+            'active_loans': active_loans.get(member.id, 0),
+            'loan_balance': balance.loan_balance if balance else 0.0,
+            'unpaid_fines': balance.unpaid_fines if balance else 0.0,
+            'points': points.get(member.id),
+            'badges': badge_counts.get(member.id, 0)
+        })
+    return directory
+
+ROLE_PERMISSIONS = {
+    'Admin': ['all'],
+    'Chairman': ['manage_finances', 'view_members', 'approve_loans', 'record_contributions', 'issue_fines', 'manage_announcements', 'record_meetings', 'review_membership'],
+    'Treasurer': ['manage_finances', 'view_members', 'approve_loans', 'record_contributions', 'issue_fines'],
+    'Secretary': ['manage_announcements', 'record_meetings', 'view_members'],
+    'Member': ['view_own_data', 'apply_loan', 'view_announcements']
+}
 
 def has_permission(user, action):
     """Check if user has permission for specific action."""
-    permissions = {
-        'Admin': ['all'],
-        'Chairman': ['manage_finances', 'view_members', 'approve_loans', 'record_contributions', 'issue_fines', 'manage_announcements', 'record_meetings', 'review_membership'],
-        'Treasurer': ['manage_finances', 'view_members', 'approve_loans', 'record_contributions', 'issue_fines'],
-        'Secretary': ['manage_announcements', 'record_meetings', 'view_members'],
-        'Member': ['view_own_data', 'apply_loan', 'view_announcements']
-    }
-    
     if user.role == 'Admin':
         return True
     
-    return action in permissions.get(user.role, [])
+    return action in ROLE_PERMISSIONS.get(user.role, [])
@@ -1,40 +1,167 @@
-
-import requests
+import time
+import logging
+import threading
+from itertools import groupby
 from datetime import datetime, timedelta
-from models import User, Loan, Fine
+from concurrent.futures import ThreadPoolExecutor
+from app import app, db
+from models import User, Loan, LoanInstallment, Fine
 from utils import format_currency
 
-def send_whatsapp_reminder(phone_number, message):
-    """Send WhatsApp reminder (placeholder for actual WhatsApp API integration)."""
-    # This would integrate with a WhatsApp Business API service
-    # For now, we'll just log the reminder
-    print(f"WhatsApp Reminder to {phone_number}: {message}")
-    return True
-
-def send_debt_reminders():
-    """Send WhatsApp reminders to members with outstanding debts."""
-    # Find members with active loans
-    active_loans = Loan.query.filter_by(status='Active').all()
-    
-    for loan in active_loans:
-        if loan.member and loan.due_date:
-            days_until_due = (loan.due_date - datetime.now().date()).days
-            
-            if days_until_due <= 7 and days_until_due >= 0:  # Remind 7 days before due
-                message = f"Dear {loan.member.full_name}, your loan of {format_currency(loan.remaining_amount)} is due in {days_until_due} days. Please arrange for repayment. - Pamoja Agencies SHG"
-                send_whatsapp_reminder(loan.member.phone, message)
-    
-    # Find members with unpaid fines
-    unpaid_fines = Fine.query.filter_by(is_paid=False).all()
-    
-    for fine in unpaid_fines:
-        if fine.member:
-            days_overdue = (datetime.now().date() - fine.date_issued.date()).days
-            
-            if days_overdue > 0:  # Send reminder for overdue fines
-                message = f"Dear {fine.member.full_name}, you have an unpaid fine of {format_currency(fine.amount)} for {fine.fine_type}. Please settle this amount. - Pamoja Agencies SHG"
-                send_whatsapp_reminder(fine.member.phone, message)
+# Loan installments are reminded this many days ahead of (and on) their due date
+REMINDER_WINDOW_DAYS = 7
+
+class ReminderGateway:
+    """Delivers one reminder message; send() returns True when the message was accepted."""
+
+    def send(self, phone_number, message):
+        raise NotImplementedError
+
+class LogGateway(ReminderGateway):
+    """Logs reminders instead of sending them (the default until a WhatsApp API is configured)."""
+
+    def send(self, phone_number, message):
+        print(f"WhatsApp Reminder to {phone_number}: {message}")
+        return True
+
+class StubGateway(ReminderGateway):
+    """Records reminders in memory, optionally taking `latency` seconds per send, for tests and dry runs."""
+
+    def __init__(self, latency=0, fail_numbers=()):
+        self.latency = latency
+        self.fail_numbers = set(fail_numbers)
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, phone_number, message):
+        if self.latency:
+            time.sleep(self.latency)
+        if phone_number in self.fail_numbers:
+            return False
+        with self._lock:
+            self.sent.append((phone_number, message))
+        return True
+
+class HttpGateway(ReminderGateway):
+    """Posts reminders as JSON to a WhatsApp Business API endpoint."""
+
+    def __init__(self, url, token=None, timeout=10):
+        import requests
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def send(self, phone_number, message):
+        response = self.session.post(self.url, timeout=self.timeout, json={
+            'messaging_product': 'whatsapp', 'to': phone_number,
+            'type': 'text', 'text': {'body': message}})
+        return response.ok
+
+GATEWAYS = {'log': LogGateway, 'stub': StubGateway}
+
+def get_gateway():
+    """The gateway named by REMINDER_GATEWAY ('log', 'stub' or 'http')."""
+    name = app.config.get('REMINDER_GATEWAY', 'log')
+    if name == 'http':
+        return HttpGateway(app.config['WHATSAPP_API_URL'], app.config.get('WHATSAPP_API_TOKEN'))
+    return GATEWAYS[name]()
+
+class RateLimiter:
+    """Spaces calls evenly so no more than `per_second` start in any second, across threads."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def collect_reminders(now=None):
+    """Yield (member_id, full_name, phone, debts) per member, from one query over loans and fines.
+
+    Each debt is a (kind, amount, detail, due_date) row: kind is 'loan' for the unpaid part of
+    installments due within the reminder window and 'fine' for fines left unpaid since before today.
+    """
+    now = now or datetime.now()
+    today = datetime(now.year, now.month, now.day)
+    due_loans = (db.select(LoanInstallment.member_id.label('member_id'), db.literal('loan').label('kind'),
+                           (LoanInstallment.principal + LoanInstallment.interest - LoanInstallment.amount_paid).label('amount'),
+                           db.null().label('detail'), LoanInstallment.due_date.label('due_date'))
+                 .join(Loan, Loan.id == LoanInstallment.loan_id)
+                 .where(LoanInstallment.is_settled == False, LoanInstallment.due_date >= today,
+                        LoanInstallment.due_date < today + timedelta(days=REMINDER_WINDOW_DAYS + 1),
+                        Loan.status == 'Active', Loan.is_deleted == False))
+    unpaid_fines = (db.select(Fine.member_id, db.literal('fine'), Fine.amount, Fine.fine_type, db.null())
+                    .where(Fine.is_paid == False, Fine.is_deleted == False, Fine.date_issued < today))
+    debts = db.union_all(due_loans, unpaid_fines).subquery()
+    rows = db.session.execute(
+        db.select(User.id, User.full_name, User.phone, debts.c.kind, debts.c.amount, debts.c.detail, debts.c.due_date)
+        .join(debts, debts.c.member_id == User.id)
+        .where(User.is_active == True)
+        .order_by(User.id, debts.c.kind.desc(), debts.c.due_date))
+    for (member_id, full_name, phone), member_rows in groupby(rows, key=lambda row: row[:3]):
+        yield member_id, full_name, phone, [tuple(row[3:]) for row in member_rows]
+
+def build_message(full_name, debts, now=None):
+    """One reminder covering all of a member's due loans and unpaid fines."""
+    today = (now or datetime.now()).date()
+    lines = []
+    for kind, amount, detail, due_date in debts:
+        if kind == 'loan':
+            days = (due_date.date() - today).days
+            when = 'today' if days == 0 else f"in {days} day{'s' if days != 1 else ''}"
+            lines.append(f"- loan installment of {format_currency(amount)} due {when} ({due_date.strftime('%d/%m/%Y')})")
+        else:
+            lines.append(f"- unpaid {detail} fine of {format_currency(amount)}")
+    return (f"Dear {full_name}, this is a reminder of your outstanding balances:\n" + "\n".join(lines) +
+            "\nPlease arrange for payment. - Pamoja Agencies SHG")
+
+def send_whatsapp_reminder(phone_number, message, gateway=None):
+    """Send one WhatsApp reminder through the configured gateway."""
+    return (gateway or get_gateway()).send(phone_number, message)
+
+def send_debt_reminders(gateway=None, max_workers=None, rate_per_second=None, now=None):
+    """Send one reminder per member with due loans or unpaid fines and return a summary.
+
+    Messages are built up front from a single query, then sent by up to max_workers threads
+    with no more than rate_per_second sends started each second.
+    """
+    gateway = gateway or get_gateway()
+    max_workers = max_workers or app.config.get('REMINDER_MAX_WORKERS', 16)
+    if rate_per_second is None:
+        rate_per_second = app.config.get('REMINDER_RATE_PER_SECOND', 50)
+    limiter = RateLimiter(rate_per_second)
+
+    def deliver(phone, message):
+        limiter.wait()
+        try:
+            return gateway.send(phone, message)
+        except Exception as e:
+            logging.error(f"Failed to send reminder to {phone}: {str(e)}")
+            return False
+
+    messages = [(phone, build_message(full_name, debts, now))
+                for _, full_name, phone, debts in collect_reminders(now)]
+    # End the read transaction before the slow part; the sends need no database access
+    db.session.commit()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reminder') as executor:
+        results = list(executor.map(lambda item: deliver(*item), messages))
+    sent = sum(1 for result in results if result)
+    return {'members': len(messages), 'sent': sent, 'failed': len(messages) - sent,
+            'seconds': round(time.monotonic() - started, 2)}
 
 def schedule_daily_reminders():
     """This would be called by a cron job or scheduler."""
-    send_debt_reminders()
+    return send_debt_reminders()